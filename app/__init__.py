@@ -8,7 +8,11 @@ This file:
  - Falls back to SQLite for local dev if DATABASE_URL is not set
  - Applies robust SQLAlchemy engine options (pool_pre_ping, pool_size, etc.)
  - Registers an OperationalError handler to return 503 JSON (avoids leaking tracebacks)
+ - Routes storefront reads to DATABASE_REPLICA_URLS when set (app/db_routing.py)
+ - Instruments queries and pool checkouts: Server-Timing, /metrics (app/db_metrics.py)
  - Initializes extensions and registers blueprints in a fault-tolerant way
+ - Keeps startup cheap: Flask-Migrate/alembic only for CLI runs, heavy client libraries
+   (requests, boto3) imported on first use; scripts/bench_startup.py measures it
 """
 import os
 import logging
@@ -17,11 +21,13 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_mail import Mail
 from flask_cors import CORS
-from flask_migrate import Migrate
 
-db = SQLAlchemy()
+from .db_metrics import init_db_metrics, instrument_engine_options
+from .db_routing import RoutingSession, init_replicas, watch_replica_engines
+
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 mail = Mail()
-migrate = Migrate()
+migrate = None  # flask_migrate.Migrate, set up by init_migrate()
 
 
 def _normalize_database_url(url: str) -> str:
@@ -49,35 +55,36 @@ def _ensure_postgres_sslmode(url: str, sslmode_value: str = "require") -> str:
     return u
 
 
-def _expose_unprefixed_endpoints(app: Flask, blueprint_name: str) -> None:
-    created = []
-    try:
-        for rule in list(app.url_map.iter_rules()):
-            ep = rule.endpoint
-            if not ep.startswith(blueprint_name + "."):
-                continue
-            unprefixed = ep.split(".", 1)[1]
-            if unprefixed in app.view_functions:
-                continue
-            view_func = app.view_functions.get(ep)
-            if view_func is None:
-                continue
-            methods = sorted(
-                m for m in rule.methods if m not in ("HEAD", "OPTIONS"))
-            try:
-                app.add_url_rule(rule.rule, endpoint=unprefixed,
-                                 view_func=view_func, methods=methods)
-                created.append((rule.rule, ep, unprefixed))
-            except Exception as exc:
-                app.logger.debug(
-                    f"Could not create alias for {ep} -> {unprefixed}: {exc}")
-    except Exception as e:
-        app.logger.debug(f"Error while exposing unprefixed endpoints: {e}")
+def _legacy_endpoint_alias(app: Flask, blueprint_name: str):
+    """
+    url_for() fallback for the legacy unprefixed endpoint names ('index' -> 'main.index').
+    Resolved per call with a dict lookup instead of duplicating every rule of the
+    blueprint in the URL map at startup.
+    """
+    prefix = blueprint_name + "."
 
-    if created:
-        for path, src, alias in created:
-            app.logger.debug(
-                f"Created endpoint alias: {src} -> {alias} (path: {path})")
+    def handler(error, endpoint, values):
+        if "." in endpoint or (prefix + endpoint) not in app.view_functions:
+            return None
+        from flask import url_for
+        return url_for(prefix + endpoint, **values)
+
+    return handler
+
+
+def init_migrate(app: Flask) -> None:
+    """
+    Register Flask-Migrate (`flask db ...`). It imports alembic, a large part of the app's
+    import time, so create_app only does this for CLI runs (or MIGRATE_ENABLED=1);
+    scripts that call flask_migrate directly can call this themselves.
+    """
+    global migrate
+    if "migrate" in app.extensions:
+        return
+    from flask_migrate import Migrate
+    if migrate is None:
+        migrate = Migrate()
+    migrate.init_app(app, db)
 
 
 def create_app(test_config=None) -> Flask:
@@ -145,6 +152,11 @@ def create_app(test_config=None) -> Flask:
     if engine_opts:
         app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_opts
 
+    # Read replicas (optional): extra binds with the same engine options
+    init_replicas(app, engine_opts)
+    # pool checkout timing for the primary and every bind
+    instrument_engine_options(app)
+
     # Mail defaults
     if "MAIL_USERNAME" in os.environ:
         app.config["MAIL_USERNAME"] = os.environ.get("MAIL_USERNAME")
@@ -157,9 +169,27 @@ def create_app(test_config=None) -> Flask:
 
     # Initialize extensions
     db.init_app(app)
+    watch_replica_engines(app)
+    init_db_metrics(app)
     mail.init_app(app)
     CORS(app, supports_credentials=True)
-    migrate.init_app(app, db)
+    # FLASK_RUN_FROM_CLI is set by the `flask` command before it builds the app
+    if os.environ.get("FLASK_RUN_FROM_CLI") == "true" or os.environ.get("MIGRATE_ENABLED") == "1":
+        init_migrate(app)
+
+    # content-hashed static URLs (url_for('static'), asset_url(), to_static_url())
+    try:
+        from .assets import init_assets
+        init_assets(app)
+    except Exception as e:
+        app.logger.debug(f"Failed to load asset manifest: {e}")
+
+    # gzip/brotli for dynamic responses, precompressed + fingerprinted static files
+    try:
+        from .compression import init_compression
+        init_compression(app)
+    except Exception as e:
+        app.logger.debug(f"Failed to enable response compression: {e}")
 
     # Register a graceful handler for DB OperationalError so requests return 503 instead of a traceback
     try:
@@ -195,11 +225,8 @@ def create_app(test_config=None) -> Flask:
         from .routes import bp as main_bp
         app.register_blueprint(main_bp)
         if os.environ.get("EXPOSE_LEGACY_ENDPOINTS", "1") != "0":
-            try:
-                _expose_unprefixed_endpoints(app, blueprint_name=main_bp.name)
-            except Exception as e:
-                app.logger.debug(
-                    f"Failed to create unprefixed endpoint aliases: {e}")
+            app.url_build_error_handlers.append(
+                _legacy_endpoint_alias(app, blueprint_name=main_bp.name))
     except Exception as e:
         app.logger.debug(f"Failed to register routes blueprint: {e}")
 
@@ -209,6 +236,11 @@ def create_app(test_config=None) -> Flask:
         app.register_blueprint(settings_bp)
     except Exception as e:
         app.logger.debug(f"Failed to register settings blueprint: {e}")
+    try:
+        from .routes_checkout import checkout_bp
+        app.register_blueprint(checkout_bp)
+    except Exception as e:
+        app.logger.debug(f"Failed to register checkout blueprint: {e}")
     try:
         from .routes_top_picks_stub import top_picks_bp
         app.register_blueprint(top_picks_bp)
@@ -243,6 +275,22 @@ def create_app(test_config=None) -> Flask:
             "Registered PayPal payments blueprint with prefix /paypal")
     except Exception as e:
         app.logger.debug(f"Failed to register PayPal blueprint: {e}")
+    try:
+        from .paypal_webhooks import init_webhook_worker, register_webhook_cli
+        register_webhook_cli(app)
+        init_webhook_worker(app)
+    except Exception as e:
+        app.logger.debug(f"Failed to register PayPal webhook CLI/worker: {e}")
+    try:
+        from .image_pipeline import register_image_cli
+        register_image_cli(app)
+    except Exception as e:
+        app.logger.debug(f"Failed to register image derivative CLI: {e}")
+    try:
+        from .story_render import register_story_cli
+        register_story_cli(app)
+    except Exception as e:
+        app.logger.debug(f"Failed to register story render CLI: {e}")
 
     # register payments-admin blueprint
     try:
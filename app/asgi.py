@@ -0,0 +1,306 @@
+"""
+app/asgi.py
+
+ASGI serving mode for the Flask app (entry point: asgi.py at the repo root).
+
+    uvicorn asgi:app --host 0.0.0.0 --port 8000 --workers 4
+
+Flask stays the framework; AsgiApp decides per request how to run it:
+
+- `async def` views (/api/price-compare, the /paypal blueprint) run as coroutines on the
+  server's event loop. While they wait on a competitor site or on PayPal they hold a
+  socket, not a thread, so slow upstreams no longer use up the worker's request capacity.
+  Their blocking parts (before/after-request hooks, error handlers, database work through
+  async_http.run_sync) hop to the thread pool.
+- Every other view runs the usual full_dispatch_request() in the thread pool.
+
+ASGI_THREADS (default 32) sizes that pool per worker; it is also the loop's default
+executor, so run_sync() shares it. The lifespan events open and close the worker's shared
+httpx client. Response bodies are streamed.
+
+Request bodies are streamed too: wsgi.input pulls from receive() as Flask reads it, so
+Werkzeug's max_content_length (e.g. the upload cap in app/uploads.py) stops the read the
+same way it does under a WSGI server. Async views get the body read up front (spooled to
+disk above 1 MiB) because they read it on the loop. Either way ASGI_MAX_BODY_BYTES (default
+16 MiB) caps a request body: a larger Content-Length, or more bytes than that received,
+is answered with 413.
+"""
+from __future__ import annotations
+import asyncio
+import contextvars
+import functools
+import inspect
+import io
+import os
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+from flask import request_started
+from werkzeug.exceptions import ClientDisconnected, RequestEntityTooLarge
+
+from .async_http import _call_and_release, close_shared_client, open_shared_client
+
+THREADS = int(os.environ.get("ASGI_THREADS", "32"))
+MAX_BODY_BYTES = int(os.environ.get("ASGI_MAX_BODY_BYTES", str(16 * 1024 * 1024)))
+# bodies read up front (async views) larger than this are spooled to a temporary file
+_SPOOL_BYTES = 1024 * 1024
+# response chunks are coalesced up to this size before each send to the loop
+_SEND_BYTES = 64 * 1024
+
+
+def _environ(scope: Dict[str, Any], body) -> Dict[str, Any]:
+    """WSGI environ for an ASGI http scope (PEP 3333 strings: latin-1 decoded bytes)."""
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    script_name = scope.get("root_path", "")
+    path_info = scope["path"]
+    if script_name and path_info.startswith(script_name):
+        path_info = path_info[len(script_name):]
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": script_name.encode("utf-8").decode("latin-1"),
+        "PATH_INFO": path_info.encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": str(server[0]),
+        "SERVER_PORT": str(server[1] or 80),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "REMOTE_PORT": str(client[1]),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": body,
+        "wsgi.input_terminated": True,
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for raw_name, raw_value in scope.get("headers", ()):
+        name = raw_name.decode("latin-1").lower()
+        value = raw_value.decode("latin-1")
+        if name == "content-length":
+            key = "CONTENT_LENGTH"
+        elif name == "content-type":
+            key = "CONTENT_TYPE"
+        else:
+            key = "HTTP_" + name.upper().replace("-", "_")
+        if key in environ:
+            environ[key] += ("; " if key == "HTTP_COOKIE" else ",") + value
+        else:
+            environ[key] = value
+    return environ
+
+
+class _RequestBody(io.RawIOBase):
+    """
+    wsgi.input of one request. Threads read it straight from receive(); preload() reads
+    the rest up front for views that run on the loop (a read there would wait on itself).
+    """
+
+    def __init__(self, receive, loop, limit: int):
+        self._receive = receive
+        self._loop = loop
+        self._limit = limit
+        self._received = 0
+        self._more = True
+        self._pending = b""
+        self._spool: Optional[tempfile.SpooledTemporaryFile] = None
+
+    def readable(self) -> bool:
+        return True
+
+    async def _next(self) -> bytes:
+        message = await self._receive()
+        if message["type"] == "http.disconnect":
+            self._more = False
+            raise ClientDisconnected()
+        chunk = message.get("body", b"")
+        self._received += len(chunk)
+        if self._received > self._limit:
+            self._more = False
+            raise RequestEntityTooLarge()
+        self._more = message.get("more_body", False)
+        return chunk
+
+    async def preload(self) -> None:
+        self._spool = tempfile.SpooledTemporaryFile(max_size=_SPOOL_BYTES)
+        self._spool.write(self._pending)
+        self._pending = b""
+        while self._more:
+            self._spool.write(await self._next())
+        self._spool.seek(0)
+
+    def readinto(self, buffer) -> int:
+        if self._spool is not None:
+            data = self._spool.read(len(buffer))
+        else:
+            while not self._pending and self._more:
+                self._pending = asyncio.run_coroutine_threadsafe(self._next(), self._loop).result()
+            data, self._pending = self._pending[:len(buffer)], self._pending[len(buffer):]
+        buffer[:len(data)] = data
+        return len(data)
+
+    def close(self) -> None:
+        if self._spool is not None:
+            self._spool.close()
+        super().close()
+
+
+def _declared_length(scope: Dict[str, Any]) -> Optional[int]:
+    for name, value in scope.get("headers", ()):
+        if name.lower() == b"content-length":
+            try:
+                return int(value)
+            except ValueError:
+                return None
+    return None
+
+
+class AsgiApp:
+    def __init__(self, flask_app, threads: Optional[int] = None):
+        self.flask_app = flask_app
+        self.threads = threads or THREADS
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "http":
+            await self._http(scope, receive, send)
+        elif scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "websocket":
+            await send({"type": "websocket.close", "code": 1000})
+
+    def _ensure_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="asgi")
+            asyncio.get_running_loop().set_default_executor(self._executor)
+        return self._executor
+
+    async def _lifespan(self, receive, send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                self._ensure_executor()
+                await open_shared_client()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await close_shared_client()
+                if self._executor is not None:
+                    self._executor.shutdown(wait=False)
+                    self._executor = None
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _http(self, scope, receive, send) -> None:
+        declared = _declared_length(scope)
+        if declared is not None and declared > MAX_BODY_BYTES:
+            await send({"type": "http.response.start", "status": 413,
+                        "headers": [(b"content-type", b"text/plain; charset=utf-8"), (b"connection", b"close")]})
+            await send({"type": "http.response.body", "body": b"Request body too large"})
+            return
+        executor = self._ensure_executor()
+        loop = asyncio.get_running_loop()
+        app = self.flask_app
+        raw_body = _RequestBody(receive, loop, MAX_BODY_BYTES)
+        body = io.BufferedReader(raw_body)
+        environ = _environ(scope, body)
+        # Flask's request/app context lives in context variables. Every step of this request
+        # (threaded or on the loop) runs inside this one Context, so ctx.pop() can reset
+        # what ctx.push() set.
+        cvctx = contextvars.copy_context()
+
+        def in_thread(fn: Callable, *args):
+            return loop.run_in_executor(executor, functools.partial(cvctx.run, fn, *args))
+
+        ctx = app.request_context(environ)
+        try:
+            await in_thread(ctx.push)
+            view = self._async_view(ctx.request)
+            if view is None:
+                await in_thread(self._finish, ctx, environ, send, loop, True, None, None)
+                return
+            rv = exc = None
+            try:
+                await raw_body.preload()
+                # every threaded step releases its DB connection before the view awaits
+                rv = await in_thread(_call_and_release, self._preprocess)
+                if rv is None:
+                    rv = await asyncio.create_task(view(**ctx.request.view_args), context=cvctx)
+            except Exception as e:
+                exc = e
+            await in_thread(self._finish, ctx, environ, send, loop, False, rv, exc)
+        finally:
+            body.close()
+
+    def _async_view(self, req) -> Optional[Callable]:
+        """The endpoint's view function if it is a coroutine function, else None."""
+        rule = req.url_rule
+        if rule is None or req.routing_exception is not None:
+            return None
+        if getattr(rule, "provide_automatic_options", False) and req.method == "OPTIONS":
+            return None
+        view = self.flask_app.view_functions.get(rule.endpoint)
+        return view if inspect.iscoroutinefunction(view) else None
+
+    def _preprocess(self):
+        request_started.send(self.flask_app, _async_wrapper=self.flask_app.ensure_sync)
+        return self.flask_app.preprocess_request()
+
+    def _finish(self, ctx, environ, send, loop, dispatch: bool, rv: Any, exc: Optional[Exception]) -> None:
+        """
+        Thread: the rest of Flask's wsgi_app() for this request, in one go. dispatch=True
+        runs a sync view; otherwise rv/exc is the outcome of the awaited async view. The
+        context is popped (db.session removed) before the thread is given back, so a request
+        never holds a pooled connection while it waits for a thread.
+        """
+        app = self.flask_app
+        error = None
+        try:
+            try:
+                if dispatch:
+                    response = app.full_dispatch_request()
+                else:
+                    if exc is not None:
+                        rv = app.handle_user_exception(exc)
+                    response = app.finalize_request(rv)
+            except Exception as e:
+                error = e
+                response = app.handle_exception(e)
+            self._write(response, environ, send, loop)
+        finally:
+            if error is not None and app.should_ignore_error(error):
+                error = None
+            ctx.pop(error)
+
+    @staticmethod
+    def _write(response, environ, send, loop) -> None:
+        """Run the WSGI response in this thread, handing the bytes to the loop's send()."""
+        head: Dict[str, Any] = {}
+
+        def start_response(status, headers, exc_info=None):
+            head["status"] = int(status.split(" ", 1)[0])
+            head["headers"] = [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers]
+
+        def push(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        iterable = response(environ, start_response)
+        try:
+            push({"type": "http.response.start", "status": head["status"], "headers": head["headers"]})
+            buffered = []
+            size = 0
+            for chunk in iterable:
+                if not chunk:
+                    continue
+                buffered.append(chunk)
+                size += len(chunk)
+                if size >= _SEND_BYTES:
+                    push({"type": "http.response.body", "body": b"".join(buffered), "more_body": True})
+                    buffered, size = [], 0
+            push({"type": "http.response.body", "body": b"".join(buffered), "more_body": False})
+        finally:
+            close = getattr(iterable, "close", None)
+            if close is not None:
+                close()
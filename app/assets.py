@@ -0,0 +1,106 @@
+"""
+app/assets.py
+
+Content-hashed URLs for files under app/static.
+
+scripts/build_static.py writes static/asset-manifest.json at deploy time
+({"js/main.js": "js/main.3f9a1c0b2e.js", ...}). init_assets(app) loads it once at startup and
+
+- makes url_for('static', filename=...) emit the hashed name (a url_defaults hook), so
+  templates need no changes;
+- registers the Jinja global asset_url('css/main.css');
+- backs to_static_url(), which turns image paths stored in the DB into browser URLs.
+
+The static view in app/compression.py maps hashed names back to the files and serves them
+with a one-year immutable Cache-Control; a deploy that changes a file changes its URL.
+Without a manifest (dev checkouts), in debug mode, or with ASSET_MANIFEST_ENABLED=0 every
+helper returns the plain /static/ path.
+"""
+from __future__ import annotations
+import json
+import os
+import logging
+from typing import Dict, Optional
+
+from .image_pipeline import derivative_url
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "asset-manifest.json"
+STATIC_URL = "/static"
+PLACEHOLDER_IMAGE = "images/placeholder.jpg"
+
+
+class AssetManifest:
+    def __init__(self):
+        self.hashed: Dict[str, str] = {}
+        self.originals: Dict[str, str] = {}
+
+    def load(self, static_folder: str) -> bool:
+        path = os.path.join(static_folder, MANIFEST_NAME)
+        try:
+            with open(path, "r", encoding="utf-8") as fh:
+                hashed = json.load(fh)
+        except FileNotFoundError:
+            return False
+        except Exception:
+            logger.exception("Failed to read asset manifest %s", path)
+            return False
+        self.hashed = dict(hashed)
+        self.originals = {v: k for k, v in self.hashed.items()}
+        return True
+
+    def clear(self) -> None:
+        self.hashed, self.originals = {}, {}
+
+    def hashed_name(self, filename: str) -> str:
+        return self.hashed.get(filename, filename)
+
+    def original_name(self, filename: str) -> Optional[str]:
+        return self.originals.get(filename)
+
+
+manifest = AssetManifest()
+
+
+def asset_url(path: str) -> str:
+    """'css/main.css' -> '/static/css/main.<hash>.css' (plain path when not in the manifest)."""
+    return f"{STATIC_URL}/{manifest.hashed_name(path.lstrip('/'))}"
+
+
+def to_static_url(path, width=None, fmt="jpeg"):
+    """
+    Convert a stored image path like 'images/creed/aventus.jpg'
+    into a browser URL '/static/images/creed/aventus.<hash>.jpg'.
+    Absolute URLs are returned as-is; '/static/...' paths are hashed too.
+    With width, return the closest built derivative (see app/image_pipeline.py)
+    such as '/static/derived/images/creed/aventus-320w.jpg', else the original.
+    """
+    if not path:
+        return asset_url(PLACEHOLDER_IMAGE)
+    if width:
+        derived = derivative_url(path, width, fmt)
+        if derived:
+            return derived
+    if isinstance(path, str) and (path.startswith("http://") or path.startswith("https://")):
+        return path
+    if isinstance(path, str) and path.startswith("/"):
+        if path.startswith(STATIC_URL + "/"):
+            return asset_url(path[len(STATIC_URL) + 1:])
+        return path
+    return asset_url(path)
+
+
+def init_assets(app) -> None:
+    enabled = os.environ.get("ASSET_MANIFEST_ENABLED", "1").lower() not in ("0", "false", "no")
+    if enabled and not app.debug and app.static_folder and manifest.load(app.static_folder):
+        app.logger.info("Loaded asset manifest (%d files)", len(manifest.hashed))
+    else:
+        manifest.clear()
+
+    @app.url_defaults
+    def _hashed_static_filename(endpoint, values):
+        if endpoint == "static" and manifest.hashed and "filename" in values:
+            values["filename"] = manifest.hashed_name(values["filename"])
+
+    app.jinja_env.globals["asset_url"] = asset_url
@@ -0,0 +1,109 @@
+"""
+app/async_http.py
+
+Helpers for `async def` views (price comparison, PayPal) and the ASGI entry point.
+
+    await run_sync(fn, *args)          blocking work (SQLAlchemy, file I/O) in a thread,
+                                       with the current request context and a db.session
+                                       of its own, closed when fn returns
+    async with http_client() as c:     httpx.AsyncClient for outbound calls
+
+Under ASGI (asgi.py) the server loop owns one pooled client for the life of the worker
+(open_shared_client / close_shared_client from the lifespan events), so keep-alive
+connections are reused across requests. Under Gunicorn/WSGI Flask runs each async view in
+a throwaway event loop, and http_client() gives that request a client of its own.
+
+Tuning (environment): ASYNC_HTTP_MAX_CONNECTIONS (100), ASYNC_HTTP_MAX_KEEPALIVE (20).
+"""
+from __future__ import annotations
+import asyncio
+import functools
+import os
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, Any, AsyncIterator, Callable, Dict, TypeVar
+
+from flask import current_app, g, has_app_context
+
+if TYPE_CHECKING:
+    import httpx
+
+T = TypeVar("T")
+
+MAX_CONNECTIONS = int(os.environ.get("ASYNC_HTTP_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE = int(os.environ.get("ASYNC_HTTP_MAX_KEEPALIVE", "20"))
+
+# one shared client per event loop that asked for it (in practice: the ASGI server loop)
+_shared: Dict[asyncio.AbstractEventLoop, "httpx.AsyncClient"] = {}
+
+
+def _call_and_release(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Run fn on the caller's session, then hand its connection back if fn used it."""
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        if has_app_context():
+            from . import db
+            if db.session.registry.has():
+                # ends the transaction and returns the connection; loaded objects stay
+                # attached (expired, reloaded on next access); uncommitted work is discarded
+                db.session.rollback()
+
+
+def _call_in_app_context(app, parent_g, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    # Flask-SQLAlchemy scopes db.session by app context: a context of our own gives fn a
+    # session of its own (removed with the context, if fn created one), so concurrent
+    # run_sync calls never share the caller's session
+    ctx = app.app_context()
+    ctx.g = parent_g  # same request-scoped g (current user, per-request DB stats)
+    with ctx:
+        return fn(*args, **kwargs)
+
+
+async def run_sync(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    Run blocking code off the event loop. Context variables (Flask's request context, so
+    request and g) are copied into the thread, and fn gets an app context, and so a
+    db.session, of its own: the caller's session and the objects it has loaded are left
+    alone, and calls may run concurrently.
+
+    That session is closed when fn returns, so a coroutine never holds a database
+    connection while it awaits an upstream: commit inside fn, and return plain values or
+    objects whose attributes are already loaded.
+    """
+    if has_app_context():
+        fn = functools.partial(_call_in_app_context, current_app._get_current_object(),
+                               g._get_current_object(), fn)
+    return await asyncio.to_thread(functools.partial(fn, *args, **kwargs))
+
+
+def _new_client() -> "httpx.AsyncClient":
+    import httpx  # deferred: keeps the HTTP stack out of worker startup
+
+    limits = httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_KEEPALIVE)
+    return httpx.AsyncClient(limits=limits, follow_redirects=True)
+
+
+async def open_shared_client() -> None:
+    loop = asyncio.get_running_loop()
+    if loop not in _shared:
+        _shared[loop] = _new_client()
+
+
+async def close_shared_client() -> None:
+    client = _shared.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+@asynccontextmanager
+async def http_client() -> AsyncIterator["httpx.AsyncClient"]:
+    """The loop's shared client if there is one, else a client closed on exit."""
+    shared = _shared.get(asyncio.get_running_loop())
+    if shared is not None:
+        yield shared
+        return
+    client = _new_client()
+    try:
+        yield client
+    finally:
+        await client.aclose()
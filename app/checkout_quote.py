@@ -0,0 +1,357 @@
+"""
+app/checkout_quote.py
+
+Server-side checkout pricing, computed once per cart and signed so later steps can trust it.
+
+    quote = build_quote(cart_lines, coupon_code="WELCOME10", currency="USD")
+    token = sign_quote(quote)          # returned to the browser as quote_token
+    ...
+    charge = load_quote(token)         # in create_paypal_order: no recomputation, no queries
+    ...
+    charge_reference(charge)           # PayPal custom_id; capture checks the amount against it
+
+Prices are the catalogue prices (GBP) looked up by product id; the client's own price is
+never trusted. The automatic checkout discount and the coupon percentage are added and
+capped at 95% (same rule as checkout.js), delivery is DELIVERY_FEE_USD, and the charge
+block is converted into the payment currency with unit prices rounded first so the PayPal
+breakdown (item_total - discount + shipping = total) always adds up.
+
+Coupons and the GBP->USD rate are held in a small in-process TTL cache
+(CHECKOUT_CACHE_TTL_SECONDS, default 60; FX: CHECKOUT_FX_TTL_SECONDS, default 3600). A
+failed reload serves the old value and is retried after CHECKOUT_CACHE_RETRY_SECONDS
+(default 5). The checkout_discount setting comes from settings_cache. Only coupons valid
+today are cached, as a code -> coupon map that is also rebuilt when the date changes, so
+validation is a dict lookup. Coupon writes call invalidate_quote_cache() so this worker
+sees them immediately; other workers catch up within the TTL. Quote tokens are signed with
+SECRET_KEY and expire after CHECKOUT_QUOTE_TTL_SECONDS (default 900).
+"""
+from __future__ import annotations
+import os
+import threading
+import time
+import logging
+from datetime import date
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from flask import current_app
+from itsdangerous import BadSignature, SignatureExpired, Signer, URLSafeTimedSerializer
+from sqlalchemy import or_
+
+from .models import Coupon, Product
+from .settings_cache import settings_cache
+
+logger = logging.getLogger(__name__)
+
+BASE_CURRENCY = "GBP"
+DELIVERY_FEE_USD = Decimal("3.00")
+MAX_DISCOUNT_PERCENT = Decimal("95")
+FALLBACK_GBP_USD = Decimal("1.25")
+FX_URL = os.environ.get("CHECKOUT_FX_URL", "https://api.exchangerate.host/latest?base=GBP&symbols=USD")
+CACHE_TTL = float(os.environ.get("CHECKOUT_CACHE_TTL_SECONDS", "60"))
+FX_TTL = float(os.environ.get("CHECKOUT_FX_TTL_SECONDS", "3600"))
+QUOTE_TTL = int(os.environ.get("CHECKOUT_QUOTE_TTL_SECONDS", "900"))
+# after a failed reload the stale value is served this long before the next attempt
+RELOAD_RETRY_SECONDS = float(os.environ.get("CHECKOUT_CACHE_RETRY_SECONDS", "5"))
+MAX_LINES = 100
+MAX_QUANTITY = 99
+
+_CENT = Decimal("0.01")
+
+
+class QuoteError(ValueError):
+    """The cart cannot be priced (unknown product, bad quantity, ...)."""
+
+    def __init__(self, error: str, detail: str):
+        super().__init__(detail)
+        self.error = error
+        self.detail = detail
+
+
+def _money(value: Decimal) -> Decimal:
+    return value.quantize(_CENT, rounding=ROUND_HALF_UP)
+
+
+# ---------- in-process cache ----------
+class _TTLCache:
+    """Per-key TTL cache; one loader runs per key at a time, stale values cover loader failures."""
+
+    def __init__(self):
+        self._data: Dict[str, Tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+        self._key_locks: Dict[str, threading.Lock] = {}
+
+    def get(self, key: str, loader: Callable[[], Any], ttl: float) -> Any:
+        hit = self._data.get(key)
+        if hit is not None and hit[0] > time.monotonic():
+            return hit[1]
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            hit = self._data.get(key)
+            if hit is not None and hit[0] > time.monotonic():
+                return hit[1]
+            try:
+                value = loader()
+            except Exception:
+                if hit is None:
+                    raise
+                logger.warning("checkout cache: reload of %s failed; serving stale value", key, exc_info=True)
+                # retry soon instead of pinning the stale value for a whole TTL
+                self._data[key] = (time.monotonic() + min(RELOAD_RETRY_SECONDS, ttl), hit[1])
+                return hit[1]
+            self._data[key] = (time.monotonic() + ttl, value)
+            return value
+
+    def invalidate(self, *keys: str) -> None:
+        with self._lock:
+            for key in keys or list(self._data):
+                self._data.pop(key, None)
+
+
+_cache = _TTLCache()
+
+
+def invalidate_quote_cache(*keys: str) -> None:
+    """Drop cached 'coupons' / 'fx' entries (all when no key is given)."""
+    _cache.invalidate(*keys)
+
+
+def coupon_to_dict(c: Coupon) -> Dict[str, Any]:
+    return {
+        "code": c.code,
+        "description": c.description or "",
+        "discount_type": c.discount_type,
+        "discount_value": c.discount_value,
+        "start_date": c.start_date.isoformat() if c.start_date else None,
+        "end_date": c.end_date.isoformat() if c.end_date else None,
+        "active": bool(c.active),
+    }
+
+
+def _load_active_coupons() -> Tuple[date, Dict[str, Dict[str, Any]]]:
+    # one range scan on ix_coupon_active_dates; expired and future coupons never enter the map
+    today = date.today()
+    rows = Coupon.query.filter(
+        Coupon.active.is_(True),
+        or_(Coupon.start_date.is_(None), Coupon.start_date <= today),
+        or_(Coupon.end_date.is_(None), Coupon.end_date >= today),
+    ).all()
+    return today, {c.code.lower(): coupon_to_dict(c) for c in rows if c.code}
+
+
+def _load_fx_rate() -> Decimal:
+    import requests  # only the FX refresh needs it; keeps it out of app startup
+
+    r = requests.get(FX_URL, timeout=3)
+    r.raise_for_status()
+    rate = Decimal(str(((r.json() or {}).get("rates") or {}).get("USD") or 0))
+    if rate <= 0:
+        raise RuntimeError("FX response had no USD rate")
+    return rate
+
+
+def active_coupons() -> Dict[str, Dict[str, Any]]:
+    """Coupons usable today, keyed by lower-cased code."""
+    day, by_code = _cache.get("coupons", _load_active_coupons, CACHE_TTL)
+    if day != date.today():
+        # day rollover: coupons start and expire at midnight
+        _cache.invalidate("coupons")
+        day, by_code = _cache.get("coupons", _load_active_coupons, CACHE_TTL)
+    return by_code
+
+
+def checkout_discount_percent() -> Decimal:
+    return Decimal(str(settings_cache.get_float("checkout_discount", 0.0)))
+
+
+def gbp_usd_rate() -> Decimal:
+    try:
+        return _cache.get("fx", _load_fx_rate, FX_TTL)
+    except Exception:
+        logger.warning("checkout FX rate unavailable; using fallback %s", FALLBACK_GBP_USD)
+        # remember the fallback briefly so an outage does not add a timeout to every quote
+        return _cache.get("fx", lambda: FALLBACK_GBP_USD, 60)
+
+
+# ---------- pricing ----------
+def coupon_status(code: Optional[str]) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """Return (coupon, None) for a coupon usable in a quote, or (None, reason)."""
+    code = (code or "").strip()
+    if not code:
+        return None, None
+    c = active_coupons().get(code.lower())
+    if c is None:
+        return None, "invalid_or_expired"
+    if c["discount_type"] != "percent":
+        return None, "unsupported_discount_type"
+    return c, None
+
+
+def _normalise_lines(lines: List[Dict[str, Any]]) -> List[Tuple[str, int]]:
+    if not isinstance(lines, list) or not lines:
+        raise QuoteError("invalid_items", "items array required")
+    if len(lines) > MAX_LINES:
+        raise QuoteError("invalid_items", f"at most {MAX_LINES} cart lines")
+    merged: Dict[str, int] = {}
+    for it in lines:
+        if not isinstance(it, dict):
+            raise QuoteError("invalid_items", "each item must be an object")
+        pid = str(it.get("id") or it.get("product_id") or "").strip()
+        if not pid:
+            raise QuoteError("invalid_items", "each item needs a product id")
+        try:
+            qty = int(it.get("quantity") or it.get("qty") or 1)
+        except (TypeError, ValueError):
+            raise QuoteError("invalid_quantity", f"bad quantity for {pid}")
+        if qty < 1 or qty > MAX_QUANTITY:
+            raise QuoteError("invalid_quantity", f"quantity for {pid} must be 1-{MAX_QUANTITY}")
+        merged[pid] = merged.get(pid, 0) + qty
+    return list(merged.items())
+
+
+def build_quote(lines: List[Dict[str, Any]], coupon_code: Optional[str] = None,
+                currency: str = "USD") -> Dict[str, Any]:
+    """Price a cart in one pass. Raises QuoteError for carts that cannot be priced."""
+    currency = (currency or "USD").upper()
+    if currency not in (BASE_CURRENCY, "USD"):
+        raise QuoteError("unsupported_currency", f"cannot quote in {currency}")
+    wanted = _normalise_lines(lines)
+    products = {p.id: p for p in Product.query.filter(Product.id.in_([pid for pid, _ in wanted])).all()}
+    missing = [pid for pid, _ in wanted if pid not in products]
+    if missing:
+        raise QuoteError("unknown_product", "unknown product id(s): " + ", ".join(missing))
+
+    rate = gbp_usd_rate()
+    to_charge = (lambda v: v * rate) if currency == "USD" else (lambda v: v)
+
+    auto_percent = checkout_discount_percent()
+    coupon, coupon_reason = coupon_status(coupon_code)
+    coupon_percent = Decimal(str(coupon["discount_value"] or 0)) if coupon else Decimal("0")
+    percent = min(auto_percent + coupon_percent, MAX_DISCOUNT_PERCENT)
+
+    quote_lines = []
+    subtotal = Decimal("0")
+    item_total = Decimal("0")
+    for pid, qty in wanted:
+        p = products[pid]
+        unit = _money(Decimal(str(p.price or 0)))
+        unit_charge = _money(to_charge(unit))
+        subtotal += unit * qty
+        item_total += unit_charge * qty
+        quote_lines.append({
+            "id": pid,
+            "title": p.title or "",
+            "quantity": qty,
+            "unit_price": f"{unit}",
+            "line_total": f"{_money(unit * qty)}",
+            "unit_price_charge": f"{unit_charge}",
+        })
+
+    subtotal = _money(subtotal)
+    auto_discount = _money(subtotal * auto_percent / 100)
+    discount = _money(subtotal * percent / 100)
+    delivery = _money(DELIVERY_FEE_USD / rate)
+    total = subtotal - discount + delivery
+
+    # charge currency: discount derived from the rounded item_total so PayPal's breakdown adds up
+    charge_discount = _money(item_total * percent / 100)
+    charge_shipping = DELIVERY_FEE_USD if currency == "USD" else delivery
+    charge_total = item_total - charge_discount + charge_shipping
+
+    return {
+        "base_currency": BASE_CURRENCY,
+        "lines": quote_lines,
+        "subtotal": f"{subtotal}",
+        "discount": {
+            "percent": f"{percent}",
+            "auto_percent": f"{auto_percent}",
+            "auto_amount": f"{auto_discount}",
+            "coupon_percent": f"{coupon_percent}",
+            "coupon_amount": f"{discount - auto_discount}",
+            "amount": f"{discount}",
+        },
+        "coupon": {
+            "code": coupon["code"] if coupon else ((coupon_code or "").strip() or None),
+            "applied": coupon is not None,
+            "reason": coupon_reason,
+            "description": coupon["description"] if coupon else None,
+        },
+        "delivery": f"{delivery}",
+        "total": f"{_money(total)}",
+        "fx": {"pair": "GBPUSD", "rate": f"{rate}"},
+        "charge": {
+            "currency": currency,
+            "item_total": f"{_money(item_total)}",
+            "discount": f"{charge_discount}",
+            "shipping": f"{charge_shipping}",
+            "total": f"{_money(charge_total)}",
+        },
+    }
+
+
+# ---------- signed quote tokens ----------
+def _serializer() -> URLSafeTimedSerializer:
+    return URLSafeTimedSerializer(current_app.config["SECRET_KEY"], salt="checkout-quote")
+
+
+def sign_quote(quote: Dict[str, Any]) -> str:
+    """Sign the parts of a quote that create_paypal_order needs."""
+    charge = quote["charge"]
+    return _serializer().dumps({
+        "cur": charge["currency"],
+        "it": charge["item_total"],
+        "d": charge["discount"],
+        "s": charge["shipping"],
+        "t": charge["total"],
+        "cp": quote["coupon"]["code"] if quote["coupon"]["applied"] else None,
+        "l": [[ln["id"], ln["title"][:127], ln["quantity"], ln["unit_price_charge"]] for ln in quote["lines"]],
+    })
+
+
+def load_quote(token: str) -> Dict[str, Any]:
+    """Verify a quote token. Raises QuoteError('quote_expired' / 'invalid_quote')."""
+    try:
+        data = _serializer().loads(token, max_age=QUOTE_TTL)
+    except SignatureExpired:
+        raise QuoteError("quote_expired", "quote has expired; request a new one")
+    except BadSignature:
+        raise QuoteError("invalid_quote", "quote token is not valid")
+    return {
+        "currency": data["cur"],
+        "item_total": data["it"],
+        "discount": data["d"],
+        "shipping": data["s"],
+        "total": data["t"],
+        "coupon_code": data.get("cp"),
+        "lines": [{"id": pid, "title": title, "quantity": qty, "unit_price": unit}
+                  for pid, title, qty, unit in data["l"]],
+    }
+
+
+# ---------- charge reference (PayPal custom_id) ----------
+def _charge_signer() -> Signer:
+    return Signer(current_app.config["SECRET_KEY"], salt="checkout-charge")
+
+
+def charge_reference(quote: Dict[str, Any]) -> str:
+    """
+    Signed "q:<currency>:<total>:<coupon>" for the order's custom_id (PayPal allows 127
+    characters), so capture can check what PayPal is about to charge against the quote.
+    """
+    signer = _charge_signer()
+    value = f"q:{quote['currency']}:{quote['total']}:"
+    room = 127 - len(value) - len(signer.sign(b""))
+    return signer.sign((value + (quote.get("coupon_code") or "")[:max(room, 0)]).encode()).decode()
+
+
+def load_charge_reference(value: Optional[str]) -> Optional[Dict[str, Any]]:
+    """The {currency, total, coupon_code} of a charge_reference(), or None if it is not one."""
+    if not value or not value.startswith("q:"):
+        return None
+    try:
+        raw = _charge_signer().unsign(value.encode()).decode()
+    except BadSignature:
+        return None
+    _, currency, total, coupon = raw.split(":", 3)
+    return {"currency": currency, "total": total, "coupon_code": coupon or None}
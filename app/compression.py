@@ -0,0 +1,143 @@
+"""
+app/compression.py
+
+Response compression and precompressed/fingerprinted static files.
+
+init_compression(app) installs two things:
+
+1. An after_request hook that gzip/brotli-compresses JSON, HTML, CSS, JS and SVG responses of
+   at least COMPRESS_MIN_BYTES (default 1024) when the client accepts it. Responses that are
+   streamed, already encoded (e.g. pages from app/page_cache.py) or file passthroughs are
+   left alone.
+
+2. A replacement for Flask's `static` view that
+   - serves `<file>.br` / `<file>.gz` written by `scripts/build_static.py` when the client
+     accepts that encoding and the sibling is not older than the file itself;
+   - resolves content-hashed names (`js/main.3f9a1c0b2e.js`) through the asset manifest
+     (app/assets.py) and serves them with `Cache-Control: public, max-age=31536000,
+     immutable`. Unhashed names keep Flask's usual conditional caching.
+
+brotli is optional; without it only gzip is produced and negotiated.
+"""
+from __future__ import annotations
+import gzip
+import mimetypes
+import os
+import re
+from typing import Optional
+
+from flask import request, send_from_directory
+
+from .assets import manifest
+
+try:
+    import brotli  # type: ignore
+except Exception:  # optional dependency
+    brotli = None
+
+MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.environ.get("COMPRESS_GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.environ.get("COMPRESS_BROTLI_QUALITY", "5"))
+COMPRESSIBLE_MIMETYPES = frozenset({
+    "application/json", "text/html", "text/css", "text/plain",
+    "application/javascript", "text/javascript", "image/svg+xml", "application/xml", "text/xml",
+})
+IMMUTABLE_MAX_AGE = 31536000
+_HASHED_NAME = re.compile(r"^(.+)\.[0-9a-f]{10}(\.[A-Za-z0-9]+)$")
+
+
+def _accepted_encoding() -> Optional[str]:
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        return "br"
+    if accepted["gzip"]:
+        return "gzip"
+    return None
+
+
+def _compress_response(response):
+    if (response.status_code < 200 or response.status_code >= 300 or response.status_code == 204
+            or response.direct_passthrough or response.is_streamed
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES
+            or request.method == "HEAD"):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = _accepted_encoding()
+    if encoding is None:
+        return response
+    body = response.get_data()
+    if len(body) < MIN_BYTES:
+        return response
+    if encoding == "br":
+        compressed = brotli.compress(body, quality=BROTLI_QUALITY)
+    else:
+        compressed = gzip.compress(body, compresslevel=GZIP_LEVEL)
+    response.set_data(compressed)
+    response.headers["Content-Encoding"] = encoding
+    # a strong validator names one representation; the encoded body is a different one
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+    return response
+
+
+def _unhashed(filename: str) -> Optional[str]:
+    """'js/main.3f9a1c0b2e.js' -> 'js/main.js' for hashed names missing from the manifest."""
+    m = _HASHED_NAME.match(filename)
+    return f"{m.group(1)}{m.group(2)}" if m else None
+
+
+def _make_static_view(app):
+    static_folder = app.static_folder
+
+    def static(filename):
+        immutable = False
+        original = manifest.original_name(filename)
+        if original is not None:
+            filename, immutable = original, True
+        elif not os.path.isfile(os.path.join(static_folder, filename)):
+            # a hash from another deploy (old cached HTML during a rollout): serve the
+            # current file, but not as immutable
+            filename = _unhashed(filename) or filename
+
+        path = os.path.join(static_folder, filename)
+        encoding = _accepted_encoding()
+        sibling = None
+        if encoding is not None and os.path.isfile(path):
+            candidate = f"{filename}.{'br' if encoding == 'br' else 'gz'}"
+            candidate_path = os.path.join(static_folder, candidate)
+            try:
+                if os.path.getmtime(candidate_path) >= os.path.getmtime(path):
+                    sibling = candidate
+            except OSError:
+                sibling = None
+
+        if sibling is not None:
+            # mimetype/download name come from the original file, not the .br/.gz sibling
+            resp = send_from_directory(static_folder, sibling,
+                                       mimetype=_guess_mimetype(filename), conditional=True,
+                                       max_age=app.get_send_file_max_age(filename))
+            resp.headers["Content-Encoding"] = encoding
+        else:
+            resp = send_from_directory(static_folder, filename, conditional=True,
+                                       max_age=app.get_send_file_max_age(filename))
+        resp.vary.add("Accept-Encoding")
+        if immutable:
+            resp.cache_control.no_cache = None
+            resp.cache_control.public = True
+            resp.cache_control.max_age = IMMUTABLE_MAX_AGE
+            resp.cache_control.immutable = True
+        return resp
+
+    return static
+
+
+def _guess_mimetype(filename: str) -> str:
+    return mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+
+def init_compression(app) -> None:
+    app.after_request(_compress_response)
+    if app.static_folder and "static" in app.view_functions:
+        app.view_functions["static"] = _make_static_view(app)
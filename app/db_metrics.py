@@ -0,0 +1,294 @@
+"""
+app/db_metrics.py
+
+Database instrumentation: per-request query budget reporting and Prometheus metrics.
+
+SQLAlchemy event hooks on every engine (the primary and each read replica bind) time each
+statement, and TimedQueuePool times each pool checkout (waiting for a free connection,
+opening a new one, pre-ping). Per request they add up to
+
+    Server-Timing: db;dur=12.4;desc="9 queries", db-slowest;dur=3.1, db-pool;dur=0.2
+
+when DB_SERVER_TIMING=1 (off by default: it tells any visitor how much database work each
+page costs, which helps someone looking for an expensive URL to hammer), and a request that runs more than
+DB_QUERY_BUDGET statements (default 20; 0 disables) gets one debug line from this logger
+with its endpoint, query count, database time and slowest statement, the usual sign of an
+N+1 loop.
+
+GET /metrics serves this worker's counters in the Prometheus text format: statement count,
+errors and latency per bind; pool checkout latency and timeouts per bind; pool size /
+checked out / overflow gauges; and per-endpoint histograms of queries and database time per
+request. Like /payments-admin/api/paypal-metrics the numbers are per process, so scrape
+each worker (or run one worker per target). The endpoint is closed by default: a scraper
+sends `Authorization: Bearer <METRICS_TOKEN>`, and anyone else needs payments-admin access
+(see require_payments_admin in app/routes_payments_admin.py).
+"""
+from __future__ import annotations
+import hmac
+import logging
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy import exc as sa_exc
+from sqlalchemy.pool import QueuePool
+
+logger = logging.getLogger(__name__)
+
+QUERY_BUDGET = int(os.environ.get("DB_QUERY_BUDGET", "20"))
+SERVER_TIMING = os.environ.get("DB_SERVER_TIMING", "0").lower() in ("1", "true", "yes")
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+PRIMARY = "primary"
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+_lock = threading.Lock()
+_WS = re.compile(r"\s+")
+
+
+class _Counter:
+    def __init__(self, name: str, help_text: str, label: str):
+        self.name, self.help_text, self.label = name, help_text, label
+        self.values: Dict[str, float] = {}
+
+    def inc(self, label_value: str, amount: float = 1.0) -> None:
+        self.values[label_value] = self.values.get(label_value, 0.0) + amount
+
+    def render(self, out: List[str]) -> None:
+        out.append(f"# HELP {self.name} {self.help_text}")
+        out.append(f"# TYPE {self.name} counter")
+        for value, total in sorted(self.values.items()):
+            out.append(f"{self.name}{{{self.label}=\"{_escape(value)}\"}} {_num(total)}")
+
+
+class _Histogram:
+    def __init__(self, name: str, help_text: str, label: str, buckets: Sequence[float]):
+        self.name, self.help_text, self.label, self.buckets = name, help_text, label, buckets
+        # label value -> [count per bucket..., sum, count]
+        self.series: Dict[str, List[float]] = {}
+
+    def observe(self, label_value: str, value: float) -> None:
+        series = self.series.get(label_value)
+        if series is None:
+            series = self.series[label_value] = [0] * len(self.buckets) + [0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self, out: List[str]) -> None:
+        out.append(f"# HELP {self.name} {self.help_text}")
+        out.append(f"# TYPE {self.name} histogram")
+        for value, series in sorted(self.series.items()):
+            label = f"{self.label}=\"{_escape(value)}\""
+            for bound, count in zip(self.buckets, series):
+                out.append(f"{self.name}_bucket{{{label},le=\"{_num(bound)}\"}} {count}")
+            out.append(f"{self.name}_bucket{{{label},le=\"+Inf\"}} {series[-1]}")
+            out.append(f"{self.name}_sum{{{label}}} {_num(series[-2])}")
+            out.append(f"{self.name}_count{{{label}}} {series[-1]}")
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _num(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def _new_metrics() -> Tuple[_Counter, _Counter, _Histogram, _Histogram, _Counter, _Histogram, _Histogram, _Counter]:
+    return (
+        _Counter("db_queries_total", "SQL statements executed.", "bind"),
+        _Counter("db_query_errors_total", "SQL statements and connection attempts that raised.", "bind"),
+        _Histogram("db_query_duration_seconds", "Time per SQL statement.", "bind", SECONDS_BUCKETS),
+        _Histogram("db_pool_checkout_seconds", "Time to get a connection from the pool.", "bind", SECONDS_BUCKETS),
+        _Counter("db_pool_timeouts_total", "Pool checkouts that gave up after pool_timeout.", "bind"),
+        _Histogram("http_request_db_queries", "SQL statements per request.", "endpoint", QUERY_COUNT_BUCKETS),
+        _Histogram("http_request_db_seconds", "Database time per request.", "endpoint", SECONDS_BUCKETS),
+        _Counter("http_request_db_budget_exceeded_total", "Requests over DB_QUERY_BUDGET statements.", "endpoint"),
+    )
+
+
+(QUERIES, QUERY_ERRORS, QUERY_SECONDS, POOL_SECONDS, POOL_TIMEOUTS,
+ REQUEST_QUERIES, REQUEST_SECONDS, BUDGET_EXCEEDED) = _new_metrics()
+
+
+def reset() -> None:
+    """Start this process's counters from zero (a forked worker must not report the master's)."""
+    global QUERIES, QUERY_ERRORS, QUERY_SECONDS, POOL_SECONDS, POOL_TIMEOUTS
+    global REQUEST_QUERIES, REQUEST_SECONDS, BUDGET_EXCEEDED
+    with _lock:
+        (QUERIES, QUERY_ERRORS, QUERY_SECONDS, POOL_SECONDS, POOL_TIMEOUTS,
+         REQUEST_QUERIES, REQUEST_SECONDS, BUDGET_EXCEEDED) = _new_metrics()
+
+
+class RequestStats:
+    """Database work of one request (g._db_stats)."""
+
+    __slots__ = ("queries", "seconds", "slowest", "slowest_sql", "pool_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+        self.slowest = 0.0
+        self.slowest_sql = ""
+        self.pool_seconds = 0.0
+
+    def server_timing(self) -> str:
+        return (f"db;dur={self.seconds * 1000:.1f};desc=\"{self.queries} queries\", "
+                f"db-slowest;dur={self.slowest * 1000:.1f}, db-pool;dur={self.pool_seconds * 1000:.1f}")
+
+
+def _request_stats() -> Optional[RequestStats]:
+    if not has_request_context():
+        return None
+    stats = g.get("_db_stats")
+    if stats is None:
+        stats = g._db_stats = RequestStats()
+    return stats
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout took, labelled by pool_logging_name."""
+
+    # pool log lines stay under sqlalchemy.pool.* instead of this module's logger
+    _sqla_logger_namespace = "sqlalchemy.pool.impl.QueuePool"
+
+    def connect(self):
+        started = time.perf_counter()
+        bind = self.logging_name or PRIMARY
+        try:
+            return super().connect()
+        except sa_exc.TimeoutError:
+            with _lock:
+                POOL_TIMEOUTS.inc(bind)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            with _lock:
+                POOL_SECONDS.observe(bind, elapsed)
+            stats = _request_stats()
+            if stats is not None:
+                stats.pool_seconds += elapsed
+
+
+def _pool_options(options: dict, label: str) -> dict:
+    options = dict(options)
+    options.setdefault("poolclass", TimedQueuePool)
+    options.setdefault("pool_logging_name", label)
+    return options
+
+
+def instrument_engine_options(app) -> None:
+    """Time pool checkouts of the primary and every bind; call before db.init_app."""
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = _pool_options(
+        app.config.get("SQLALCHEMY_ENGINE_OPTIONS") or {}, PRIMARY)
+    binds = app.config.get("SQLALCHEMY_BINDS") or {}
+    app.config["SQLALCHEMY_BINDS"] = {
+        key: _pool_options({"url": value} if not isinstance(value, dict) else value, key)
+        for key, value in binds.items()
+    }
+
+
+def _watch_engine(engine, bind: str) -> None:
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._metrics_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_metrics_started", None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        with _lock:
+            QUERIES.inc(bind)
+            QUERY_SECONDS.observe(bind, elapsed)
+        stats = _request_stats()
+        if stats is not None:
+            stats.queries += 1
+            stats.seconds += elapsed
+            if elapsed >= stats.slowest:
+                stats.slowest = elapsed
+                stats.slowest_sql = statement
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        with _lock:
+            QUERY_ERRORS.inc(bind)
+
+
+def _report_request(response):
+    stats = g.pop("_db_stats", None)
+    if stats is None:
+        return response
+    endpoint = request.endpoint or "unmatched"
+    with _lock:
+        REQUEST_QUERIES.observe(endpoint, stats.queries)
+        REQUEST_SECONDS.observe(endpoint, stats.seconds)
+        over_budget = 0 < QUERY_BUDGET < stats.queries
+        if over_budget:
+            BUDGET_EXCEEDED.inc(endpoint)
+    if over_budget:
+        logger.debug("%s %s (%s) ran %d queries (budget %d), %.1f ms in the database; slowest %.1f ms: %s",
+                     request.method, request.path, endpoint, stats.queries, QUERY_BUDGET, stats.seconds * 1000,
+                     stats.slowest * 1000, _WS.sub(" ", stats.slowest_sql).strip()[:300])
+    if SERVER_TIMING:
+        response.headers.add("Server-Timing", stats.server_timing())
+    return response
+
+
+def _render_pool_gauges(engines, out: List[str]) -> None:
+    pools = [(key or PRIMARY, engine.pool) for key, engine in engines.items()
+             if isinstance(engine.pool, QueuePool)]
+    for name, help_text, read in (
+            ("db_pool_size", "Connections the pool keeps open.", lambda p: p.size()),
+            ("db_pool_checked_out", "Connections currently checked out.", lambda p: p.checkedout()),
+            ("db_pool_overflow", "Connections open beyond pool_size (negative: not yet opened).",
+             lambda p: p.overflow())):
+        out.append(f"# HELP {name} {help_text}")
+        out.append(f"# TYPE {name} gauge")
+        for bind, pool in pools:
+            out.append(f"{name}{{bind=\"{_escape(bind)}\"}} {read(pool)}")
+
+
+def render_metrics(engines) -> str:
+    out: List[str] = []
+    with _lock:
+        for metric in (QUERIES, QUERY_ERRORS, QUERY_SECONDS, POOL_SECONDS, POOL_TIMEOUTS,
+                       REQUEST_QUERIES, REQUEST_SECONDS, BUDGET_EXCEEDED):
+            metric.render(out)
+    _render_pool_gauges(engines, out)
+    return "\n".join(out) + "\n"
+
+
+def _metrics_response():
+    from . import db
+    return Response(render_metrics(db.engines), mimetype="text/plain; version=0.0.4")
+
+
+def metrics_view():
+    if METRICS_TOKEN and hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {METRICS_TOKEN}"):
+        return _metrics_response()
+    # no (or a wrong) scrape token: same gate as /payments-admin/api/paypal-metrics
+    from .routes_payments_admin import require_payments_admin
+    return require_payments_admin(_metrics_response)()
+
+
+def init_db_metrics(app) -> None:
+    """Hook every engine of db (call after db.init_app), add Server-Timing and GET /metrics."""
+    from . import db
+
+    with app.app_context():
+        engines = dict(db.engines)
+    for key, engine in engines.items():
+        _watch_engine(engine, key or PRIMARY)
+    app.after_request(_report_request)
+    app.add_url_rule("/metrics", "db_metrics", metrics_view, methods=["GET"])
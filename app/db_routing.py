@@ -0,0 +1,239 @@
+"""
+app/db_routing.py
+
+Read-replica routing for db.session.
+
+DATABASE_REPLICA_URLS (comma-separated) adds one SQLAlchemy bind per replica ("replica_0",
+"replica_1", ...) with the primary's engine options. RoutingSession.get_bind() then sends
+
+  to a replica     SELECTs made while serving a GET/HEAD/OPTIONS request, and SELECTs
+                   inside `with read_only():` (reports, exports, CLI jobs that only read)
+  to the primary   everything else: flushes and DML, SELECT ... FOR UPDATE, raw SQL,
+                   other request methods, work outside a request, `with use_primary():`,
+                   and every statement of a session after it has written anything
+
+A session keeps the replica it picked first, so the reads of one request see one snapshot.
+Without DATABASE_REPLICA_URLS nothing changes: every statement goes to the primary.
+
+Read-your-writes: after a POST/PUT/PATCH/DELETE that did not fail, the response sets the
+DB_STICKY_COOKIE cookie (default "db_primary") for DB_STICKY_SECONDS (default 10), and that
+client's reads go to the primary until it expires, so the page or API call that follows a
+write is not served from a replica that has not replayed it yet.
+
+Failover: a replica is probed (SELECT 1; on Postgres also the replay lag, which must stay
+under REPLICA_MAX_LAG_SECONDS, default 5) before its first use and then at most every
+REPLICA_CHECK_SECONDS (default 10) by whichever request picks it. A replica that fails the
+probe, or whose connection fails mid-request, is skipped for REPLICA_RETRY_SECONDS (default
+30); with no usable replica, reads go to the primary.
+"""
+from __future__ import annotations
+import itertools
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional
+
+from flask import current_app, has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.sql.selectable import CompoundSelect, Select
+
+logger = logging.getLogger(__name__)
+
+STICKY_COOKIE = os.environ.get("DB_STICKY_COOKIE", "db_primary")
+STICKY_SECONDS = int(os.environ.get("DB_STICKY_SECONDS", "10"))
+CHECK_SECONDS = float(os.environ.get("REPLICA_CHECK_SECONDS", "10"))
+RETRY_SECONDS = float(os.environ.get("REPLICA_RETRY_SECONDS", "30"))
+MAX_LAG_SECONDS = float(os.environ.get("REPLICA_MAX_LAG_SECONDS", "5"))
+CONNECT_TIMEOUT = int(os.environ.get("REPLICA_CONNECT_TIMEOUT", "3"))
+
+BIND_PREFIX = "replica_"
+READ_METHODS = frozenset(("GET", "HEAD", "OPTIONS"))
+
+# replay lag in seconds; 0 when the replica has replayed everything it received
+_PG_LAG_SQL = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END")
+
+# "replica" / "primary" while inside read_only() / use_primary()
+_route: ContextVar[Optional[str]] = ContextVar("db_route", default=None)
+
+
+@contextmanager
+def read_only() -> Iterator[None]:
+    """Send this block's SELECTs to a replica, whatever the request method."""
+    token = _route.set("replica")
+    try:
+        yield
+    finally:
+        _route.reset(token)
+
+
+@contextmanager
+def use_primary() -> Iterator[None]:
+    """Send everything in this block to the primary (read-then-write code in GET handlers)."""
+    token = _route.set("primary")
+    try:
+        yield
+    finally:
+        _route.reset(token)
+
+
+def replica_urls() -> List[str]:
+    return [u.strip() for u in os.environ.get("DATABASE_REPLICA_URLS", "").split(",") if u.strip()]
+
+
+class _Replica:
+    def __init__(self, key: str):
+        self.key = key
+        self.healthy = False
+        self.next_check = 0.0  # monotonic time of the next probe; 0 = before first use
+        self.lock = threading.Lock()
+
+
+class ReplicaSet:
+    """Health state of the replica binds of one app (app.extensions["db_replicas"])."""
+
+    def __init__(self, keys: List[str]):
+        self.replicas: Dict[str, _Replica] = {k: _Replica(k) for k in keys}
+        self._order = list(self.replicas.values())
+        self._counter = itertools.count()
+
+    def pick(self, engines) -> Optional[str]:
+        """Bind key of a usable replica (round robin), or None."""
+        start = next(self._counter)
+        for i in range(len(self._order)):
+            replica = self._order[(start + i) % len(self._order)]
+            if self.usable(replica.key, engines):
+                return replica.key
+        return None
+
+    def usable(self, key: str, engines) -> bool:
+        replica = self.replicas[key]
+        if time.monotonic() < replica.next_check or not replica.lock.acquire(blocking=False):
+            # not due, or another thread is probing it right now: last known state
+            return replica.healthy
+        try:
+            healthy = self._probe(key, engines[key])
+            replica.healthy = healthy
+            replica.next_check = time.monotonic() + (CHECK_SECONDS if healthy else RETRY_SECONDS)
+            return healthy
+        finally:
+            replica.lock.release()
+
+    def mark_down(self, key: str) -> None:
+        replica = self.replicas[key]
+        if replica.healthy:
+            logger.warning("read replica %s failed; reading from the primary for %.0f s", key, RETRY_SECONDS)
+        replica.healthy = False
+        replica.next_check = time.monotonic() + RETRY_SECONDS
+
+    @staticmethod
+    def _probe(key: str, engine: Engine) -> bool:
+        try:
+            with engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+                if engine.dialect.name == "postgresql":
+                    lag = float(conn.execute(_PG_LAG_SQL).scalar() or 0)
+                    if lag > MAX_LAG_SECONDS:
+                        logger.warning("read replica %s is %.1f s behind; not using it", key, lag)
+                        return False
+            return True
+        except Exception as e:
+            logger.warning("read replica %s is unavailable: %s", key, e)
+            return False
+
+
+def _is_plain_select(clause) -> bool:
+    if isinstance(clause, Select):
+        return clause._for_update_arg is None
+    return isinstance(clause, CompoundSelect)
+
+
+def _wants_replica() -> bool:
+    route = _route.get()
+    if route is not None:
+        return route == "replica"
+    if not has_request_context():
+        return False
+    return request.method in READ_METHODS and STICKY_COOKIE not in request.cookies
+
+
+class RoutingSession(Session):
+    """Flask-SQLAlchemy session whose reads may go to a replica bind (see module docstring)."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self.info.get("wrote"):
+            replicas = current_app.extensions.get("db_replicas")
+            if replicas is not None:
+                if self._flushing or not _is_plain_select(clause):
+                    # writes, raw SQL and Session.connection(): this session stays on the primary
+                    self.info["wrote"] = True
+                elif _wants_replica():
+                    key = self._replica_key(replicas)
+                    if key is not None:
+                        return self._db.engines[key]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _replica_key(self, replicas: ReplicaSet) -> Optional[str]:
+        key = self.info.get("replica")
+        engines = self._db.engines
+        if key is not None and replicas.replicas[key].healthy:
+            return key
+        key = replicas.pick(engines)
+        self.info["replica"] = key
+        return key
+
+
+def _set_sticky_cookie(response):
+    if request.method not in READ_METHODS and response.status_code < 400:
+        response.set_cookie(STICKY_COOKIE, "1", max_age=STICKY_SECONDS, httponly=True,
+                            samesite="Lax", secure=request.is_secure)
+    return response
+
+
+def init_replicas(app, engine_options: dict) -> None:
+    """
+    Add DATABASE_REPLICA_URLS as SQLALCHEMY_BINDS (call before db.init_app) and install
+    the stickiness cookie and the failure hook.
+    """
+    from . import _ensure_postgres_sslmode, _normalize_database_url
+
+    urls = replica_urls()
+    if not urls:
+        return
+    sslmode = os.environ.get("PGSSLMODE", "require")
+    binds = dict(app.config.get("SQLALCHEMY_BINDS") or {})
+    keys = []
+    for i, url in enumerate(urls):
+        url = _ensure_postgres_sslmode(_normalize_database_url(url), sslmode_value=sslmode)
+        options = dict(engine_options, url=url)
+        if url.startswith("postgresql://"):
+            # a dead replica should fail over in seconds, not after the OS connect timeout
+            options["connect_args"] = dict(options.get("connect_args") or {}, connect_timeout=CONNECT_TIMEOUT)
+        binds[BIND_PREFIX + str(i)] = options
+        keys.append(BIND_PREFIX + str(i))
+    app.config["SQLALCHEMY_BINDS"] = binds
+    app.extensions["db_replicas"] = ReplicaSet(keys)
+    app.after_request(_set_sticky_cookie)
+    logger.debug("read replicas configured: %s", ", ".join(keys))
+
+
+def watch_replica_engines(app) -> None:
+    """Mark a replica down when one of its connections fails (call after db.init_app)."""
+    replicas: Optional[ReplicaSet] = app.extensions.get("db_replicas")
+    if replicas is None:
+        return
+    from . import db
+
+    with app.app_context():
+        engines = db.engines
+    for key in replicas.replicas:
+        def on_error(context, key=key):
+            if context.is_disconnect or context.connection is None:
+                replicas.mark_down(key)
+        event.listen(engines[key], "handle_error", on_error)
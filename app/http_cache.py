@@ -0,0 +1,116 @@
+"""
+app/http_cache.py
+
+Conditional-GET support for the public read APIs.
+
+    @bp.route('/api/brands', methods=['GET'])
+    @http_cached(Brand, max_age=300)
+    def get_brands(): ...
+
+Each source is a model with an `updated_at` column (its watermark is max(updated_at) plus
+count(*), so deletes count too) or a callable returning a string token for data that does
+not live in such a table (e.g. the in-memory top-picks list). The weak ETag is a digest of
+the endpoint, its arguments and every source watermark, so a request carrying a matching
+If-None-Match gets a 304 before the view runs: no row loading, no serialization.
+Last-Modified (newest updated_at) is sent for information only; If-Modified-Since is not
+trusted for 304s because a delete does not move max(updated_at).
+
+Successful responses get `Cache-Control: public, max-age=<max_age>,
+stale-while-revalidate=<swr>` plus ETag and Last-Modified. Site-admin sessions get
+`private, no-cache` so admin screens always revalidate and see their own edits.
+"""
+from __future__ import annotations
+import hashlib
+import threading
+from datetime import datetime
+from functools import wraps
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from flask import current_app, make_response, request, session
+from sqlalchemy import func, inspect as sa_inspect
+
+from . import db
+
+_versions: Dict[str, int] = {}
+_versions_lock = threading.Lock()
+
+
+def bump_version(name: str) -> None:
+    """Advance an in-process version counter (for sources that are not DB tables)."""
+    with _versions_lock:
+        _versions[name] = _versions.get(name, 0) + 1
+
+
+def version_source(name: str) -> Callable[[], str]:
+    """Source for http_cached() backed by a bump_version() counter."""
+    return lambda: f"{name}:{_versions.get(name, 0)}"
+
+
+def table_watermark(model) -> Tuple[Optional[datetime], str]:
+    pk = sa_inspect(model).primary_key[0]
+    latest, count = db.session.query(func.max(model.updated_at), func.count(pk)).one()
+    return latest, f"{model.__tablename__}:{latest.isoformat() if latest else ''}:{count}"
+
+
+def _is_site_admin() -> bool:
+    return session.get("user") in ("admin", "admin@example.com")
+
+
+def _apply_headers(resp, etag: str, last_modified: Optional[datetime], max_age: int, swr: int):
+    resp.set_etag(etag, weak=True)
+    if last_modified is not None:
+        resp.last_modified = last_modified
+    if _is_site_admin():
+        resp.cache_control.private = True
+        resp.cache_control.no_cache = True
+    else:
+        resp.cache_control.public = True
+        resp.cache_control.max_age = max_age
+        if swr:
+            resp.cache_control.stale_while_revalidate = swr
+    return resp
+
+
+def http_cached(*sources: Any, max_age: int = 60, swr: int = 300):
+    """Decorator: weak ETag / Last-Modified from source watermarks, 304 without running the view."""
+
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            try:
+                tokens = []
+                last_modified: Optional[datetime] = None
+                for src in sources:
+                    if not hasattr(src, "__table__"):
+                        tokens.append(str(src()))
+                        continue
+                    latest, token = table_watermark(src)
+                    tokens.append(token)
+                    if latest is not None and (last_modified is None or latest > last_modified):
+                        last_modified = latest
+            except Exception:
+                # caching must never take the endpoint down; serve it uncached
+                db.session.rollback()
+                current_app.logger.exception("http_cached: watermark query failed for %s", request.path)
+                return f(*args, **kwargs)
+
+            h = hashlib.sha1()
+            h.update(request.endpoint.encode() if request.endpoint else b"")
+            h.update(repr(sorted(kwargs.items())).encode())
+            h.update(repr(sorted(request.args.items(multi=True))).encode())
+            for token in tokens:
+                h.update(b"\0" + token.encode())
+            etag = h.hexdigest()[:20]
+
+            if last_modified is not None:
+                last_modified = last_modified.replace(microsecond=0)
+
+            if request.if_none_match.contains_weak(etag):
+                return _apply_headers(current_app.response_class(status=304), etag, last_modified, max_age, swr)
+
+            resp = make_response(f(*args, **kwargs))
+            if resp.status_code == 200:
+                _apply_headers(resp, etag, last_modified, max_age, swr)
+            return resp
+        return wrapper
+    return decorator
@@ -0,0 +1,266 @@
+"""
+app/idempotency.py
+
+Idempotency-Key support for endpoints that create orders or move money.
+
+    @bp.route('/api/orders', methods=['POST'])
+    @idempotent(ignore_fields=("date",))
+    def add_order(): ...
+
+A request carrying an `Idempotency-Key` (or legacy `X-Idempotency-Key`) header is
+fingerprinted (method + path + JSON body, minus `ignore_fields`). The first request with a
+given key/fingerprint runs the view and its response (status < 500) is stored in the
+idempotency_key table and an in-process LRU; retries inside IDEMPOTENCY_TTL_SECONDS
+(default 24h) get the stored response back with `Idempotent-Replayed: true`, without
+re-running inserts or PayPal calls. A retry that arrives while the first request is still
+running gets 409. Requests without the header are not affected.
+
+A key covers one distinct request body, so a client may reuse a single checkout key for
+the per-line POSTs of one cart.
+
+Keys are scoped: the stored key is a hash of the endpoint, the caller and the client's key,
+so one client's key (e.g. the guessable `capture-<orderID>`) never replays another
+client's response. The caller is the signed-in user, else the anonymous id that the
+checkout quote puts in the session cookie (ensure_idempotency_client), else the client's
+address and User-Agent. The id is only issued before checkout starts, never by an
+idempotent request itself, so a request and its retries always share one scope.
+"""
+from __future__ import annotations
+import hashlib
+import inspect
+import json
+import os
+import random
+import secrets
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from functools import wraps
+from typing import Iterable, Optional, Tuple
+
+from flask import current_app, jsonify, make_response, request, session, Response
+from sqlalchemy.exc import IntegrityError
+
+from . import db
+from .async_http import run_sync
+from .models import IdempotencyKey
+
+TTL = timedelta(seconds=int(os.environ.get("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600))))
+LRU_SIZE = int(os.environ.get("IDEMPOTENCY_LRU_SIZE", "2048"))
+# an in_progress row older than this belongs to a request that died; it may be reclaimed
+IN_PROGRESS_TIMEOUT = timedelta(seconds=120)
+HEADER_NAMES = ("Idempotency-Key", "X-Idempotency-Key")
+CLIENT_SESSION_KEY = "idempotency_client"
+
+
+class _ResponseLRU:
+    """Small thread-safe LRU of completed responses in front of the table."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Tuple[str, str], Tuple[datetime, int, str, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, k):
+        with self._lock:
+            hit = self._data.get(k)
+            if hit is None:
+                return None
+            if hit[0] <= datetime.utcnow():
+                del self._data[k]
+                return None
+            self._data.move_to_end(k)
+            return hit
+
+    def put(self, k, value) -> None:
+        with self._lock:
+            self._data[k] = value
+            self._data.move_to_end(k)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+_lru = _ResponseLRU(LRU_SIZE)
+
+
+def _fingerprint(ignore_fields: Iterable[str]) -> str:
+    raw = request.get_data(cache=True) or b""
+    body = raw
+    if ignore_fields:
+        try:
+            parsed = json.loads(raw or b"{}")
+            if isinstance(parsed, dict):
+                for field in ignore_fields:
+                    parsed.pop(field, None)
+                body = json.dumps(parsed, sort_keys=True, separators=(",", ":")).encode()
+        except ValueError:
+            pass
+    h = hashlib.sha256()
+    h.update(request.method.encode())
+    h.update(b" ")
+    h.update(request.path.encode())
+    h.update(b"\n")
+    h.update(body)
+    return h.hexdigest()
+
+
+def ensure_idempotency_client() -> None:
+    """Give an anonymous visitor the session id that scopes its Idempotency-Keys."""
+    if not session.get("user") and not session.get(CLIENT_SESSION_KEY):
+        session[CLIENT_SESSION_KEY] = secrets.token_urlsafe(16)
+
+
+def _scoped_key(key: str) -> str:
+    """Stored key: the client's key within this endpoint and caller."""
+    if session.get("user"):
+        caller = f"user:{session['user']}"
+    elif session.get(CLIENT_SESSION_KEY):
+        caller = f"client:{session[CLIENT_SESSION_KEY]}"
+    else:
+        caller = f"anonymous:{request.remote_addr}:{request.headers.get('User-Agent', '')}"
+    scoped = f"{request.endpoint}\n{caller}\n{key}"
+    return hashlib.sha256(scoped.encode()).hexdigest()
+
+
+def _replay(status: int, body: str, content_type: str) -> Response:
+    resp = Response(body, status=status, content_type=content_type or "application/json")
+    resp.headers["Idempotent-Replayed"] = "true"
+    return resp
+
+
+def _purge_expired() -> None:
+    try:
+        IdempotencyKey.query.filter(IdempotencyKey.expires_at < datetime.utcnow()).delete(
+            synchronize_session=False)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        current_app.logger.debug("idempotency: purge of expired keys failed")
+
+
+def _claim(key: str, fp: str) -> Tuple[Optional[IdempotencyKey], Optional[Response]]:
+    """Insert the in_progress row, or return the stored/conflict response for an existing one."""
+    now = datetime.utcnow()
+    try:
+        row = IdempotencyKey(key=key, fingerprint=fp, state="in_progress", expires_at=now + TTL)
+        db.session.add(row)
+        db.session.commit()
+        return row, None
+    except IntegrityError:
+        db.session.rollback()
+    existing = IdempotencyKey.query.filter_by(key=key, fingerprint=fp).first()
+    if existing is None:
+        # lost a race with a purge; treat as new on the next retry
+        return None, (jsonify({"error": "idempotency_conflict", "detail": "retry the request"}), 409)
+    stale = existing.state != "completed" and existing.created_at <= now - IN_PROGRESS_TIMEOUT
+    if existing.expires_at <= now or stale:
+        db.session.delete(existing)
+        db.session.commit()
+        return _claim(key, fp)
+    if existing.state != "completed":
+        return None, (jsonify({"error": "request_in_progress",
+                               "detail": "a request with this Idempotency-Key is still being processed"}), 409)
+    _lru.put((key, fp), (existing.expires_at, existing.response_status, existing.response_body, existing.content_type))
+    return None, _replay(existing.response_status, existing.response_body, existing.content_type)
+
+
+def _begin(ignore_fields: Tuple[str, ...]):
+    """
+    (claim, None) when the view should run: claim is (key, fp, row_id), or None for an
+    unprotected run; (None, response) when a stored or conflict response answers the request.
+    """
+    key = next((request.headers.get(h) for h in HEADER_NAMES if request.headers.get(h)), None)
+    if not key:
+        return None, None
+    key = _scoped_key(key.strip())
+    fp = _fingerprint(ignore_fields)
+
+    hit = _lru.get((key, fp))
+    if hit is not None:
+        return None, _replay(hit[1], hit[2], hit[3])
+
+    try:
+        row, early = _claim(key, fp)
+    except Exception:
+        # the idempotency store must never take checkout down with it
+        db.session.rollback()
+        current_app.logger.exception("idempotency: key store unavailable; running request unprotected")
+        return None, None
+    if early is not None:
+        return None, early
+    return (key, fp, row.id), None
+
+
+def _finish(claim, rv) -> Response:
+    key, fp, row_id = claim
+    resp = make_response(rv)
+    if resp.status_code >= 500 or resp.direct_passthrough or resp.is_streamed:
+        # not a final answer: let the client retry for real
+        _release(row_id)
+        return resp
+    body = resp.get_data(as_text=True)
+    try:
+        db.session.rollback()  # discard anything the view left uncommitted
+        stored = IdempotencyKey.query.get(row_id)
+        if stored is not None:
+            stored.state = "completed"
+            stored.response_status = resp.status_code
+            stored.response_body = body
+            stored.content_type = resp.content_type
+            db.session.commit()
+            _lru.put((key, fp), (stored.expires_at, resp.status_code, body, resp.content_type))
+    except Exception:
+        db.session.rollback()
+        current_app.logger.exception("idempotency: failed to store response for key %s", key)
+    if random.random() < 0.01:
+        _purge_expired()
+    return resp
+
+
+def idempotent(ignore_fields: Iterable[str] = ()):
+    """Decorator: replay stored responses for repeated Idempotency-Key requests.
+    Works on `async def` views too; the key store is then used from a thread."""
+    ignore_fields = tuple(ignore_fields)
+
+    def decorator(f):
+        if inspect.iscoroutinefunction(f):
+            @wraps(f)
+            async def async_wrapper(*args, **kwargs):
+                claim, early = await run_sync(_begin, ignore_fields)
+                if early is not None:
+                    return early
+                if claim is None:
+                    return await f(*args, **kwargs)
+                try:
+                    rv = await f(*args, **kwargs)
+                except Exception:
+                    await run_sync(_release, claim[2])
+                    raise
+                return await run_sync(_finish, claim, rv)
+            return async_wrapper
+
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            claim, early = _begin(ignore_fields)
+            if early is not None:
+                return early
+            if claim is None:
+                return f(*args, **kwargs)
+            try:
+                rv = f(*args, **kwargs)
+            except Exception:
+                _release(claim[2])
+                raise
+            return _finish(claim, rv)
+        return wrapper
+    return decorator
+
+
+def _release(row_id: int) -> None:
+    try:
+        db.session.rollback()
+        IdempotencyKey.query.filter_by(id=row_id).delete(synchronize_session=False)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        current_app.logger.exception("idempotency: failed to release key row %s", row_id)
@@ -0,0 +1,325 @@
+"""
+app/image_pipeline.py
+
+Responsive derivatives for catalog and content images.
+
+Each source image under app/static (e.g. images/creed/aventus.jpg) is resized to the fixed
+widths in IMAGE_DERIVATIVE_WIDTHS (default 160,320,640,1024; never upscaled) and encoded as
+AVIF, WebP and JPEG into a mirrored tree under static/derived/:
+
+    derived/images/creed/aventus-320w.webp
+
+Encoding runs in a process pool (one worker per core by default). Each derivative's path,
+width, height and byte size is stored in the image_derivative table, and the read helpers
+turn that into srcset strings for the API payloads and templates:
+
+    image_sources("images/creed/aventus.jpg")
+    # {"avif": "/static/derived/.../aventus-160w.avif 160w, ...", "webp": ..., "jpeg": ...}
+
+Images without derivatives (not built yet, remote URLs) simply get no srcset, so callers
+fall back to the original URL. Uploaded images (source under uploads/) and their
+derivatives live in the upload storage backend (app/storage.py, see app/uploads.py);
+everything else is served from app/static.
+
+Entry points: `flask build-image-derivatives`, the content upload endpoint and
+scripts/import_images_to_db.py. Requires Pillow; AVIF needs Pillow >= 11.3 (built-in) or the
+pillow-avif-plugin package and is skipped when neither is available.
+"""
+from __future__ import annotations
+import os
+import threading
+import time
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import click
+
+from . import db
+from .models import ImageDerivative
+from .storage import get_storage
+
+try:
+    from PIL import Image, ImageOps, features
+except Exception:  # optional dependency
+    Image = ImageOps = features = None
+
+logger = logging.getLogger(__name__)
+
+STATIC_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+DERIVED_DIR = "derived"
+UPLOADS_DIR = "uploads"
+WIDTHS = tuple(sorted(int(w) for w in os.environ.get(
+    "IMAGE_DERIVATIVE_WIDTHS", "160,320,640,1024").split(",") if w.strip()))
+FORMATS = ("avif", "webp", "jpeg")
+QUALITY = {"avif": 50, "webp": 75, "jpeg": 80}
+EXTENSIONS = {"avif": "avif", "webp": "webp", "jpeg": "jpg"}
+SOURCE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp"}
+INDEX_TTL = float(os.environ.get("IMAGE_INDEX_TTL_SECONDS", "60"))
+
+
+def available_formats() -> Sequence[str]:
+    if Image is None:
+        return ()
+    fmts = [f for f in FORMATS if f != "avif"]
+    if features.check("avif"):
+        fmts.insert(0, "avif")
+    else:
+        try:
+            import pillow_avif  # type: ignore  # noqa: F401
+            fmts.insert(0, "avif")
+        except Exception:
+            pass
+    return tuple(fmts)
+
+
+def normalize_source(path: Optional[str]) -> Optional[str]:
+    """'/static/images/x.jpg' or 'images/x.jpg' -> 'images/x.jpg'; None for remote URLs."""
+    if not path or not isinstance(path, str):
+        return None
+    path = path.strip()
+    if path.startswith(("http://", "https://", "//")):
+        # objects in a remote upload bucket are keyed like local paths
+        return get_storage().key_for_url(path)
+    if path.startswith("/static/"):
+        path = path[len("/static/"):]
+    path = path.lstrip("/")
+    if not path or path.startswith(DERIVED_DIR + "/") or ".." in path.split("/"):
+        return None
+    return path
+
+
+def derivative_path(source: str, width: int, fmt: str) -> str:
+    stem, _ext = os.path.splitext(source)
+    return f"{DERIVED_DIR}/{stem}-{width}w.{EXTENSIONS[fmt]}"
+
+
+# ---------- encoding (runs in worker processes) ----------
+def _target_widths(original_width: int) -> List[int]:
+    widths = [w for w in WIDTHS if w < original_width]
+    # small originals still get one re-encoded copy at their own width
+    return widths or [original_width]
+
+
+def _encode(img, fmt: str, dest: str) -> None:
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    tmp = dest + ".tmp"
+    if fmt == "jpeg":
+        if img.mode in ("RGBA", "LA", "P"):
+            rgba = img.convert("RGBA")
+            flat = Image.new("RGB", rgba.size, (255, 255, 255))
+            flat.paste(rgba, mask=rgba.split()[-1])
+            img = flat
+        elif img.mode != "RGB":
+            img = img.convert("RGB")
+        img.save(tmp, "JPEG", quality=QUALITY["jpeg"], optimize=True, progressive=True)
+    elif fmt == "webp":
+        img.save(tmp, "WEBP", quality=QUALITY["webp"], method=6)
+    else:
+        img.save(tmp, "AVIF", quality=QUALITY["avif"])
+    os.replace(tmp, dest)
+
+
+def render_source(source: str, static_root: str = STATIC_ROOT, formats: Sequence[str] = None,
+                  force: bool = False) -> dict:
+    """Build all derivatives of one source image. Returns {"source", "derivatives", "error"}."""
+    formats = tuple(formats or available_formats())
+    result = {"source": source, "derivatives": [], "error": None}
+    src_file = os.path.join(static_root, source)
+    try:
+        src_mtime = os.path.getmtime(src_file)
+        with Image.open(src_file) as opened:
+            img = ImageOps.exif_transpose(opened)
+            img.load()
+        if img.mode not in ("RGB", "RGBA"):
+            img = img.convert("RGBA" if "A" in img.getbands() or img.mode == "P" else "RGB")
+        ow, oh = img.size
+        for width in _target_widths(ow):
+            height = max(1, round(oh * width / ow))
+            resized = None
+            for fmt in formats:
+                rel = derivative_path(source, width, fmt)
+                dest = os.path.join(static_root, rel)
+                if force or not os.path.exists(dest) or os.path.getmtime(dest) < src_mtime:
+                    if resized is None:
+                        resized = img if width == ow else img.resize((width, height), Image.LANCZOS)
+                    _encode(resized, fmt, dest)
+                result["derivatives"].append({
+                    "format": fmt, "width": width, "height": height,
+                    "path": rel, "bytes": os.path.getsize(dest),
+                })
+    except Exception as exc:
+        result["error"] = f"{type(exc).__name__}: {exc}"
+        result["derivatives"] = []
+    return result
+
+
+def _render_packed(args):
+    return render_source(*args)
+
+
+def generate_derivatives(sources: Iterable[str], static_root: str = STATIC_ROOT,
+                         workers: Optional[int] = None, force: bool = False) -> List[dict]:
+    """Encode derivatives for many sources, in a process pool when there is more than one."""
+    if Image is None:
+        raise RuntimeError("Pillow is not installed; cannot build image derivatives")
+    sources = [s for s in dict.fromkeys(normalize_source(s) for s in sources) if s]
+    formats = available_formats()
+    workers = workers or os.cpu_count() or 1
+    jobs = [(s, static_root, formats, force) for s in sources]
+    if workers <= 1 or len(jobs) <= 1:
+        return [_render_packed(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+        return list(pool.map(_render_packed, jobs, chunksize=max(1, len(jobs) // (workers * 4))))
+
+
+# ---------- DB records ----------
+def record_derivatives(results: Iterable[dict]) -> int:
+    """Replace the stored derivative rows of every successfully rendered source."""
+    done = [r for r in results if not r["error"] and r["derivatives"]]
+    if not done:
+        return 0
+    now = datetime.utcnow()
+    try:
+        for r in done:
+            ImageDerivative.query.filter_by(source_path=r["source"]).delete(synchronize_session=False)
+            for d in r["derivatives"]:
+                db.session.add(ImageDerivative(source_path=r["source"], format=d["format"],
+                                               width=d["width"], height=d["height"], path=d["path"],
+                                               bytes=d["bytes"], updated_at=now))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    invalidate_index()
+    return sum(len(r["derivatives"]) for r in done)
+
+
+def build_derivatives(sources: Iterable[str], workers: Optional[int] = None, force: bool = False,
+                      static_root: str = STATIC_ROOT) -> List[dict]:
+    """generate_derivatives() + record_derivatives(); returns the per-source results."""
+    results = generate_derivatives(sources, static_root=static_root, workers=workers, force=force)
+    record_derivatives(results)
+    for r in results:
+        if r["error"]:
+            logger.warning("image derivatives failed for %s: %s", r["source"], r["error"])
+    return results
+
+
+def discover_sources(static_root: str = STATIC_ROOT, folders: Sequence[str] = ("images", "uploads/content")) -> List[str]:
+    found = []
+    for folder in folders:
+        base = os.path.join(static_root, folder)
+        for dirpath, _dirnames, filenames in os.walk(base):
+            for name in sorted(filenames):
+                if os.path.splitext(name)[1].lower() in SOURCE_EXTENSIONS:
+                    found.append(os.path.relpath(os.path.join(dirpath, name), static_root).replace(os.sep, "/"))
+    return sorted(found)
+
+
+# ---------- lookups ----------
+class _DerivativeIndex:
+    """source path -> {format: [(width, url), ...]}, reloaded every INDEX_TTL seconds."""
+
+    def __init__(self):
+        self._by_source: Dict[str, Dict[str, list]] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def invalidate(self) -> None:
+        self._loaded_at = None
+
+    def get(self, source: str) -> Dict[str, list]:
+        loaded_at = self._loaded_at
+        if loaded_at is None or time.monotonic() - loaded_at >= INDEX_TTL:
+            with self._lock:
+                if self._loaded_at is None or time.monotonic() - self._loaded_at >= INDEX_TTL:
+                    self._reload()
+        return self._by_source.get(source, {})
+
+    def _reload(self) -> None:
+        by_source: Dict[str, Dict[str, list]] = {}
+        try:
+            rows = db.session.query(ImageDerivative.source_path, ImageDerivative.format,
+                                    ImageDerivative.width, ImageDerivative.path).all()
+        except Exception:
+            # e.g. table not migrated yet: serve originals until the next reload
+            db.session.rollback()
+            logger.debug("image derivative index unavailable", exc_info=True)
+            rows = []
+        storage = get_storage()
+        for source, fmt, width, path in rows:
+            url = storage.url(path) if source.startswith(UPLOADS_DIR + "/") else "/static/" + path
+            by_source.setdefault(source, {}).setdefault(fmt, []).append((width, url))
+        for fmts in by_source.values():
+            for entries in fmts.values():
+                entries.sort()
+        self._by_source = by_source
+        self._loaded_at = time.monotonic()
+
+
+_index = _DerivativeIndex()
+
+
+def invalidate_index() -> None:
+    _index.invalidate()
+
+
+def load_index() -> None:
+    """Load the derivative index now (e.g. in the Gunicorn master before forking)."""
+    _index.get("")
+
+
+def srcset(path: Optional[str], fmt: str = "webp") -> str:
+    source = normalize_source(path)
+    if not source:
+        return ""
+    return ", ".join(f"{url} {width}w" for width, url in _index.get(source).get(fmt, ()))
+
+
+def image_sources(path: Optional[str]) -> Optional[Dict[str, str]]:
+    """{format: srcset} for every format built for this image, or None when there are none."""
+    source = normalize_source(path)
+    if not source:
+        return None
+    fmts = _index.get(source)
+    if not fmts:
+        return None
+    return {fmt: ", ".join(f"{url} {width}w" for width, url in fmts[fmt]) for fmt in FORMATS if fmt in fmts}
+
+
+def derivative_url(path: Optional[str], width: int, fmt: str = "jpeg") -> Optional[str]:
+    """URL of the smallest derivative at least `width` wide (else the largest), or None."""
+    source = normalize_source(path)
+    if not source:
+        return None
+    entries = _index.get(source).get(fmt)
+    if not entries:
+        return None
+    for w, url in entries:
+        if w >= width:
+            return url
+    return entries[-1][1]
+
+
+# ---------- CLI ----------
+def register_image_cli(app) -> None:
+    @app.cli.command("build-image-derivatives")
+    @click.argument("paths", nargs=-1)
+    @click.option("--workers", type=int, default=None, help="Encoder processes (default: CPU count).")
+    @click.option("--force", is_flag=True, help="Re-encode even when derivatives are up to date.")
+    @click.option("--no-record", is_flag=True, help="Only write files; do not touch the database.")
+    def build_image_derivatives_command(paths, workers, force, no_record):
+        """Build AVIF/WebP/JPEG width derivatives (default: everything under images/ and uploads/content/)."""
+        sources = list(paths) or discover_sources()
+        started = time.monotonic()
+        results = generate_derivatives(sources, workers=workers, force=force)
+        if not no_record:
+            record_derivatives(results)
+        failed = [r for r in results if r["error"]]
+        for r in failed:
+            click.echo(f"failed: {r['source']}: {r['error']}", err=True)
+        click.echo(f"built {sum(len(r['derivatives']) for r in results)} derivative(s) for "
+                   f"{len(results) - len(failed)} image(s) in {time.monotonic() - started:.1f}s "
+                   f"[{', '.join(available_formats())}]")
@@ -1,13 +1,16 @@
 # app/models.py
 from flask import current_app
 from . import db
-from datetime import datetime
+from datetime import date, datetime
 
 
 class Brand(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String, unique=True, nullable=False)
     description = db.Column(db.String)
+    # watermark for HTTP caching of /api/brands (see app/http_cache.py)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow,
+                           onupdate=datetime.utcnow, index=True)
 
     @property
     def logo_url(self):
@@ -39,6 +42,9 @@ class Product(db.Model):
     # the migration, this column is nullable=True here. After migration you may set
     # nullable=False if desired.
     code = db.Column(db.String(32), unique=True, index=True, nullable=True)
+    # watermark for HTTP caching of the product APIs (see app/http_cache.py)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow,
+                           onupdate=datetime.utcnow, index=True)
 
     @property
     def image_url_dynamic(self):
@@ -82,6 +88,8 @@ class HomepageProduct(db.Model):
         'product.id'), nullable=False)
     sort_order = db.Column(db.Integer, default=0)
     visible = db.Column(db.Boolean, default=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow,
+                           onupdate=datetime.utcnow, index=True)
 
 
 class Coupon(db.Model):
@@ -89,10 +97,14 @@ class Coupon(db.Model):
     description = db.Column(db.String)
     discount_type = db.Column(db.String)
     discount_value = db.Column(db.Float)
-    start_date = db.Column(db.String)
-    end_date = db.Column(db.String)
+    start_date = db.Column(db.Date)
+    end_date = db.Column(db.Date)
     active = db.Column(db.Boolean, default=True)
 
+    __table_args__ = (
+        db.Index("ix_coupon_active_dates", "active", "start_date", "end_date"),
+    )
+
 
 class Order(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -167,6 +179,33 @@ class Setting(db.Model):
         return f"<Setting {self.key}={self.value}>"
 
 
+# -------------------------
+# Stored responses for Idempotency-Key requests (see app/idempotency.py)
+# -------------------------
+class IdempotencyKey(db.Model):
+    """
+    One row per (Idempotency-Key, request fingerprint). While the first request runs the row
+    is 'in_progress'; afterwards it holds the response so retries are answered from here.
+    """
+    __tablename__ = "idempotency_key"
+    __table_args__ = (
+        db.UniqueConstraint("key", "fingerprint", name="uq_idempotency_key_key_fingerprint"),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(255), nullable=False)
+    # sha256 of method + path + request body
+    fingerprint = db.Column(db.String(64), nullable=False)
+    state = db.Column(db.String(16), nullable=False, default="in_progress")
+    response_status = db.Column(db.Integer, nullable=True)
+    response_body = db.Column(db.Text, nullable=True)
+    content_type = db.Column(db.String(128), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f"<IdempotencyKey {self.key} {self.state} {self.response_status}>"
+
+
 # -------------------------
 # Story model for content backend (updated with 'section' and 'position')
 # -------------------------
@@ -181,6 +220,9 @@ class Story(db.Model):
       - section: optional grouping (e.g. 'history', 'about')
       - excerpt: short summary used in lists
       - body_html: HTML content stored as text (produced by the WYSIWYG editor)
+      - body_rendered: sanitized, post-processed body_html served to the public
+        (written at save time by app/story_render.py)
+      - reading_minutes: estimated reading time of the body
       - author: author name
       - featured_image: stored path (uploads/content/...), or absolute URL
       - published: boolean flag for public visibility
@@ -195,6 +237,8 @@ class Story(db.Model):
     section = db.Column(db.String(64), nullable=True)
     excerpt = db.Column(db.Text, nullable=True)
     body_html = db.Column(db.Text, nullable=True)
+    body_rendered = db.Column(db.Text, nullable=True)
+    reading_minutes = db.Column(db.Integer, nullable=True)
     author = db.Column(db.String(120), nullable=True)
     # stored relative path like 'uploads/content/filename.jpg' or absolute URL
     featured_image = db.Column(db.String, nullable=True)
@@ -205,10 +249,11 @@ class Story(db.Model):
     updated_at = db.Column(
         db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
-    def to_public_dict(self):
+    def to_public_dict(self, include_body=True):
         """
         Return the public-facing JSON representation used by the content API.
-        Normalize featured_image to a browser URL.
+        Normalize featured_image to a browser URL. body_html is the rendered body
+        (see app/story_render.py); list endpoints pass include_body=False.
         """
         img_url = None
         if self.featured_image:
@@ -220,13 +265,13 @@ class Story(db.Model):
                     img_url = self.featured_image
                 else:
                     img_url = f"/static/{self.featured_image.lstrip('/')}"
-        return {
+        data = {
             "id": self.id,
             "title": self.title,
             "slug": self.slug,
             "section": self.section or "",
             "excerpt": self.excerpt or "",
-            "body_html": self.body_html or "",
+            "reading_minutes": self.reading_minutes,
             "author": self.author or "",
             "featured_image": img_url,
             "published": bool(self.published),
@@ -235,11 +280,45 @@ class Story(db.Model):
             "created_at": self.created_at.isoformat() if self.created_at else None,
             "updated_at": self.updated_at.isoformat() if self.updated_at else None,
         }
+        if include_body:
+            body = self.body_rendered
+            if body is None:
+                # saved before save-time rendering existed; `flask render-stories` backfills
+                from .story_render import render_story_body
+                body, _words, minutes = render_story_body(self.body_html)
+                data["reading_minutes"] = minutes
+            data["body_html"] = body
+        return data
 
     def __repr__(self):
         return f"<Story {self.id} {self.slug} section={self.section} published={self.published} pos={self.position}>"
 
 
+def _not_postgresql(ddl, target, bind, dialect=None, **kw):
+    return dialect is None or dialect.name != "postgresql"
+
+
+def _story_listing_indexes(name, *leading):
+    """
+    Index matching the public story listings: equality on `leading`, then the listing order
+    position desc, published_at desc nulls last, created_at desc, so the first page is read
+    off the index instead of sorting every published story. Postgres puts NULLs first in a
+    DESC index, hence its own variant; SQLite/MySQL reject NULLS LAST in an index but
+    already sort NULLs last for DESC.
+    """
+    t = Story.__table__
+    db.Index(name, *leading, t.c.position.desc(), t.c.published_at.desc().nulls_last(),
+             t.c.created_at.desc()).ddl_if(dialect="postgresql")
+    db.Index(name, *leading, t.c.position.desc(), t.c.published_at.desc(),
+             t.c.created_at.desc()).ddl_if(callable_=_not_postgresql)
+
+
+# /stories?section=..., section pages, /pages/<section> fallback
+_story_listing_indexes("ix_story_published_section_position", Story.published, Story.section)
+# /stories without a section
+_story_listing_indexes("ix_story_published_position", Story.published)
+
+
 def seed_data():
     # Avoid duplicate seeding
     if Brand.query.count() == 0:
@@ -302,8 +381,8 @@ def seed_data():
                 description="10% off for new customers",
                 discount_type="percent",
                 discount_value=10.0,
-                start_date="2025-09-01",
-                end_date="2025-12-31",
+                start_date=date(2025, 9, 1),
+                end_date=date(2025, 12, 31),
                 active=True
             ),
             Coupon(
@@ -311,8 +390,8 @@ def seed_data():
                 description="25 USD off Fall Sale",
                 discount_type="fixed",
                 discount_value=25.0,
-                start_date="2025-09-15",
-                end_date="2025-10-15",
+                start_date=date(2025, 9, 15),
+                end_date=date(2025, 10, 15),
                 active=True
             ),
         ]
@@ -347,3 +426,30 @@ def seed_data():
         ]
         db.session.bulk_save_objects(orders)
         db.session.commit()
+
+
+# -------------------------
+# Resized/re-encoded copies of static images (see app/image_pipeline.py)
+# -------------------------
+class ImageDerivative(db.Model):
+    """
+    One row per (source image, width, format). source_path and path are relative to
+    app/static, e.g. 'images/creed/aventus.jpg' -> 'derived/images/creed/aventus-320w.webp'.
+    """
+    __tablename__ = "image_derivative"
+    __table_args__ = (
+        db.UniqueConstraint("source_path", "width", "format",
+                            name="uq_image_derivative_source_width_format"),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    source_path = db.Column(db.String(512), nullable=False, index=True)
+    format = db.Column(db.String(8), nullable=False)
+    width = db.Column(db.Integer, nullable=False)
+    height = db.Column(db.Integer, nullable=False)
+    path = db.Column(db.String(512), nullable=False)
+    bytes = db.Column(db.Integer, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow,
+                           onupdate=datetime.utcnow, index=True)
+
+    def __repr__(self):
+        return f"<ImageDerivative {self.path} {self.width}x{self.height}>"
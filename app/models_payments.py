@@ -1,11 +1,17 @@
 from __future__ import annotations
 
+import logging
 from datetime import datetime
 from decimal import Decimal
-from typing import Optional
+from typing import Any, Dict, Optional
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import validates
 
 from . import db  # assumes your package-level db = SQLAlchemy() in app/__init__.py
 
+logger = logging.getLogger(__name__)
+
 
 class Order(db.Model):
     __tablename__ = "orders"
@@ -33,12 +39,137 @@ class Order(db.Model):
         return f"<Order id={self.id} order_number={self.order_number} status={self.status}>"
 
 
+class OrderLedger(db.Model):
+    """
+    Single ledger of every order the shop has taken, regardless of checkout path.
+
+    One row is written per COD order (models.Order, table "order") and per PayPal
+    order (models_payments.Order, table "orders"); (source, source_order_id) points
+    back at the originating row. Revenue reporting reads this table only, and
+    payments join to it through Payment.ledger so listings can eager-load it.
+    """
+    __tablename__ = "order_ledger"
+    __table_args__ = (
+        db.UniqueConstraint("source", "source_order_id",
+                            name="uq_order_ledger_source_order"),
+        db.Index("ix_order_ledger_provider_created_at",
+                 "provider", "created_at"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    # 'cod' -> table "order", 'paypal' -> table "orders"
+    source = db.Column(db.String(16), nullable=False)
+    source_order_id = db.Column(db.Integer, nullable=False)
+    order_number = db.Column(db.String(64), index=True)
+    # 'cod', 'paypal', 'card', ...
+    provider = db.Column(db.String(50), nullable=False, index=True)
+    customer_name = db.Column(db.String(255))
+    customer_email = db.Column(db.String(255))
+    total_amount = db.Column(db.Numeric(12, 2), nullable=False, default=0.00)
+    currency = db.Column(db.String(8), nullable=False, default="USD")
+    # lower-cased status of the originating order (pending, paid, delivered, ...)
+    status = db.Column(db.String(40), nullable=False,
+                       default="pending", index=True)
+    created_at = db.Column(
+        db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow,
+                           onupdate=datetime.utcnow, nullable=False)
+
+    payments = db.relationship("Payment", back_populates="ledger")
+
+    def to_summary_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "source": self.source,
+            "order_number": self.order_number,
+            "customer_name": self.customer_name,
+            "customer_email": self.customer_email,
+            "status": self.status,
+            "total_amount": str(self.total_amount) if self.total_amount is not None else None,
+            "currency": self.currency,
+        }
+
+    def __repr__(self) -> str:
+        return f"<OrderLedger id={self.id} source={self.source}:{self.source_order_id} status={self.status}>"
+
+
+def record_ledger_entry(source: str, source_order_id: int, **fields) -> OrderLedger:
+    """
+    Insert or update the ledger row for (source, source_order_id) and add it to the session.
+    The caller owns the commit. `status` is normalized to lower case.
+    """
+    entry = OrderLedger.query.filter_by(
+        source=source, source_order_id=source_order_id).first()
+    if entry is None:
+        entry = OrderLedger(source=source, source_order_id=source_order_id)
+        fields.setdefault("provider", source)
+    for key, value in fields.items():
+        if key == "status" and value is not None:
+            value = str(value).strip().lower()
+        setattr(entry, key, value)
+    db.session.add(entry)
+    return entry
+
+
+# Canonical Payment.status values. Writes are normalized through normalize_payment_status()
+# so filters can use indexed equality / IN lookups instead of ILIKE scans.
+PAYMENT_STATUSES = (
+    "created",
+    "pending",
+    "completed",
+    "declined",
+    "failed",
+    "on_hold",
+    "disputed",
+    "settled",
+    "refund_pending",
+    "partially_refunded",
+    "refunded",
+)
+
+_PAYMENT_STATUS_ALIASES = {
+    "hold": "on_hold",
+    "held": "on_hold",
+    "onhold": "on_hold",
+    "dispute": "disputed",
+    "disput": "disputed",
+    "review": "disputed",
+    "rejected": "settled",
+    "reject": "settled",
+    "rejected_settled": "settled",
+    "refund": "refunded",
+    "partial_refund": "partially_refunded",
+    "captured": "completed",
+    "paid": "completed",
+}
+
+
+def normalize_payment_status(value: Optional[str]) -> Optional[str]:
+    """
+    Map provider/admin status strings onto PAYMENT_STATUSES
+    ('COMPLETED' -> 'completed', 'on hold' -> 'on_hold', 'refund' -> 'refunded').
+    Unknown values are kept (lower-cased, underscored) rather than dropped.
+    """
+    if value is None:
+        return None
+    key = str(value).strip().lower().replace("-", "_").replace(" ", "_")
+    if not key:
+        return None
+    return _PAYMENT_STATUS_ALIASES.get(key, key)
+
+
 class Payment(db.Model):
     __tablename__ = "payments"
+    __table_args__ = (
+        # serves duration-bounded listings and the per-status summary GROUP BY
+        db.Index("ix_payments_created_at_status", "created_at", "status"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     order_id = db.Column(db.Integer, db.ForeignKey(
         "orders.id"), nullable=True, index=True)
+    ledger_id = db.Column(db.Integer, db.ForeignKey(
+        "order_ledger.id"), nullable=True, index=True)
     # 'paypal', 'stripe', etc.
     provider = db.Column(db.String(50), nullable=False, default="paypal")
     provider_order_id = db.Column(
@@ -46,9 +177,12 @@ class Payment(db.Model):
     provider_capture_id = db.Column(
         db.String(128), index=True)  # PayPal capture id
     amount = db.Column(db.Numeric(12, 2), nullable=False, default=0.00)
+    # money actually returned so far (completed refunds only; see record_refund)
+    refunded_amount = db.Column(db.Numeric(12, 2), nullable=False, default=0, server_default="0")
     currency = db.Column(db.String(8), nullable=False, default="USD")
-    # created, completed, failed, refunded
-    status = db.Column(db.String(40), nullable=False, default="created")
+    # one of PAYMENT_STATUSES (see normalize_payment_status)
+    status = db.Column(db.String(40), nullable=False,
+                       default="created", index=True)
     payer_name = db.Column(db.String(255))
     payer_email = db.Column(db.String(255))
     payer_id = db.Column(db.String(128))
@@ -59,26 +193,264 @@ class Payment(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow,
                            onupdate=datetime.utcnow, nullable=False)
 
+    ledger = db.relationship("OrderLedger", back_populates="payments")
+    # audit trail; kept out of raw_response so this row stays small
+    admin_actions = db.relationship(
+        "PaymentAdminAction", lazy="dynamic", order_by="PaymentAdminAction.created_at")
+
+    @validates("status")
+    def _normalize_status(self, key, value):
+        return normalize_payment_status(value) or "created"
+
     def amount_decimal(self) -> Decimal:
         try:
             return Decimal(str(self.amount or "0"))
         except Exception:
             return Decimal("0")
 
+    def refunded_decimal(self) -> Decimal:
+        try:
+            return Decimal(str(self.refunded_amount or "0"))
+        except Exception:
+            return Decimal("0")
+
     def __repr__(self) -> str:
         return f"<Payment id={self.id} provider={self.provider} amount={self.amount} status={self.status}>"
 
 
+class PaymentDailyRollup(db.Model):
+    """
+    Per-day payment totals keyed by (day, status, currency), where day is the UTC date of
+    Payment.created_at. Maintained incrementally by record_payment_rollup(),
+    set_payment_status() and record_refund() so long-range dashboard summaries never scan
+    the payments table. refunded_total is the sum of Payment.refunded_amount in the bucket.
+    """
+    __tablename__ = "payment_daily_rollup"
+
+    day = db.Column(db.Date, primary_key=True)
+    status = db.Column(db.String(40), primary_key=True)
+    currency = db.Column(db.String(8), primary_key=True)
+    payment_count = db.Column(db.Integer, nullable=False, default=0)
+    amount_total = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    refunded_total = db.Column(db.Numeric(14, 2), nullable=False, default=0, server_default="0")
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow,
+                           onupdate=datetime.utcnow, nullable=False)
+
+    def __repr__(self) -> str:
+        return f"<PaymentDailyRollup {self.day} {self.status} {self.currency} n={self.payment_count} sum={self.amount_total}>"
+
+
+def _bump_payment_rollup(created_at: Optional[datetime], status: str, currency: str, count_delta: int, amount_delta: Decimal,
+                         refunded_delta: Decimal = Decimal("0")) -> None:
+    """
+    Add deltas to one rollup row inside a SAVEPOINT: UPDATE first, INSERT when the row is
+    missing, and fall back to UPDATE if a concurrent writer inserted it first.
+    """
+    tbl = PaymentDailyRollup.__table__
+    day = (created_at or datetime.utcnow()).date()
+    currency = currency or "USD"
+    now = datetime.utcnow()
+    key = (tbl.c.day == day) & (tbl.c.status == status) & (tbl.c.currency == currency)
+    update_stmt = tbl.update().where(key).values(
+        payment_count=tbl.c.payment_count + count_delta,
+        amount_total=tbl.c.amount_total + amount_delta,
+        refunded_total=tbl.c.refunded_total + refunded_delta,
+        updated_at=now)
+
+    with db.session.begin_nested():
+        if db.session.execute(update_stmt).rowcount:
+            return
+    try:
+        with db.session.begin_nested():
+            db.session.execute(tbl.insert().values(
+                day=day, status=status, currency=currency,
+                payment_count=count_delta, amount_total=amount_delta, refunded_total=refunded_delta,
+                updated_at=now))
+    except IntegrityError:
+        with db.session.begin_nested():
+            db.session.execute(update_stmt)
+
+
+def record_payment_rollup(payment: "Payment", sign: int = 1) -> None:
+    """
+    Count a newly flushed payment (sign=1) or remove it (sign=-1) from the daily rollup.
+    Best-effort: failures are logged and never block the payment write itself.
+    """
+    try:
+        _bump_payment_rollup(payment.created_at, payment.status, payment.currency,
+                             sign, sign * payment.amount_decimal(), sign * payment.refunded_decimal())
+    except Exception:
+        logger.exception("Failed to update payment rollup for payment %s",
+                         getattr(payment, "id", None))
+
+
+def set_payment_status(payment: "Payment", new_status: str) -> None:
+    """
+    Change payment.status and move its amount (and refunded amount) between daily rollup
+    buckets in the same transaction. The caller commits.
+    """
+    new_status = normalize_payment_status(new_status) or "created"
+    old_status = payment.status
+    if old_status == new_status:
+        return
+    if payment.id is not None:
+        try:
+            amount = payment.amount_decimal()
+            refunded = payment.refunded_decimal()
+            with db.session.begin_nested():
+                _bump_payment_rollup(payment.created_at, old_status,
+                                     payment.currency, -1, -amount, -refunded)
+                _bump_payment_rollup(payment.created_at, new_status,
+                                     payment.currency, 1, amount, refunded)
+        except Exception:
+            logger.exception("Failed to move payment %s between rollup buckets (%s -> %s)",
+                             payment.id, old_status, new_status)
+    payment.status = new_status
+
+
+def record_refund(payment: "Payment", amount: Optional[Decimal], refund_id: Optional[str] = None) -> bool:
+    """
+    Count a completed refund (money returned to the payer): add it to
+    payment.refunded_amount and the rollup, and set the status to refunded or
+    partially_refunded from the running total. amount=None means the rest of the payment.
+    refund_id (PayPal's refund id) makes this idempotent, so the admin refund call and
+    PayPal's PAYMENT.CAPTURE.REFUNDED webhook for the same refund count it once. Returns
+    False when that refund was already counted. The caller commits.
+    """
+    raw = payment.raw_response if payment.raw_response is not None else {}
+    raw = raw if isinstance(raw, dict) else None  # legacy text payloads: no id bookkeeping
+    counted = list((raw or {}).get("_refunds_counted") or [])
+    if refund_id and str(refund_id) in counted:
+        return False
+
+    gross = payment.amount_decimal()
+    already = payment.refunded_decimal()
+    remaining = max(gross - already, Decimal("0"))
+    amount = remaining if amount is None else min(max(Decimal(str(amount)), Decimal("0")), remaining)
+    set_payment_status(payment, "refunded" if already + amount >= gross else "partially_refunded")
+    if amount:
+        payment.refunded_amount = already + amount
+        if payment.id is not None:
+            try:
+                with db.session.begin_nested():
+                    _bump_payment_rollup(payment.created_at, payment.status, payment.currency,
+                                         0, Decimal("0"), amount)
+            except Exception:
+                logger.exception("Failed to add refund of %s to the rollup for payment %s", amount, payment.id)
+    if refund_id and raw is not None:
+        # copy before mutating: in-place changes to a JSON column are not flushed
+        payment.raw_response = {**raw, "_refunds_counted": counted + [str(refund_id)]}
+    return True
+
+
+class PaymentAdminAction(db.Model):
+    """
+    Append-only audit trail of payments-admin actions (hold, review, settle, refund attempts).
+    One row is INSERTed per action; rows are never updated, so concurrent actions on the same
+    payment cannot overwrite each other and the payments row itself does not grow.
+    """
+    __tablename__ = "payment_admin_action"
+    __table_args__ = (
+        # per-payment history in chronological order
+        db.Index("ix_payment_admin_action_payment_created_at",
+                 "payment_id", "created_at"),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    payment_id = db.Column(db.Integer, db.ForeignKey(
+        "payments.id"), nullable=False)
+    action = db.Column(db.String(40), nullable=False, index=True)
+    actor_username = db.Column(db.String(80))
+    actor_role = db.Column(db.String(64))
+    refund_amount = db.Column(db.Numeric(12, 2))
+    refund_percent = db.Column(db.Numeric(5, 2))
+    note = db.Column(db.Text)
+    # 'no_capture_id', 'paypal_refund_failed', ... (None on success)
+    error = db.Column(db.String(64))
+    warning = db.Column(db.String(128))
+    # provider error payload or exception text for failed attempts
+    detail = db.Column(db.JSON(none_as_null=True))
+    created_at = db.Column(
+        db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+
+    @classmethod
+    def from_record(cls, payment_id: int, record: Dict[str, Any]) -> "PaymentAdminAction":
+        """Build a row from the legacy action-record dict shape used by the admin routes."""
+        actor = record.get("actor") or {}
+        created_at = None
+        ts = record.get("timestamp")
+        if ts:
+            try:
+                created_at = datetime.fromisoformat(str(ts).replace("Z", "+00:00")).replace(tzinfo=None)
+            except Exception:
+                created_at = None
+        return cls(
+            payment_id=payment_id,
+            action=str(record.get("action") or "unknown")[:40],
+            actor_username=actor.get("username") if isinstance(actor, dict) else str(actor),
+            actor_role=actor.get("role") if isinstance(actor, dict) else None,
+            refund_amount=record.get("refund_amount"),
+            refund_percent=record.get("refund_percent"),
+            note=record.get("note") or None,
+            error=record.get("error"),
+            warning=record.get("warning"),
+            detail=record.get("detail"),
+            created_at=created_at or datetime.utcnow(),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Same shape as the records formerly kept in raw_response['_admin_actions']."""
+        data: Dict[str, Any] = {
+            "id": self.id,
+            "timestamp": self.created_at.isoformat() if self.created_at else None,
+            "actor": {"username": self.actor_username, "role": self.actor_role},
+            "action": self.action,
+            "refund_amount": float(self.refund_amount) if self.refund_amount is not None else None,
+            "refund_percent": float(self.refund_percent) if self.refund_percent is not None else None,
+            "note": self.note,
+        }
+        for key in ("error", "warning", "detail"):
+            value = getattr(self, key)
+            if value is not None:
+                data[key] = value
+        return data
+
+    def __repr__(self) -> str:
+        return f"<PaymentAdminAction id={self.id} payment_id={self.payment_id} action={self.action}>"
+
+
+# PayPalWebhookEvent.status lifecycle: pending -> processing -> done | dead
+WEBHOOK_STATUSES = ("pending", "processing", "done", "dead")
+
+
 class PayPalWebhookEvent(db.Model):
+    """
+    Durable webhook inbox. /paypal/webhook only INSERTs here (event_id is unique, so PayPal
+    redeliveries are dropped); app.paypal_webhooks verifies and applies rows in batches.
+    """
     __tablename__ = "paypal_webhook_events"
+    __table_args__ = (
+        # the processor's claim query: pending rows that are due
+        db.Index("ix_paypal_webhook_events_status_next_attempt",
+                 "status", "next_attempt_at"),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
-    event_id = db.Column(db.String(128), index=True, nullable=False)
+    event_id = db.Column(db.String(128), index=True,
+                         unique=True, nullable=False)
     event_type = db.Column(db.String(128), index=True)
     raw_event = db.Column(db.JSON)
     headers = db.Column(db.JSON)
     received_at = db.Column(
         db.DateTime, default=datetime.utcnow, nullable=False)
+    status = db.Column(db.String(16), nullable=False, default="pending")
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # set while a processor holds the row; stale locks are reclaimed
+    locked_at = db.Column(db.DateTime)
+    locked_by = db.Column(db.String(64))
+    processed_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
 
     def __repr__(self) -> str:
         return f"<PayPalWebhookEvent id={self.id} event_id={self.event_id} type={self.event_type}>"
@@ -0,0 +1,196 @@
+"""
+app/page_cache.py
+
+Rendered-HTML cache for the public page routes.
+
+    @bp.route('/brands')
+    @cached_page(ttl=300, groups=("catalog",))
+    def brands(): ...
+
+The first anonymous GET renders the page as usual. The HTML is stored once as identity,
+gzip and (when the optional `brotli` package is installed) brotli bytes, at the levels
+app/compression.py uses for dynamic responses (COMPRESS_GZIP_LEVEL, COMPRESS_BROTLI_QUALITY). Later hits are
+answered from memory in the best encoding the client accepts, with `Vary: Accept-Encoding`
+and `X-Page-Cache: HIT`. No Jinja, no DB.
+
+Entries are keyed by endpoint + view args + the query parameters the page declares with
+`args=` + the version of every data group the page depends on. Other query parameters
+(tracking tags, cache busters) do not change the page and are left out of the key, so they
+can neither split one page into many entries nor push other pages out of the LRU. Commits that touch a group's tables bump its version through a
+SQLAlchemy after_commit hook, so a page is re-rendered after the next catalog or story
+write in this worker; other workers pick the change up when the entry's TTL runs out.
+
+A page built from one row can instead pass `key=`, a callable taking the view arguments and
+returning a cheap freshness token such as (slug, updated_at). The token is part of the
+entry key, so every worker re-renders as soon as the row changes, and writes to other rows
+leave the page alone. A token of None (e.g. no such row) skips the cache.
+Requests from a logged-in session, and non-200 responses, are never cached.
+
+Tuning (environment): PAGE_CACHE_ENABLED (1), PAGE_CACHE_MAX_ENTRIES (512).
+"""
+from __future__ import annotations
+import gzip
+import os
+import threading
+import time
+import logging
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+from flask import make_response, request, session, Response
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from .compression import BROTLI_QUALITY, GZIP_LEVEL
+
+try:
+    import brotli  # type: ignore
+except Exception:  # optional dependency
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+ENABLED = (os.environ.get("PAGE_CACHE_ENABLED", "1").lower() not in ("0", "false", "no"))
+MAX_ENTRIES = int(os.environ.get("PAGE_CACHE_MAX_ENTRIES", "512"))
+
+# data groups -> tables whose writes invalidate pages in that group
+GROUP_TABLES: Dict[str, Tuple[str, ...]] = {
+    "catalog": ("product", "brand", "homepage_product", "image_derivative"),
+    "content": ("story",),
+}
+_TABLE_GROUPS = {t: g for g, tables in GROUP_TABLES.items() for t in tables}
+
+_versions: Dict[str, int] = {g: 0 for g in GROUP_TABLES}
+_lock = threading.Lock()
+_entries: "OrderedDict[tuple, _Entry]" = OrderedDict()
+_stats = {"hits": 0, "misses": 0}
+
+
+class _Entry:
+    __slots__ = ("expires", "mimetype", "bodies")
+
+    def __init__(self, expires: float, mimetype: str, html: bytes):
+        self.expires = expires
+        self.mimetype = mimetype
+        self.bodies = {"identity": html, "gzip": gzip.compress(html, compresslevel=GZIP_LEVEL)}
+        if brotli is not None:
+            self.bodies["br"] = brotli.compress(html, quality=BROTLI_QUALITY)
+
+
+def invalidate_pages(*groups: str) -> None:
+    """Bump the version of the given groups (all when none given), orphaning their pages."""
+    with _lock:
+        for g in groups or tuple(_versions):
+            _versions[g] = _versions.get(g, 0) + 1
+        if not groups:
+            _entries.clear()
+
+
+def page_cache_stats() -> Dict[str, int]:
+    with _lock:
+        return {**_stats, "entries": len(_entries), **{f"version_{g}": v for g, v in _versions.items()}}
+
+
+# ---------- invalidation hooks ----------
+@event.listens_for(Session, "after_flush")
+def _collect_dirty_groups(session, flush_context):
+    touched = session.info.setdefault("page_cache_groups", set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        table = getattr(getattr(obj, "__table__", None), "name", None)
+        group = _TABLE_GROUPS.get(table)
+        if group:
+            touched.add(group)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _collect_bulk_writes(orm_execute_state):
+    # query.update()/delete() bypass the flush
+    if orm_execute_state.is_update or orm_execute_state.is_delete:
+        mapper = orm_execute_state.bind_mapper
+        group = _TABLE_GROUPS.get(getattr(getattr(mapper, "local_table", None), "name", None))
+        if group:
+            orm_execute_state.session.info.setdefault("page_cache_groups", set()).add(group)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_after_commit(session):
+    groups = session.info.pop("page_cache_groups", None)
+    if groups:
+        invalidate_pages(*groups)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_rollback(session):
+    session.info.pop("page_cache_groups", None)
+
+
+# ---------- serving ----------
+def _pick_encoding(entry: _Entry) -> str:
+    accepted = request.accept_encodings
+    if "br" in entry.bodies and accepted["br"]:
+        return "br"
+    if accepted["gzip"]:
+        return "gzip"
+    return "identity"
+
+
+def _serve(entry: _Entry, state: str) -> Response:
+    encoding = _pick_encoding(entry)
+    resp = Response(entry.bodies[encoding], status=200, mimetype=entry.mimetype)
+    if encoding != "identity":
+        resp.headers["Content-Encoding"] = encoding
+    resp.vary.add("Accept-Encoding")
+    resp.headers["X-Page-Cache"] = state
+    return resp
+
+
+def cached_page(ttl: int = 300, groups: Iterable[str] = (), key: Optional[Callable[..., Any]] = None,
+                args: Iterable[str] = ()):
+    """
+    Decorator: cache the rendered page for anonymous GETs (see module docstring). args names
+    the query parameters the view reads; only those are part of the cache key.
+    """
+    groups = tuple(groups)
+    arg_names = tuple(sorted(args))
+    key_func = key
+
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            if not ENABLED or request.method not in ("GET", "HEAD") or session.get("user"):
+                return f(*args, **kwargs)
+            token = None
+            if key_func is not None:
+                token = key_func(**kwargs)
+                if token is None:
+                    return f(*args, **kwargs)
+            key = (request.endpoint, tuple(sorted(kwargs.items())),
+                   tuple((name, tuple(request.args.getlist(name))) for name in arg_names),
+                   tuple(_versions.get(g, 0) for g in groups), token)
+            now = time.monotonic()
+            with _lock:
+                entry = _entries.get(key)
+                if entry is not None and entry.expires > now:
+                    _entries.move_to_end(key)
+                    _stats["hits"] += 1
+                    return _serve(entry, "HIT")
+                _stats["misses"] += 1
+
+            resp = make_response(f(*args, **kwargs))
+            if resp.status_code != 200 or resp.direct_passthrough or resp.is_streamed \
+                    or resp.mimetype != "text/html":
+                return resp
+            try:
+                entry = _Entry(now + ttl, resp.mimetype, resp.get_data())
+            except Exception:
+                logger.exception("page cache: failed to store %s", request.path)
+                return resp
+            with _lock:
+                _entries[key] = entry
+                _entries.move_to_end(key)
+                while len(_entries) > MAX_ENTRIES:
+                    _entries.popitem(last=False)
+            return _serve(entry, "MISS")
+        return wrapper
+    return decorator
@@ -9,23 +9,32 @@ Features:
 - /paypal/capture-paypal-order  (POST) -> capture order server-side and persist Payment + Order
 - /paypal/return                (GET)  -> PayPal redirect handler (captures if needed and shows simple page)
 - /paypal/cancel                (GET)  -> PayPal canceled flow
-- /paypal/webhook               (POST) -> Accepts webhooks and optionally verifies signature; persists event
+- /paypal/webhook               (POST) -> Queues webhooks durably; verified/applied by app/paypal_webhooks.py
 
 Notes:
 - Assumes `app/models_payments.py` exists with Payment, Order, and PayPalWebhookEvent models
   (the code is defensive if models are not available).
 - Reads PAYPAL_CLIENT_ID, PAYPAL_SECRET, PAYPAL_MODE and optional PAYPAL_WEBHOOK_ID from environment.
 - This file is intended to be registered in create_app() under the prefix "/paypal".
+- The views that call PayPal are `async def` (paypal_client.a* over httpx); database work
+  goes through async_http.run_sync. Under ASGI (asgi.py) they wait on PayPal without
+  holding a thread.
 """
 from __future__ import annotations
+import asyncio
 import os
-import time
 import logging
 from decimal import Decimal, ROUND_HALF_UP
 from typing import Dict, Any, Optional, List
 
-import requests
 from flask import Blueprint, current_app, jsonify, request, render_template_string
+from sqlalchemy.exc import IntegrityError
+
+from .async_http import run_sync
+from .checkout_quote import QuoteError, charge_reference, load_charge_reference, load_quote
+from .db_routing import use_primary
+from .idempotency import idempotent
+from .paypal_client import PayPalClient
 
 paypal_bp = Blueprint("paypal_bp", __name__)
 logger = logging.getLogger(__name__)
@@ -40,86 +49,42 @@ PAYPAL_CURRENCY = os.environ.get("PAYPAL_CURRENCY", "USD")
 
 PAYPAL_BASE = "https://api-m.sandbox.paypal.com" if PAYPAL_MODE == "sandbox" else "https://api-m.paypal.com"
 
-# tiny in-process cache for OAuth token
-_token_cache: Dict[str, Any] = {}
-
 # Attempt to import persistence models (defensive)
 try:
-    from .models_payments import Payment as PaymentModel, Order as PaymentsOrder, PayPalWebhookEvent  # type: ignore
+    from .models_payments import Payment as PaymentModel, Order as PaymentsOrder, PayPalWebhookEvent, record_ledger_entry, record_payment_rollup  # type: ignore
     from . import db  # type: ignore
 except Exception as e:
     logger.debug("payments persistence models not available: %s", e)
     PaymentModel = None
     PaymentsOrder = None
     PayPalWebhookEvent = None
+    record_ledger_entry = None
+    record_payment_rollup = None
     db = None
 
 
-# Utilities
-def _cache_access_token(token: str, expires_in: int) -> None:
-    _token_cache["token"] = token
-    _token_cache["expires_at"] = time.time() + int(expires_in) - 30
-
-
-def _get_cached_token() -> Optional[str]:
-    t = _token_cache.get("token")
-    if not t:
-        return None
-    if time.time() >= _token_cache.get("expires_at", 0):
-        _token_cache.clear()
-        return None
-    return t
+# One pooled client per process: keep-alive connections, retries, OAuth token cache, metrics
+paypal_client = PayPalClient(PAYPAL_BASE, PAYPAL_CLIENT_ID, PAYPAL_SECRET)
 
 
+# Utilities
 def get_paypal_access_token() -> str:
     """
-    Obtain OAuth2 token from PayPal; caches it in memory.
+    Obtain OAuth2 token from PayPal via the shared, single-flight token provider.
     Raises RuntimeError on failure.
     """
-    token = _get_cached_token()
-    if token:
-        return token
-
     if not PAYPAL_CLIENT_ID or not PAYPAL_SECRET:
         logger.error(
             "Missing PayPal credentials (PAYPAL_CLIENT_ID/PAYPAL_SECRET)")
         raise RuntimeError("PayPal credentials not configured on server")
 
-    url = f"{PAYPAL_BASE}/v1/oauth2/token"
     try:
-        r = requests.post(url, auth=(PAYPAL_CLIENT_ID, PAYPAL_SECRET), data={
-                          "grant_type": "client_credentials"}, timeout=15)
-        r.raise_for_status()
-        js = r.json()
-        token = js.get("access_token")
-        expires_in = int(js.get("expires_in", 300))
-        if not token:
-            raise RuntimeError("No access_token returned from PayPal")
-        _cache_access_token(token, expires_in)
-        return token
+        return paypal_client.access_token()
     except Exception as exc:
         logger.exception("Failed to obtain PayPal access token: %s", exc)
         raise RuntimeError("Failed to obtain PayPal access token") from exc
 
 
-def _paypal_get(path: str, token: str) -> Dict[str, Any]:
-    url = f"{PAYPAL_BASE}{path}"
-    headers = {"Authorization": f"Bearer {token}",
-               "Content-Type": "application/json"}
-    r = requests.get(url, headers=headers, timeout=15)
-    r.raise_for_status()
-    return r.json()
-
-
-def _paypal_post(path: str, token: str, payload: Dict[str, Any]) -> Dict[str, Any]:
-    url = f"{PAYPAL_BASE}{path}"
-    headers = {"Authorization": f"Bearer {token}",
-               "Content-Type": "application/json"}
-    r = requests.post(url, headers=headers, json=payload, timeout=20)
-    r.raise_for_status()
-    return r.json()
-
-
 def _currency_safe_decimal(value: str) -> Decimal:
     d = Decimal(str(value))
     return d.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
@@ -134,6 +99,7 @@ def _compute_items_total(items: List[Dict[str, Any]]) -> Decimal:
     return total.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
 
 
+@use_primary()  # runs from GET /paypal/return too: the duplicate check must not read a replica
 def _persist_capture_idempotent(provider_order_id: str, provider_capture_id: Optional[str], capture_resp: Dict[str, Any], amount: Decimal, currency: str, payer_info: Dict[str, Any]) -> Optional[int]:
     """
     Persist capture into PaymentsOrder + PaymentModel idempotently.
@@ -180,10 +146,12 @@ def _persist_capture_idempotent(provider_order_id: str, provider_capture_id: Opt
             raw_response=capture_resp
         )
         db.session.add(payment)
+        db.session.flush()
+        # same transaction as the payment row, so dashboard totals never drift
+        record_payment_rollup(payment)
         db.session.commit()
         logger.info("Persisted payment id %s for capture %s",
                     payment.id, provider_capture_id)
-        return payment.id
     except Exception as exc:
         try:
             db.session.rollback()
@@ -192,6 +160,38 @@ def _persist_capture_idempotent(provider_order_id: str, provider_capture_id: Opt
         logger.exception("Failed to persist PayPal capture: %s", exc)
         return None
 
+    # Separate step so a ledger failure never loses the captured payment.
+    _link_payment_to_ledger(pay_order, payment)
+    return payment.id
+
+
+def _link_payment_to_ledger(pay_order: Any, payment: Any) -> None:
+    """
+    Best-effort: mirror a PaymentsOrder into order_ledger and point the payment at it.
+    """
+    if record_ledger_entry is None:
+        return
+    try:
+        entry = record_ledger_entry(
+            "paypal", pay_order.id,
+            order_number=pay_order.order_number,
+            customer_name=payment.payer_name,
+            customer_email=payment.payer_email,
+            total_amount=pay_order.total_amount,
+            currency=pay_order.currency,
+            status=pay_order.status,
+            created_at=pay_order.created_at)
+        db.session.flush()
+        payment.ledger_id = entry.id
+        db.session.commit()
+    except Exception as exc:
+        try:
+            db.session.rollback()
+        except Exception:
+            pass
+        logger.exception(
+            "Failed to record order ledger entry for payment %s: %s", getattr(payment, "id", None), exc)
+
 
 # --- Blueprint endpoints ---
 
@@ -210,18 +210,26 @@ def paypal_client_config():
 
 
 @paypal_bp.route("/create-paypal-order", methods=["POST"])
-def create_paypal_order():
+@idempotent()
+async def create_paypal_order():
     """
     Create PayPal order server-side. Body:
+      { quote_token, return_url, cancel_url, brand_name }
+    where quote_token comes from POST /api/checkout/quote (amounts are taken from the signed
+    quote as-is), or the legacy form:
       { items: [{title, unit_price, quantity, currency}, ...], currency, return_url, cancel_url, brand_name }
     """
     data = request.get_json(force=True, silent=True) or {}
+    if data.get("quote_token"):
+        try:
+            quote = load_quote(str(data["quote_token"]))
+        except QuoteError as qe:
+            return jsonify({"error": qe.error, "detail": qe.detail}), 400
+        purchase_unit = _purchase_unit_from_quote(quote)
+        return await _create_order_from_purchase_unit(purchase_unit, data)
+
     items = data.get("items") or []
     currency = (data.get("currency") or PAYPAL_CURRENCY or "USD").upper()
-    return_url = data.get("return_url")
-    cancel_url = data.get("cancel_url")
-    brand_name = data.get(
-        "brand_name") or current_app.config.get("SITE_NAME", "")
 
     if not isinstance(items, list) or len(items) == 0:
         return jsonify({"error": "invalid_items", "detail": "items array required"}), 400
@@ -247,7 +255,39 @@ def create_paypal_order():
             },
             "items": paypal_items
         }
+    except Exception as e:
+        logger.exception("Invalid create_paypal_order items: %s", e)
+        return jsonify({"error": "invalid_items", "detail": str(e)}), 400
+    return await _create_order_from_purchase_unit(purchase_unit, data)
+
+
+def _purchase_unit_from_quote(quote: Dict[str, Any]) -> Dict[str, Any]:
+    currency = quote["currency"]
+
+    def amount(value: str) -> Dict[str, str]:
+        return {"currency_code": currency, "value": value}
 
+    breakdown = {"item_total": amount(quote["item_total"]), "shipping": amount(quote["shipping"])}
+    if Decimal(quote["discount"]) > 0:
+        breakdown["discount"] = amount(quote["discount"])
+    purchase_unit = {
+        "amount": {"currency_code": currency, "value": quote["total"], "breakdown": breakdown},
+        "items": [{"name": ln["title"] or ln["id"], "sku": str(ln["id"])[:127],
+                   "unit_amount": amount(ln["unit_price"]), "quantity": str(ln["quantity"])}
+                  for ln in quote["lines"]],
+    }
+    purchase_unit["custom_id"] = charge_reference(quote)
+    return purchase_unit
+
+
+async def _create_order_from_purchase_unit(purchase_unit: Dict[str, Any], data: Dict[str, Any]):
+    import httpx  # deferred: only needed once a PayPal call fails
+
+    return_url = data.get("return_url")
+    cancel_url = data.get("cancel_url")
+    brand_name = data.get(
+        "brand_name") or current_app.config.get("SITE_NAME", "")
+    try:
         order_payload = {
             "intent": "CAPTURE",
             "purchase_units": [purchase_unit],
@@ -258,10 +298,10 @@ def create_paypal_order():
         if cancel_url:
             order_payload["application_context"]["cancel_url"] = cancel_url
 
-        token = get_paypal_access_token()
-        resp = _paypal_post("/v2/checkout/orders", token, order_payload)
+        await asyncio.to_thread(get_paypal_access_token)
+        resp = await paypal_client.acreate_order(order_payload)
         return jsonify(resp)
-    except requests.HTTPError as he:
+    except httpx.HTTPStatusError as he:
         logger.exception("PayPal create order HTTP error: %s", he)
         try:
             return jsonify({"error": "paypal_create_failed", "detail": str(he), "response": he.response.json()}), 502
@@ -273,11 +313,15 @@ def create_paypal_order():
 
 
 @paypal_bp.route("/capture-paypal-order", methods=["POST"])
-def capture_paypal_order():
+@idempotent()
+async def capture_paypal_order():
     """
     Capture PayPal order server-side and persist payment record.
-    Body: { orderID: "ORDERID", items: [...] }  (items optional)
+    Body: { orderID: "ORDERID", items: [...] }  (items optional, checked only for orders
+    created without a quote; quoted orders are checked against the signed total in custom_id)
     """
+    import httpx  # deferred: only needed once a PayPal call fails
+
     data = request.get_json(force=True, silent=True) or {}
     order_id = data.get("orderID") or data.get(
         "order_id") or data.get("orderId")
@@ -287,15 +331,15 @@ def capture_paypal_order():
         return jsonify({"error": "missing_order_id", "detail": "orderID required"}), 400
 
     try:
-        token = get_paypal_access_token()
+        await asyncio.to_thread(get_paypal_access_token)
     except Exception as e:
         logger.exception("Auth failure getting PayPal token: %s", e)
         return jsonify({"error": "auth_failed", "detail": str(e)}), 500
 
     # Fetch order
     try:
-        order = _paypal_get(f"/v2/checkout/orders/{order_id}", token)
-    except requests.HTTPError as he:
+        order = await paypal_client.aget_order(order_id)
+    except httpx.HTTPStatusError as he:
         logger.exception("Failed to fetch PayPal order %s: %s", order_id, he)
         return jsonify({"error": "order_fetch_failed", "detail": str(he)}), 502
     except Exception as e:
@@ -317,8 +361,15 @@ def capture_paypal_order():
         logger.exception("Failed to parse PayPal order %s: %s", order_id, e)
         return jsonify({"error": "invalid_order_data", "detail": str(e)}), 500
 
-    # Optional client validation of items -> totals
-    if items and isinstance(items, list):
+    # Quoted orders: PayPal must be charging exactly the signed quote's total
+    quoted = load_charge_reference(pu0.get("custom_id"))
+    if quoted is not None:
+        if paypal_currency != quoted["currency"].upper() or paypal_value != _currency_safe_decimal(quoted["total"]):
+            logger.warning("Amount mismatch: quote %s %s != paypal %s %s for %s", quoted["total"],
+                           quoted["currency"], paypal_value, paypal_currency, order_id)
+            return jsonify({"error": "amount_mismatch", "detail": "paypal total != quoted total", "quoted_total": quoted["total"], "paypal_total": str(paypal_value)}), 400
+    # Legacy orders (no quote): optional client validation of items -> totals
+    elif items and isinstance(items, list):
         try:
             client_total = _compute_items_total(items)
             if client_total != paypal_value:
@@ -338,8 +389,8 @@ def capture_paypal_order():
             if (c.get("status") or "").upper() == "COMPLETED":
                 capture_id = c.get("id")
                 if PaymentModel is not None:
-                    existing = PaymentModel.query.filter_by(
-                        provider_capture_id=str(capture_id)).first()
+                    existing = await run_sync(lambda: PaymentModel.query.filter_by(
+                        provider_capture_id=str(capture_id)).first())
                     if existing:
                         return jsonify({"status": "already_captured", "order_id": order_id, "capture_id": capture_id, "payment_id": existing.id, "paypal_order": order})
                 break
@@ -349,9 +400,8 @@ def capture_paypal_order():
 
     # Perform capture now
     try:
-        capture_resp = _paypal_post(
-            f"/v2/checkout/orders/{order_id}/capture", token, {})
-    except requests.HTTPError as he:
+        capture_resp = await paypal_client.acapture_order(order_id)
+    except httpx.HTTPStatusError as he:
         logger.exception("PayPal capture HTTP error for %s: %s", order_id, he)
         resp_body = None
         try:
@@ -413,31 +463,34 @@ def capture_paypal_order():
                   "email": payer_email, "payer_id": payer_id}
 
     # Persist idempotently
-    payment_id = _persist_capture_idempotent(
-        provider_order_id, provider_capture_id, capture_resp, amount_decimal, currency_code, payer_info)
+    payment_id = await run_sync(
+        _persist_capture_idempotent, provider_order_id, provider_capture_id, capture_resp, amount_decimal,
+        currency_code, payer_info)
 
     return jsonify({"status": "captured", "order_id": order_id, "capture_id": provider_capture_id, "payment_id": payment_id, "capture_response": capture_resp})
 
 
 @paypal_bp.route("/return", methods=["GET"])
-def paypal_return():
+async def paypal_return():
     """
     Browser return URL for PayPal approval flow.
     """
+    import httpx  # deferred: only needed once a PayPal call fails
+
     order_token = request.args.get("token") or request.args.get("orderID")
     if not order_token:
         logger.warning("PayPal return without token: %s", request.query_string)
         return render_template_string("<h2>Payment return error</h2><p>Missing order token.</p><p><a href='/'>Return to shop</a></p>"), 400
 
     try:
-        token = get_paypal_access_token()
+        await asyncio.to_thread(get_paypal_access_token)
     except Exception as e:
         logger.exception("Failed to get PayPal token on /paypal/return: %s", e)
         return render_template_string("<h2>Payment error</h2><p>Unable to process return right now.</p><p><a href='/'>Return to shop</a></p>"), 500
 
     # Fetch order
     try:
-        order = _paypal_get(f"/v2/checkout/orders/{order_token}", token)
+        order = await paypal_client.aget_order(order_token)
     except Exception as e:
         logger.exception("Failed to fetch PayPal order on return: %s", e)
         return render_template_string("<h2>Payment error</h2><p>Unable to fetch PayPal order.</p><p><a href='/'>Return to shop</a></p>"), 502
@@ -461,9 +514,8 @@ def paypal_return():
 
     # Attempt server-side capture
     try:
-        capture_resp = _paypal_post(
-            f"/v2/checkout/orders/{order_token}/capture", token, {})
-    except requests.HTTPError as he:
+        capture_resp = await paypal_client.acapture_order(order_token)
+    except httpx.HTTPStatusError as he:
         logger.exception(
             "Capture failed on /paypal/return for %s: %s", order_token, he)
         try:
@@ -494,8 +546,9 @@ def paypal_return():
         payer = capture_resp.get("payer", {}) or {}
         payer_info = {"name": None, "email": payer.get("email_address") or payer.get(
             "email"), "payer_id": payer.get("payer_id")}
-        payment_id = _persist_capture_idempotent(
-            provider_order_id, provider_capture_id, capture_resp, amount_decimal, currency_code, payer_info)
+        payment_id = await run_sync(
+            _persist_capture_idempotent, provider_order_id, provider_capture_id, capture_resp, amount_decimal,
+            currency_code, payer_info)
     except Exception:
         payment_id = None
 
@@ -524,52 +577,48 @@ def paypal_cancel():
 
 
 @paypal_bp.route("/webhook", methods=["POST"])
-def paypal_webhook():
+async def paypal_webhook():
     """
-    Receive PayPal webhook events. If PAYPAL_WEBHOOK_ID is configured, attempt verification.
-    Persist event into PayPalWebhookEvent model if available.
+    Receive PayPal webhook events. Only stores the event (deduplicated on event_id) and
+    returns 200; signature verification and applying the event happen in the background
+    (see app/paypal_webhooks.py), so slow PayPal calls never hold up the delivery.
     """
     event_body = request.get_json(force=True, silent=True) or {}
-    headers = dict(request.headers)
+    event_id = str(event_body.get("id") or "").strip()
+    if not event_id:
+        return jsonify({"error": "missing_event_id"}), 400
+    if PayPalWebhookEvent is None or db is None:
+        # non-2xx so PayPal redelivers once persistence is available
+        return jsonify({"error": "webhook_store_unavailable"}), 503
 
-    logger.info("Received PayPal webhook event_type=%s id=%s",
-                event_body.get("event_type"), event_body.get("id"))
+    # only the PayPal-* transmission headers are needed for verification
+    headers = {k: v for k, v in request.headers.items()
+               if k.lower().startswith("paypal-")}
+    return await run_sync(_queue_webhook_event, event_id, event_body, headers)
 
-    # Optional verification
-    if PAYPAL_WEBHOOK_ID:
-        try:
-            token = get_paypal_access_token()
-            verify_payload = {
-                "transmission_id": headers.get("Paypal-Transmission-Id"),
-                "transmission_time": headers.get("Paypal-Transmission-Time"),
-                "cert_url": headers.get("Paypal-Cert-Url"),
-                "auth_algo": headers.get("Paypal-Auth-Algo"),
-                "transmission_sig": headers.get("Paypal-Transmission-Sig"),
-                "webhook_id": PAYPAL_WEBHOOK_ID,
-                "webhook_event": event_body
-            }
-            verify = _paypal_post(
-                "/v1/notifications/verify-webhook-signature", token, verify_payload)
-            if verify.get("verification_status") != "SUCCESS":
-                logger.warning("Webhook verification failed: %s", verify)
-                return jsonify({"error": "verification_failed", "details": verify}), 400
-        except Exception as e:
-            logger.exception("Webhook verification error: %s", e)
-            return jsonify({"error": "webhook_verification_error", "detail": str(e)}), 500
 
-    # Persist webhook event if model available
-    if PayPalWebhookEvent is not None and db is not None:
+def _queue_webhook_event(event_id: str, event_body: Dict[str, Any], headers: Dict[str, str]):
+    try:
+        db.session.add(PayPalWebhookEvent(event_id=event_id[:128], event_type=event_body.get(
+            "event_type"), raw_event=event_body, headers=headers))
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        logger.debug("Duplicate PayPal webhook id=%s ignored", event_id)
+        return jsonify({"status": "duplicate"}), 200
+    except Exception as e:
         try:
-            ev = PayPalWebhookEvent(event_id=event_body.get("id") or "", event_type=event_body.get(
-                "event_type"), raw_event=event_body, headers=headers)
-            db.session.add(ev)
-            db.session.commit()
-            logger.debug("Persisted PayPal webhook id=%s", ev.event_id)
-        except Exception as e:
-            try:
-                db.session.rollback()
-            except Exception:
-                pass
-            logger.exception("Failed to persist PayPal webhook: %s", e)
+            db.session.rollback()
+        except Exception:
+            pass
+        logger.exception("Failed to persist PayPal webhook: %s", e)
+        return jsonify({"error": "webhook_persist_failed"}), 500
 
-    return jsonify({"status": "accepted"}), 200
\ No newline at end of file
+    logger.info("Queued PayPal webhook event_type=%s id=%s",
+                event_body.get("event_type"), event_id)
+    try:
+        from .paypal_webhooks import notify_webhook_worker
+        notify_webhook_worker(current_app._get_current_object())
+    except Exception:
+        logger.exception("Could not wake PayPal webhook worker")
+    return jsonify({"status": "accepted"}), 200
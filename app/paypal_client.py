@@ -0,0 +1,299 @@
+"""
+app/paypal_client.py
+
+Pooled, keep-alive HTTP client for every PayPal REST call (OAuth, orders, captures, refunds,
+webhook verification).
+
+- One requests.Session per process: TCP+TLS connections to api-m.paypal.com are reused
+  across calls instead of being re-established for the token, GET order and POST capture.
+  The session (and the requests import) is created on the first call, not at app startup.
+- Retries with jittered exponential backoff on connection errors and 429/5xx
+  (Retry-After is honoured).
+- POSTs always carry a PayPal-Request-Id so retries (ours or the caller's) are idempotent
+  on PayPal's side.
+- Per-operation latency metrics (count, errors, retries, avg/max ms) via metrics().
+- Async variants (arequest, aget_order, acreate_order, acapture_order) for `async def`
+  views: same retries and metrics over httpx (app/async_http.py), so under ASGI a PayPal
+  call waits on a socket instead of a thread.
+
+Tuning (environment): PAYPAL_POOL_MAXSIZE (10), PAYPAL_MAX_RETRIES (2),
+PAYPAL_BACKOFF_SECONDS (0.25), PAYPAL_CONNECT_TIMEOUT (5).
+"""
+from __future__ import annotations
+import asyncio
+import os
+import random
+import threading
+import time
+import uuid
+import logging
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple
+
+from .async_http import http_client
+from .paypal_token import PayPalTokenProvider, token_store_from_env
+
+if TYPE_CHECKING:
+    import httpx
+    import requests
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class PayPalClient:
+    def __init__(self, base_url: str, client_id: str, secret: str,
+                 pool_maxsize: Optional[int] = None, max_retries: Optional[int] = None,
+                 backoff: Optional[float] = None, connect_timeout: Optional[float] = None,
+                 token_store: Any = None):
+        self.base_url = base_url.rstrip("/")
+        self.client_id = client_id
+        self.secret = secret
+        self.pool_maxsize = pool_maxsize or int(os.environ.get("PAYPAL_POOL_MAXSIZE", "10"))
+        self.max_retries = max_retries if max_retries is not None else int(os.environ.get("PAYPAL_MAX_RETRIES", "2"))
+        self.backoff = backoff if backoff is not None else float(os.environ.get("PAYPAL_BACKOFF_SECONDS", "0.25"))
+        self.connect_timeout = connect_timeout or float(os.environ.get("PAYPAL_CONNECT_TIMEOUT", "5"))
+        self._session: Optional[requests.Session] = None
+        self._session_lock = threading.Lock()
+        self.tokens = PayPalTokenProvider(
+            self._fetch_token, store=token_store if token_store is not None else token_store_from_env())
+        self._metrics: Dict[str, Dict[str, float]] = {}
+        self._metrics_lock = threading.Lock()
+
+    def _new_session(self) -> requests.Session:
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        # retries are handled in _send (needs PayPal-Request-Id awareness), not by urllib3
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=self.pool_maxsize, max_retries=0)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    @property
+    def session(self) -> requests.Session:
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    self._session = self._new_session()
+        return self._session
+
+    def reset(self) -> None:
+        """Drop pooled connections (e.g. in a freshly forked worker)."""
+        with self._session_lock:
+            old, self._session = self._session, None
+        if old is not None:
+            old.close()
+
+    # ---------- metrics ----------
+    def _record(self, op: str, elapsed: float, ok: bool, retries: int) -> None:
+        with self._metrics_lock:
+            m = self._metrics.setdefault(op, {"count": 0, "errors": 0, "retries": 0, "total_ms": 0.0, "max_ms": 0.0})
+            ms = elapsed * 1000.0
+            m["count"] += 1
+            m["errors"] += 0 if ok else 1
+            m["retries"] += retries
+            m["total_ms"] += ms
+            m["max_ms"] = max(m["max_ms"], ms)
+
+    def metrics(self) -> Dict[str, Dict[str, float]]:
+        """Snapshot of per-operation latency counters for this process."""
+        with self._metrics_lock:
+            out = {}
+            for op, m in self._metrics.items():
+                out[op] = {**m, "avg_ms": round(m["total_ms"] / m["count"], 2) if m["count"] else 0.0}
+                out[op]["total_ms"] = round(m["total_ms"], 2)
+                out[op]["max_ms"] = round(m["max_ms"], 2)
+            return out
+
+    # ---------- transport ----------
+    def _retry_delay(self, attempt: int, resp: Any) -> float:
+        delay = self.backoff * (2 ** attempt)
+        retry_after = resp.headers.get("Retry-After") if resp is not None else None
+        if retry_after:
+            try:
+                delay = max(delay, float(retry_after))
+            except ValueError:
+                pass
+        # full jitter keeps workers that failed together from retrying together
+        return random.uniform(delay / 2, delay * 1.5)
+
+    def _send(self, op: str, method: str, path: str, read_timeout: float, **kwargs) -> requests.Response:
+        import requests
+
+        url = f"{self.base_url}{path}"
+        started = time.perf_counter()
+        attempt = 0
+        ok = False
+        try:
+            while True:
+                resp = None
+                try:
+                    resp = self.session.request(method, url, timeout=(self.connect_timeout, read_timeout), **kwargs)
+                except (requests.ConnectionError, requests.Timeout):
+                    if attempt >= self.max_retries:
+                        raise
+                else:
+                    if resp.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                        resp.raise_for_status()
+                        ok = True
+                        return resp
+                logger.warning("PayPal %s %s attempt %d failed (%s); retrying", method, path, attempt + 1,
+                               resp.status_code if resp is not None else "connection error")
+                time.sleep(self._retry_delay(attempt, resp))
+                attempt += 1
+        finally:
+            self._record(op, time.perf_counter() - started, ok, attempt)
+
+    async def _asend(self, op: str, method: str, path: str, read_timeout: float, **kwargs) -> httpx.Response:
+        """_send() over httpx on the running event loop (same retries, metrics)."""
+        import httpx
+
+        url = f"{self.base_url}{path}"
+        timeout = httpx.Timeout(read_timeout, connect=self.connect_timeout)
+        started = time.perf_counter()
+        attempt = 0
+        ok = False
+        try:
+            async with http_client() as client:
+                while True:
+                    resp = None
+                    try:
+                        resp = await client.request(method, url, timeout=timeout, **kwargs)
+                    except httpx.TransportError:
+                        if attempt >= self.max_retries:
+                            raise
+                    else:
+                        if resp.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                            resp.raise_for_status()
+                            ok = True
+                            return resp
+                    logger.warning("PayPal %s %s attempt %d failed (%s); retrying", method, path, attempt + 1,
+                                   resp.status_code if resp is not None else "connection error")
+                    await asyncio.sleep(self._retry_delay(attempt, resp))
+                    attempt += 1
+        finally:
+            self._record(op, time.perf_counter() - started, ok, attempt)
+
+    def _fetch_token(self) -> Tuple[str, int]:
+        r = self._send("oauth_token", "POST", "/v1/oauth2/token", 15,
+                       auth=(self.client_id, self.secret), data={"grant_type": "client_credentials"})
+        js = r.json()
+        token = js.get("access_token")
+        if not token:
+            raise RuntimeError("No access_token returned from PayPal")
+        return token, int(js.get("expires_in", 300))
+
+    def access_token(self) -> str:
+        if not self.client_id or not self.secret:
+            raise RuntimeError("PayPal credentials not configured on server")
+        return self.tokens.get_token()
+
+    def request(self, method: str, path: str, payload: Optional[Dict[str, Any]] = None,
+                request_id: Optional[str] = None, op: Optional[str] = None,
+                read_timeout: float = 20) -> Dict[str, Any]:
+        """
+        Authenticated JSON call. POSTs get a PayPal-Request-Id (request_id or a fresh uuid) so
+        they are safe to retry. Raises requests.HTTPError for a final non-2xx response.
+        """
+        import requests
+
+        method, op, headers, kwargs = self._prepare(method, path, payload, request_id, op)
+        for refreshed in (False, True):
+            token = self.access_token()
+            headers["Authorization"] = f"Bearer {token}"
+            try:
+                r = self._send(op, method, path, read_timeout, **kwargs)
+            except requests.HTTPError as he:
+                if he.response is not None and he.response.status_code == 401 and not refreshed:
+                    # token revoked/expired early: fetch a new one and try once more
+                    self.tokens.invalidate(token)
+                    continue
+                raise
+            return r.json() if r.content else {}
+        raise RuntimeError("unreachable")
+
+    async def arequest(self, method: str, path: str, payload: Optional[Dict[str, Any]] = None,
+                       request_id: Optional[str] = None, op: Optional[str] = None,
+                       read_timeout: float = 20) -> Dict[str, Any]:
+        """
+        request() for `async def` views: the call runs on the event loop through httpx. Raises
+        httpx.HTTPStatusError for a final non-2xx response. The OAuth token still comes from
+        the shared (blocking, single-flight) provider, in a thread.
+        """
+        import httpx
+
+        method, op, headers, kwargs = self._prepare(method, path, payload, request_id, op)
+        for refreshed in (False, True):
+            # the token provider never touches the database: a plain thread will do
+            token = await asyncio.to_thread(self.access_token)
+            headers["Authorization"] = f"Bearer {token}"
+            try:
+                r = await self._asend(op, method, path, read_timeout, **kwargs)
+            except httpx.HTTPStatusError as he:
+                if he.response.status_code == 401 and not refreshed:
+                    self.tokens.invalidate(token)
+                    continue
+                raise
+            return r.json() if r.content else {}
+        raise RuntimeError("unreachable")
+
+    @staticmethod
+    def _prepare(method: str, path: str, payload: Optional[Dict[str, Any]], request_id: Optional[str],
+                 op: Optional[str]) -> Tuple[str, str, Dict[str, str], Dict[str, Any]]:
+        method = method.upper()
+        op = op or f"{method.lower()} {path.split('?')[0]}"
+        headers = {"Content-Type": "application/json"}
+        if method == "POST":
+            headers["PayPal-Request-Id"] = request_id or str(uuid.uuid4())
+        kwargs: Dict[str, Any] = {"headers": headers}
+        if payload is not None or method == "POST":
+            kwargs["json"] = payload or {}
+        return method, op, headers, kwargs
+
+    def get(self, path: str, op: Optional[str] = None) -> Dict[str, Any]:
+        return self.request("GET", path, op=op, read_timeout=15)
+
+    def post(self, path: str, payload: Optional[Dict[str, Any]] = None,
+             request_id: Optional[str] = None, op: Optional[str] = None) -> Dict[str, Any]:
+        return self.request("POST", path, payload, request_id=request_id, op=op)
+
+    # ---------- API helpers ----------
+    def get_order(self, order_id: str) -> Dict[str, Any]:
+        return self.get(f"/v2/checkout/orders/{order_id}", op="get_order")
+
+    def create_order(self, payload: Dict[str, Any], request_id: Optional[str] = None) -> Dict[str, Any]:
+        return self.post("/v2/checkout/orders", payload, request_id=request_id, op="create_order")
+
+    def capture_order(self, order_id: str, request_id: Optional[str] = None) -> Dict[str, Any]:
+        return self.post(f"/v2/checkout/orders/{order_id}/capture", {},
+                         request_id=request_id, op="capture_order")
+
+    async def aget_order(self, order_id: str) -> Dict[str, Any]:
+        return await self.arequest("GET", f"/v2/checkout/orders/{order_id}", op="get_order", read_timeout=15)
+
+    async def acreate_order(self, payload: Dict[str, Any], request_id: Optional[str] = None) -> Dict[str, Any]:
+        return await self.arequest("POST", "/v2/checkout/orders", payload, request_id=request_id, op="create_order")
+
+    async def acapture_order(self, order_id: str, request_id: Optional[str] = None) -> Dict[str, Any]:
+        return await self.arequest("POST", f"/v2/checkout/orders/{order_id}/capture", {},
+                                   request_id=request_id, op="capture_order")
+
+    def refund_capture(self, capture_id: str, amount: Optional[float] = None, currency: str = "USD",
+                       note: str = "", request_id: Optional[str] = None) -> Dict[str, Any]:
+        """Refund a capture; amount=None refunds the full amount."""
+        payload: Dict[str, Any] = {}
+        if amount is not None:
+            payload["amount"] = {"value": f"{float(amount):.2f}", "currency_code": (currency or "USD")}
+        if note:
+            payload["note_to_payer"] = note
+        return self.post(f"/v2/payments/captures/{capture_id}/refund", payload,
+                         request_id=request_id, op="refund_capture")
+
+    def verify_webhook_signature(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        return self.post("/v1/notifications/verify-webhook-signature", payload, op="verify_webhook")
+
+    async def averify_webhook_signature(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        return await self.arequest("POST", "/v1/notifications/verify-webhook-signature", payload,
+                                   op="verify_webhook")
@@ -0,0 +1,264 @@
+"""
+app/paypal_token.py
+
+PayPal OAuth access-token provider shared by every PayPal call in the app.
+
+- Single-flight refresh: within a worker only one thread fetches a new token; the others
+  wait for it (or keep using the current token while a proactive refresh is in flight).
+- Proactive refresh: a token is renewed PAYPAL_TOKEN_REFRESH_MARGIN seconds (default 300)
+  before it expires, so requests do not stall on an expired token.
+- Optional shared store so all Gunicorn workers reuse one token, selected by PAYPAL_TOKEN_STORE:
+    unset / "memory"             -> per-process only
+    "file:///path/token.json"    -> JSON file guarded by an flock (single host)
+    "redis://host:6379/0"        -> Redis key plus a SET NX lock (needs the `redis` package)
+"""
+from __future__ import annotations
+import json
+import os
+import threading
+import time
+import logging
+from typing import Any, Callable, Dict, Optional, Tuple
+
+try:
+    import fcntl  # POSIX only
+except ImportError:  # pragma: no cover - Windows dev boxes
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# fetch() -> (access_token, expires_in_seconds)
+TokenFetcher = Callable[[], Tuple[str, int]]
+
+# never treat a token as usable closer than this to its expiry
+_EXPIRY_SKEW = 30
+
+
+class MemoryTokenStore:
+    """No sharing: the provider's own in-process copy is the only cache."""
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        return None
+
+    def save(self, entry: Dict[str, Any]) -> None:
+        pass
+
+    def refresh_lock(self):
+        return _NullLock()
+
+
+class _NullLock:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FileTokenStore:
+    """
+    Token shared through a JSON file. refresh_lock() takes an exclusive flock on a sibling
+    .lock file, so one worker fetches while the others block and then read its result.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock_path = path + ".lock"
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as fh:
+                return json.load(fh)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, entry: Dict[str, Any]) -> None:
+        # write-then-rename so readers never see a partial file
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            json.dump(entry, fh)
+        os.chmod(tmp, 0o600)
+        os.replace(tmp, self.path)
+
+    def refresh_lock(self):
+        return _FileLock(self.lock_path)
+
+
+class _FileLock:
+    def __init__(self, path: str):
+        self.path = path
+        self._fh = None
+
+    def __enter__(self):
+        self._fh = open(self.path, "a+")
+        if fcntl is not None:
+            fcntl.flock(self._fh.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._fh.fileno(), fcntl.LOCK_UN)
+        finally:
+            self._fh.close()
+        return False
+
+
+class RedisTokenStore:
+    """Token shared through Redis; refresh_lock() is a SET NX key with a short TTL."""
+
+    KEY = "wperfumes:paypal:access_token"
+    LOCK_KEY = "wperfumes:paypal:access_token:lock"
+
+    def __init__(self, url: str, lock_timeout: int = 20):
+        import redis  # optional dependency, only needed for this store
+        self.client = redis.Redis.from_url(url)
+        self.lock_timeout = lock_timeout
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        try:
+            raw = self.client.get(self.KEY)
+            return json.loads(raw) if raw else None
+        except Exception:
+            logger.exception("Failed to read PayPal token from Redis")
+            return None
+
+    def save(self, entry: Dict[str, Any]) -> None:
+        ttl = max(1, int(entry["expires_at"] - time.time()))
+        self.client.set(self.KEY, json.dumps(entry), ex=ttl)
+
+    def refresh_lock(self):
+        return _RedisLock(self.client, self.LOCK_KEY, self.lock_timeout)
+
+
+class _RedisLock:
+    def __init__(self, client, key: str, timeout: int):
+        self.client = client
+        self.key = key
+        self.timeout = timeout
+        self.token = f"{os.getpid()}:{threading.get_ident()}:{time.time()}"
+
+    def __enter__(self):
+        deadline = time.time() + self.timeout
+        while not self.client.set(self.key, self.token, nx=True, ex=self.timeout):
+            if time.time() >= deadline:
+                # holder died mid-refresh; the key TTL will clear it, proceed without it
+                break
+            time.sleep(0.05)
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            if self.client.get(self.key) == self.token.encode():
+                self.client.delete(self.key)
+        except Exception:
+            pass
+        return False
+
+
+def token_store_from_env() -> Any:
+    """Build the store named by PAYPAL_TOKEN_STORE, falling back to memory on any error."""
+    spec = (os.environ.get("PAYPAL_TOKEN_STORE") or "").strip()
+    if not spec or spec == "memory":
+        return MemoryTokenStore()
+    try:
+        if spec.startswith("redis://") or spec.startswith("rediss://"):
+            return RedisTokenStore(spec)
+        if spec.startswith("file://"):
+            return FileTokenStore(spec[len("file://"):])
+        logger.warning("Unknown PAYPAL_TOKEN_STORE %r; using in-process cache", spec)
+    except Exception:
+        logger.exception("PAYPAL_TOKEN_STORE %r unavailable; using in-process cache", spec)
+    return MemoryTokenStore()
+
+
+class PayPalTokenProvider:
+    """
+    Caches the OAuth token in-process (and in `store` when shared) and refreshes it
+    single-flight. Thread-safe; one instance per process.
+    """
+
+    def __init__(self, fetch: TokenFetcher, store: Any = None, refresh_margin: Optional[int] = None):
+        self._fetch = fetch
+        self.store = store or MemoryTokenStore()
+        if refresh_margin is None:
+            refresh_margin = int(os.environ.get("PAYPAL_TOKEN_REFRESH_MARGIN", "300"))
+        self.refresh_margin = refresh_margin
+        self._entry: Optional[Dict[str, Any]] = None
+        self._rejected: Optional[str] = None  # token PayPal answered 401 for
+        self._lock = threading.Lock()
+        self.fetch_count = 0  # tokens fetched by this process (for diagnostics)
+
+    @staticmethod
+    def _usable(entry: Optional[Dict[str, Any]]) -> bool:
+        return bool(entry and entry.get("token")
+                    and time.time() < entry.get("expires_at", 0) - _EXPIRY_SKEW)
+
+    @classmethod
+    def _fresh(cls, entry: Optional[Dict[str, Any]]) -> bool:
+        """Usable and not yet inside its proactive-refresh window."""
+        return cls._usable(entry) and time.time() < entry.get("refresh_at", 0)
+
+    def get_token(self) -> str:
+        entry = self._entry
+        if self._fresh(entry):
+            return entry["token"]
+        if self._usable(entry):
+            # still valid but inside the refresh window: one thread refreshes,
+            # everyone else keeps using the current token instead of waiting
+            if self._lock.acquire(blocking=False):
+                try:
+                    return self._refresh(force=True)
+                except Exception:
+                    logger.exception("Proactive PayPal token refresh failed; using current token")
+                    return entry["token"]
+                finally:
+                    self._lock.release()
+            return entry["token"]
+        # expired or missing: all threads wait for the single in-flight fetch
+        with self._lock:
+            if self._usable(self._entry):
+                return self._entry["token"]
+            return self._refresh(force=False)
+
+    def _refresh(self, force: bool) -> str:
+        """Called with self._lock held. Reuses a token another worker stored, else fetches."""
+        check = self._fresh if force else self._usable
+
+        def ok(candidate):
+            return check(candidate) and candidate["token"] != self._rejected
+
+        shared = self.store.load()
+        if ok(shared):
+            self._entry = shared
+            return shared["token"]
+        with self.store.refresh_lock():
+            # another worker may have refreshed while we waited for the lock
+            shared = self.store.load()
+            if ok(shared):
+                self._entry = shared
+                return shared["token"]
+            token, expires_in = self._fetch()
+            self.fetch_count += 1
+            now = time.time()
+            # short-lived tokens refresh at half-life rather than continuously
+            lead = min(self.refresh_margin, int(expires_in) // 2)
+            entry = {"token": token,
+                     "expires_at": now + int(expires_in),
+                     "refresh_at": now + int(expires_in) - lead}
+            try:
+                self.store.save(entry)
+            except Exception:
+                logger.exception("Failed to share PayPal token; continuing with in-process copy")
+            self._entry = entry
+            return token
+
+    def invalidate(self, token: str) -> None:
+        """Forget `token` (PayPal rejected it with 401) so the next call fetches a new one."""
+        with self._lock:
+            self._rejected = token
+            if self._entry and self._entry.get("token") == token:
+                self._entry = None
@@ -0,0 +1,319 @@
+"""
+app/paypal_webhooks.py
+
+Background processing for the PayPal webhook inbox (PayPalWebhookEvent).
+
+/paypal/webhook only inserts the event and returns 200. This module claims due rows in
+batches, verifies the signature (when PAYPAL_WEBHOOK_ID is set), applies the event to the
+matching Payment and marks the row done. Failures are retried with exponential backoff;
+after PAYPAL_WEBHOOK_MAX_ATTEMPTS (or a failed signature) the row is dead-lettered
+(status='dead') and can be requeued from the payments admin. The signatures of a batch
+are verified concurrently over httpx (app/async_http.py); the database work stays
+sequential.
+
+Runs either as a daemon thread in every web worker (PAYPAL_WEBHOOK_WORKER=thread, default;
+started after the fork under Gunicorn preload, else by the worker's first request, so rows
+left pending or waiting for a retry across a restart or deploy do not wait for the next
+webhook) or out of process:
+    flask --app run:app process-paypal-webhooks --loop
+"""
+from __future__ import annotations
+import asyncio
+import os
+import random
+import threading
+import uuid
+import logging
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import Any, Dict, List, Optional
+
+import click
+from sqlalchemy import and_, or_
+
+from . import db
+from .async_http import close_shared_client, open_shared_client
+from .models_payments import Payment, PaymentAdminAction, PayPalWebhookEvent, record_refund, set_payment_status
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = int(os.environ.get("PAYPAL_WEBHOOK_BATCH_SIZE", "50"))
+MAX_ATTEMPTS = int(os.environ.get("PAYPAL_WEBHOOK_MAX_ATTEMPTS", "8"))
+POLL_SECONDS = float(os.environ.get("PAYPAL_WEBHOOK_POLL_SECONDS", "5"))
+# a 'processing' row whose lock is older than this is assumed orphaned (worker died)
+LOCK_TIMEOUT = timedelta(minutes=5)
+
+
+class WebhookRejected(Exception):
+    """Permanent failure (bad signature, malformed event): dead-letter without retrying."""
+
+
+# Capture events -> Payment.status, and the statuses each may overwrite (webhooks can arrive
+# out of order, e.g. COMPLETED after an admin refund, and must not roll a payment back).
+_CAPTURE_EVENTS = {
+    "PAYMENT.CAPTURE.PENDING": ("pending", ("created",)),
+    "PAYMENT.CAPTURE.COMPLETED": ("completed", ("created", "pending")),
+    "PAYMENT.CAPTURE.DENIED": ("declined", ("created", "pending")),
+    "PAYMENT.CAPTURE.DECLINED": ("declined", ("created", "pending")),
+    "PAYMENT.CAPTURE.REFUNDED": ("refunded", None),
+    "PAYMENT.CAPTURE.REVERSED": ("refunded", None),
+}
+
+
+def _retry_delay(attempts: int) -> timedelta:
+    seconds = min(30 * (2 ** max(attempts - 1, 0)), 3600)
+    return timedelta(seconds=random.uniform(seconds * 0.8, seconds * 1.2))
+
+
+def _claim_batch(limit: int):
+    """
+    Mark up to `limit` due rows as processing under a fresh claim token and return them.
+    FOR UPDATE SKIP LOCKED keeps concurrent Postgres workers apart; the conditional UPDATE
+    plus token re-select does the same on SQLite, where row locks are not available.
+    """
+    now = datetime.utcnow()
+    due = or_(
+        and_(PayPalWebhookEvent.status == "pending",
+             or_(PayPalWebhookEvent.next_attempt_at.is_(None), PayPalWebhookEvent.next_attempt_at <= now)),
+        and_(PayPalWebhookEvent.status == "processing",
+             PayPalWebhookEvent.locked_at < now - LOCK_TIMEOUT),
+    )
+    ids = [row.id for row in db.session.query(PayPalWebhookEvent.id)
+           .filter(due)
+           .order_by(PayPalWebhookEvent.id)
+           .limit(limit)
+           .with_for_update(skip_locked=True)
+           .all()]
+    if not ids:
+        db.session.commit()
+        return []
+    token = uuid.uuid4().hex
+    PayPalWebhookEvent.query.filter(PayPalWebhookEvent.id.in_(ids), due).update(
+        {"status": "processing", "locked_at": now, "locked_by": token}, synchronize_session=False)
+    db.session.commit()
+    return (PayPalWebhookEvent.query
+            .filter_by(locked_by=token, status="processing")
+            .order_by(PayPalWebhookEvent.id)
+            .all())
+
+
+def _verify_payload(webhook_id: str, ev: PayPalWebhookEvent) -> Dict[str, Any]:
+    headers = {k.lower(): v for k, v in (ev.headers or {}).items()}
+    return {
+        "transmission_id": headers.get("paypal-transmission-id"),
+        "transmission_time": headers.get("paypal-transmission-time"),
+        "cert_url": headers.get("paypal-cert-url"),
+        "auth_algo": headers.get("paypal-auth-algo"),
+        "transmission_sig": headers.get("paypal-transmission-sig"),
+        "webhook_id": webhook_id,
+        "webhook_event": ev.raw_event or {},
+    }
+
+
+async def _verify(client, payload: Dict[str, Any]) -> None:
+    verify = await client.averify_webhook_signature(payload)
+    if verify.get("verification_status") != "SUCCESS":
+        raise WebhookRejected(f"verification_failed: {verify.get('verification_status')}")
+
+
+def _verify_batch(events) -> List[Optional[BaseException]]:
+    """
+    Verify the signatures of a claimed batch concurrently (one PayPal round trip for the
+    whole batch instead of one per event). Returns the failure, or None, per event.
+    """
+    from .payments_paypal import PAYPAL_WEBHOOK_ID, paypal_client
+    if not PAYPAL_WEBHOOK_ID or not events:
+        return [None] * len(events)
+
+    # plain dicts, built here: the coroutines never touch the claimed rows or their session
+    payloads = [_verify_payload(PAYPAL_WEBHOOK_ID, ev) for ev in events]
+
+    async def verify_all():
+        # one pooled client for the batch, closed with its event loop
+        await open_shared_client()
+        try:
+            return await asyncio.gather(*(_verify(paypal_client, payload) for payload in payloads),
+                                        return_exceptions=True)
+        finally:
+            await close_shared_client()
+
+    return list(asyncio.run(verify_all()))
+
+
+def _capture_id_for(event_type: str, resource: Dict[str, Any]) -> Optional[str]:
+    if event_type == "PAYMENT.CAPTURE.REFUNDED":
+        # resource is the refund; its "up" link points at the capture
+        for link in resource.get("links") or []:
+            if link.get("rel") == "up" and "/captures/" in (link.get("href") or ""):
+                return link["href"].rstrip("/").rsplit("/", 1)[-1]
+        return None
+    return resource.get("id")
+
+
+def _apply(ev: PayPalWebhookEvent) -> Optional[str]:
+    """Apply the event to its Payment (caller commits). Returns a note when nothing was applied."""
+    mapping = _CAPTURE_EVENTS.get(ev.event_type or "")
+    if mapping is None:
+        return "ignored_event_type"
+    new_status, allowed_from = mapping
+    resource = (ev.raw_event or {}).get("resource") or {}
+    capture_id = _capture_id_for(ev.event_type, resource)
+    if not capture_id:
+        raise WebhookRejected("missing_capture_id")
+    payment = Payment.query.filter_by(provider_capture_id=str(capture_id)).first()
+    if payment is None:
+        return "no_matching_payment"
+
+    if new_status == "refunded":
+        # resource is one refund; partial refunds arrive as separate events
+        try:
+            refunded = Decimal(str((resource.get("amount") or {}).get("value")))
+        except Exception:
+            refunded = None  # no amount: the rest of the payment
+        if not record_refund(payment, refunded, resource.get("id")):
+            return "already_applied"
+        new_status = payment.status
+    else:
+        if payment.status == new_status:
+            return "already_applied"
+        if allowed_from is not None and payment.status not in allowed_from:
+            return f"skipped_from_{payment.status}"
+        set_payment_status(payment, new_status)
+
+    db.session.add(PaymentAdminAction(
+        payment_id=payment.id,
+        action=new_status,
+        actor_username="paypal_webhook",
+        note=ev.event_type,
+        detail={"event_id": ev.event_id},
+    ))
+    return None
+
+
+def _process_one(ev: PayPalWebhookEvent, verify_error: Optional[BaseException] = None) -> None:
+    try:
+        if verify_error is not None:
+            raise verify_error
+        note = _apply(ev)
+        ev.status = "done"
+        ev.processed_at = datetime.utcnow()
+        ev.last_error = note
+    except WebhookRejected as e:
+        db.session.rollback()
+        ev.status = "dead"
+        ev.last_error = str(e)
+        logger.warning("PayPal webhook %s dead-lettered: %s", ev.event_id, e)
+    except Exception as e:
+        db.session.rollback()
+        ev.attempts = (ev.attempts or 0) + 1
+        ev.last_error = f"{type(e).__name__}: {e}"
+        if ev.attempts >= MAX_ATTEMPTS:
+            ev.status = "dead"
+            logger.error("PayPal webhook %s dead-lettered after %d attempts: %s", ev.event_id, ev.attempts, e)
+        else:
+            ev.status = "pending"
+            ev.next_attempt_at = datetime.utcnow() + _retry_delay(ev.attempts)
+            logger.warning("PayPal webhook %s attempt %d failed, retrying: %s", ev.event_id, ev.attempts, e)
+    ev.locked_at = None
+    ev.locked_by = None
+    db.session.add(ev)
+    db.session.commit()
+
+
+def process_pending_webhooks(limit: int = BATCH_SIZE) -> int:
+    """Claim and process one batch of due webhook events. Returns the number handled."""
+    events = _claim_batch(limit)
+    verify_errors = _verify_batch(events)
+    for ev, verify_error in zip(events, verify_errors):
+        try:
+            _process_one(ev, verify_error)
+        except Exception:
+            # bookkeeping itself failed; the stale lock lets a later pass pick the row up again
+            db.session.rollback()
+            logger.exception("Failed to record outcome for PayPal webhook %s", ev.event_id)
+    return len(events)
+
+
+# ---------- in-process worker ----------
+_wake = threading.Event()
+_worker_lock = threading.Lock()
+_worker: Dict[str, Any] = {"thread": None, "pid": None}
+
+
+def _run_worker(app) -> None:
+    while True:
+        handled = 0
+        try:
+            with app.app_context():
+                handled = process_pending_webhooks()
+        except Exception:
+            logger.exception("PayPal webhook worker pass failed")
+        if handled < BATCH_SIZE:
+            _wake.wait(POLL_SECONDS)
+            _wake.clear()
+
+
+def notify_webhook_worker(app) -> None:
+    """Wake (starting if needed) this process's worker thread after a new event was stored."""
+    if (os.environ.get("PAYPAL_WEBHOOK_WORKER") or "thread").lower() != "thread":
+        return
+    with _worker_lock:
+        thread = _worker["thread"]
+        # a forked worker inherits the dict but not the thread
+        if thread is None or not thread.is_alive() or _worker["pid"] != os.getpid():
+            thread = threading.Thread(target=_run_worker, args=(app,),
+                                      name="paypal-webhook-worker", daemon=True)
+            thread.start()
+            _worker["thread"] = thread
+            _worker["pid"] = os.getpid()
+    _wake.set()
+
+
+def init_webhook_worker(app) -> None:
+    """Start this process's worker thread on its first request (call from create_app)."""
+    def start_webhook_worker():
+        if _worker["pid"] != os.getpid():
+            notify_webhook_worker(app)
+
+    app.before_request(start_webhook_worker)
+
+
+def hold_webhook_worker() -> None:
+    """Keep requests in this process from starting the thread (the preload master's warm-up)."""
+    with _worker_lock:
+        if _worker["thread"] is None:
+            _worker["pid"] = os.getpid()
+
+
+def reset_webhook_worker() -> None:
+    """Forget the parent's worker thread in a freshly forked process (see app/prefork.py)."""
+    global _worker_lock
+    _worker_lock = threading.Lock()
+    _worker.update(thread=None, pid=None)
+    _wake.clear()
+
+
+def requeue_webhook(ev: PayPalWebhookEvent) -> None:
+    """Move a dead-lettered event back to pending (caller commits)."""
+    ev.status = "pending"
+    ev.attempts = 0
+    ev.next_attempt_at = datetime.utcnow()
+    ev.locked_at = None
+    ev.locked_by = None
+
+
+def register_webhook_cli(app) -> None:
+    @app.cli.command("process-paypal-webhooks")
+    @click.option("--loop", is_flag=True, help="Keep polling instead of exiting after the backlog is drained.")
+    def process_paypal_webhooks_command(loop):
+        """Verify and apply pending PayPal webhook events."""
+        import time
+        total = 0
+        while True:
+            handled = process_pending_webhooks()
+            total += handled
+            if handled < BATCH_SIZE:
+                if not loop:
+                    break
+                time.sleep(POLL_SECONDS)
+        click.echo(f"processed {total} webhook event(s)")
@@ -0,0 +1,115 @@
+"""
+app/prefork.py
+
+Gunicorn preload mode (gunicorn.conf.py, GUNICORN_PRELOAD=1).
+
+The master imports the app once, warm_caches() fills the read-mostly state in it, and the
+workers are forked from that image: modules, compiled templates and cached data sit in
+memory pages shared copy-on-write between all workers, and a worker (re)start is a fork
+instead of a full import.
+
+    warm_caches(app)   master, before the first fork
+    after_fork(app)    every worker, right after the fork
+
+What is warmed: deferred imports (requests, httpx, the storage backend), every Jinja template,
+the settings cache, active coupons, the image derivative index, and the page cache for
+PRELOAD_WARM_PATHS (default "/,/brands"). gc.freeze() then moves all of it out of the
+collector's reach so the first collection in a worker does not dirty the shared pages.
+
+What is reset after the fork: anything holding sockets, threads or locks that must not be
+shared between processes. SQLAlchemy pools are disposed with close=False (the parent's
+connections are dropped without sending a goodbye on the shared socket), the PayPal
+session pool and webhook worker thread (started afresh in each worker), the upload thread pool and the storage client.
+The database metrics (app/db_metrics.py) start from zero in each worker.
+"""
+from __future__ import annotations
+import gc
+import os
+import time
+import logging
+
+from . import db
+
+logger = logging.getLogger(__name__)
+
+WARM_PATHS = [p.strip() for p in os.environ.get("PRELOAD_WARM_PATHS", "/,/brands").split(",") if p.strip()]
+
+
+def _step(name, fn) -> None:
+    started = time.perf_counter()
+    try:
+        fn()
+        logger.debug("preload: %s in %.1f ms", name, (time.perf_counter() - started) * 1000)
+    except Exception:
+        # a cold cache only costs the first request in each worker
+        logger.warning("preload: warming %s failed", name, exc_info=True)
+
+
+def _compile_templates(app) -> None:
+    for name in app.jinja_env.list_templates(extensions=("html",)):
+        app.jinja_env.get_template(name)
+
+
+def _warm_paths(app) -> None:
+    client = app.test_client()
+    for path in WARM_PATHS:
+        client.get(path)
+
+
+def warm_caches(app) -> None:
+    """Load shared, read-mostly state in the master process; safe to call more than once."""
+    from .checkout_quote import active_coupons
+    from .image_pipeline import load_index
+    from .settings_cache import settings_cache
+    from .storage import get_storage
+
+    started = time.perf_counter()
+    _step("imports", lambda: [__import__(m) for m in ("requests", "httpx", "asgiref.sync")])
+    _step("templates", lambda: _compile_templates(app))
+    with app.app_context():
+        _step("storage", get_storage)
+        _step("settings", lambda: settings_cache.version)
+        _step("coupons", active_coupons)
+        _step("image index", load_index)
+        db.session.remove()
+    try:
+        from .paypal_webhooks import hold_webhook_worker
+        # the warm-up requests must not start the webhook thread in the master
+        hold_webhook_worker()
+    except Exception:
+        logger.debug("PayPal webhook worker not available to hold", exc_info=True)
+    _step("pages", lambda: _warm_paths(app))
+    with app.app_context():
+        # no connection may be open in the master when it forks
+        for engine in db.engines.values():
+            engine.dispose()
+    gc.collect()
+    gc.freeze()
+    logger.info("preload: caches warmed in %.0f ms", (time.perf_counter() - started) * 1000)
+
+
+def after_fork(app) -> None:
+    """Give a forked worker its own connections, pools and threads."""
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+    from .db_metrics import reset as reset_db_metrics
+    # the master's warm-up requests are not this worker's traffic
+    reset_db_metrics()
+    try:
+        from .payments_paypal import paypal_client
+        paypal_client.reset()
+    except Exception:
+        logger.debug("PayPal client not available to reset", exc_info=True)
+    try:
+        from .paypal_webhooks import notify_webhook_worker, reset_webhook_worker
+        reset_webhook_worker()
+        # drain rows left pending by the previous workers without waiting for a request
+        notify_webhook_worker(app)
+    except Exception:
+        logger.debug("PayPal webhook worker not available to reset", exc_info=True)
+    from .storage import set_storage
+    from .uploads import shutdown_upload_workers
+    shutdown_upload_workers(wait=False)
+    # boto3 clients are not fork-safe; the next get_storage() builds a fresh one
+    set_storage(None)
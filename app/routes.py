@@ -1,10 +1,17 @@
 # app/routes.py
 from flask import Blueprint, request, jsonify, session, render_template, url_for, redirect, current_app
 from flask_mail import Message
-from datetime import datetime
+from datetime import date, datetime
 from . import db, mail
-from .models import Brand, Product, HomepageProduct, Coupon, Order, OrderAttempt, Story
+from .assets import to_static_url
+from .models import Brand, Product, HomepageProduct, Coupon, Order, OrderAttempt, Story, ImageDerivative
+from .checkout_quote import active_coupons, coupon_to_dict, invalidate_quote_cache
+from .http_cache import http_cached
+from .idempotency import idempotent
+from .image_pipeline import image_sources
+from .page_cache import cached_page
 from sqlalchemy import or_, func
+from sqlalchemy.orm import defer
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 import re
 import uuid
@@ -12,17 +19,10 @@ import uuid
 bp = Blueprint("main", __name__)
 
 
-def to_static_url(path):
-    """
-    Convert a stored image path like 'images/creed/aventus.jpg'
-    into a browser URL '/static/images/creed/aventus.jpg'.
-    If path already starts with '/' or 'http', return as-is.
-    """
-    if not path:
-        return "/static/images/placeholder.jpg"
-    if isinstance(path, str) and (path.startswith("http://") or path.startswith("https://") or path.startswith("/")):
-        return path
-    return "/static/" + path.lstrip("/")
+def _with_srcset(product_dict):
+    """Add {format: srcset} for the product image (None until derivatives are built)."""
+    product_dict["image_srcset"] = image_sources(product_dict.get("image_url"))
+    return product_dict
 
 
 def _sanitize_price_server(raw):
@@ -239,6 +239,68 @@ def _free_prd_mapping(product_id=None, code=None):
         return
 
 
+# -------------------------
+# Order ledger helpers (COD orders mirrored into order_ledger)
+# -------------------------
+def _ledger_provider_for_method(payment_method):
+    method = (payment_method or "").strip().lower()
+    if not method or method.startswith("cash"):
+        return "cod"
+    return method[:50]
+
+
+def _sync_cod_ledger(order):
+    """
+    Best-effort: mirror a COD Order into the unified order_ledger table so revenue
+    reporting can read one table. Runs after the order itself is committed; failures
+    are logged and never affect the order.
+    """
+    try:
+        from .models_payments import record_ledger_entry
+    except Exception:
+        return
+    try:
+        prod = Product.query.filter_by(
+            id=order.product_id).first() if order.product_id else None
+        total = (prod.price or 0) * (order.quantity or 0) if prod else 0
+        try:
+            created_at = datetime.strptime(order.date, "%Y-%m-%d %H:%M:%S")
+        except Exception:
+            created_at = datetime.utcnow()
+        record_ledger_entry(
+            "cod", order.id,
+            order_number=f"COD-{order.id}",
+            provider=_ledger_provider_for_method(order.payment_method),
+            customer_name=order.customer_name,
+            customer_email=order.customer_email,
+            total_amount=round(float(total), 2),
+            status=order.status or "pending",
+            created_at=created_at)
+        db.session.commit()
+    except Exception as exc:
+        try:
+            db.session.rollback()
+        except Exception:
+            pass
+        current_app.logger.debug(
+            "Failed to sync order %s into order_ledger: %s", getattr(order, "id", None), exc, exc_info=True)
+
+
+def _remove_cod_ledger(order_id):
+    try:
+        from .models_payments import OrderLedger
+        OrderLedger.query.filter_by(source="cod", source_order_id=order_id).delete(
+            synchronize_session=False)
+        db.session.commit()
+    except Exception as exc:
+        try:
+            db.session.rollback()
+        except Exception:
+            pass
+        current_app.logger.debug(
+            "Failed to remove order %s from order_ledger: %s", order_id, exc, exc_info=True)
+
+
 # -------------------------
 # Helper: safe logo setter for Brand instances
 # -------------------------
@@ -313,7 +375,8 @@ def _get_published_story_for_section_or_slug(section_or_slug):
     Resolve a story to show on a simple section page (e.g. 'history' or 'about').
     Priority:
       1) Story with slug == section_or_slug and published=True
-      2) Most recent Story with section == section_or_slug and published=True
+      2) First Story with section == section_or_slug and published=True, in listing
+         order (position desc, then newest)
       3) None
     """
     if not section_or_slug:
@@ -322,23 +385,25 @@ def _get_published_story_for_section_or_slug(section_or_slug):
     s = Story.query.filter_by(slug=section_or_slug, published=True).first()
     if s:
         return s
-    # fallback: latest published story in this section
+    # fallback: first published story in this section
     s2 = Story.query.filter_by(section=section_or_slug, published=True) \
-        .order_by(Story.published_at.desc().nullslast(), Story.created_at.desc()) \
+        .order_by(Story.position.desc(), Story.published_at.desc().nullslast(), Story.created_at.desc()) \
         .first()
     return s2
 
 
 def _get_published_stories_for_section(section, limit=None, page=1):
     """
-    Return a list of published stories for the given section, newest first.
+    Return a list of published stories for the given section, by position
+    (manual prominence) and then newest first, the same order as /content-api/stories.
     If section is None or empty, return all published stories.
     Pagination via limit/page if provided.
     """
-    q = Story.query.filter_by(published=True)
+    q = Story.query.filter_by(published=True).options(
+        defer(Story.body_html), defer(Story.body_rendered))
     if section:
         q = q.filter_by(section=section)
-    q = q.order_by(Story.published_at.desc().nullslast(),
+    q = q.order_by(Story.position.desc(), Story.published_at.desc().nullslast(),
                    Story.created_at.desc())
     if limit:
         try:
@@ -381,6 +446,7 @@ def admin_dashboard():
 
 
 @bp.route('/brands')
+@cached_page(ttl=300, groups=("catalog",))
 def brands():
     """
     Render the brands listing page. Pass the server-side brands data to the template so:
@@ -473,6 +539,7 @@ def logout():
 # Brands / Products API
 # -------------------------
 @bp.route('/api/brands', methods=['GET'])
+@http_cached(Brand, max_age=300, swr=600)
 def get_brands():
     brands = Brand.query.order_by(Brand.name).all()
     # include id so admin UI can operate by id
@@ -645,6 +712,7 @@ def delete_brand_by_id(brand_id):
 # Products endpoints (unchanged behaviour, FK-safe deletes applied where needed)
 # -------------------------
 @bp.route('/api/products', methods=['GET'])
+@http_cached(Product, ImageDerivative, max_age=60, swr=300)
 def get_products():
     """
     Return a list of products. Prefer using Product.to_dict() so product.code is included.
@@ -668,7 +736,19 @@ def get_products():
     if limit and limit > 0:
         query = query.limit(limit)
     products = query.all()
-    return jsonify([p.to_dict() for p in products])
+    return jsonify([_with_srcset(p.to_dict()) for p in products])
+
+
+@bp.route('/api/products/<id>', methods=['GET'])
+@http_cached(Product, ImageDerivative, max_age=60, swr=300)
+def get_product(id):
+    """Single product by id, falling back to the human-friendly code."""
+    p = Product.query.get(id)
+    if not p:
+        p = Product.query.filter_by(code=id).first()
+    if not p:
+        return jsonify({"error": "Product not found"}), 404
+    return jsonify(_with_srcset(p.to_dict()))
 
 
 @bp.route('/api/products', methods=['POST'])
@@ -941,6 +1021,7 @@ def _lookup_homepage_entry(identifier):
 
 
 @bp.route('/api/homepage-products', methods=['GET'])
+@http_cached(HomepageProduct, Product, ImageDerivative, max_age=60, swr=300)
 def get_homepage_products():
     homepage_products = HomepageProduct.query.order_by(
         HomepageProduct.section, HomepageProduct.sort_order).all()
@@ -960,6 +1041,7 @@ def get_homepage_products():
                 "brand": prod.brand,
                 "price": prod.price,
                 "image_url": to_static_url(prod.image_url or getattr(prod, "image_url_dynamic", "")),
+                "image_srcset": image_sources(prod.image_url or getattr(prod, "image_url_dynamic", "")),
                 "sort_order": hp.sort_order,
                 "visible": hp.visible
             })
@@ -1145,32 +1227,48 @@ def get_similar_products():
                 "title": p.title,
                 "brand": p.brand,
                 "image_url": to_static_url(p.image_url or getattr(p, "image_url_dynamic", "")),
+                "image_srcset": image_sources(p.image_url or getattr(p, "image_url_dynamic", "")),
                 "thumbnails": p.thumbnails if p.thumbnails else "",
                 "tags": p.tags
             })
     return jsonify(result)
 
 
+def _parse_coupon_date(value):
+    """Accept 'YYYY-MM-DD' (or empty for an open-ended coupon); raises ValueError otherwise."""
+    if value in (None, ""):
+        return None
+    return date.fromisoformat(str(value)[:10])
+
+
 @bp.route('/api/coupons', methods=['GET'])
 def get_coupons():
+    # the public list is the cached set of coupons valid today; admins get the full history
+    if session.get("user") not in ("admin", "admin@example.com"):
+        return jsonify(list(active_coupons().values()))
     coupons = Coupon.query.order_by(Coupon.start_date.desc()).all()
-    return jsonify([
-        {
-            "code": c.code,
-            "description": c.description,
-            "discount_type": c.discount_type,
-            "discount_value": c.discount_value,
-            "start_date": c.start_date,
-            "end_date": c.end_date,
-            "active": c.active
-        }
-        for c in coupons
-    ])
+    return jsonify([coupon_to_dict(c) for c in coupons])
+
+
+@bp.route('/api/coupons/validate', methods=['GET'])
+def validate_coupon():
+    code = (request.args.get("code") or "").strip()
+    if not code:
+        return jsonify({"valid": False, "error": "code is required"}), 400
+    coupon = active_coupons().get(code.lower())
+    if coupon is None:
+        return jsonify({"valid": False, "code": code})
+    return jsonify({"valid": True, **coupon})
 
 
 @bp.route('/api/coupons', methods=['POST'])
 def add_coupon():
     data = request.json or {}
+    try:
+        start_date = _parse_coupon_date(data.get("start_date"))
+        end_date = _parse_coupon_date(data.get("end_date"))
+    except ValueError:
+        return jsonify({"error": "Dates must be YYYY-MM-DD"}), 400
     c = Coupon.query.filter_by(code=data.get("code")).first()
     if c:
         db.session.delete(c)
@@ -1187,12 +1285,13 @@ def add_coupon():
         description=data.get("description", ""),
         discount_type=data.get("discount_type", "percent"),
         discount_value=float(data.get("discount_value", 0)),
-        start_date=data.get("start_date", ""),
-        end_date=data.get("end_date", ""),
+        start_date=start_date,
+        end_date=end_date,
         active=active
     )
     db.session.add(coupon)
     db.session.commit()
+    invalidate_quote_cache("coupons")
     return jsonify({"success": True})
 
 
@@ -1202,12 +1301,17 @@ def update_coupon(code):
     if not coupon:
         return jsonify({"error": "Coupon not found"}), 404
     data = request.json or {}
+    try:
+        if "start_date" in data:
+            coupon.start_date = _parse_coupon_date(data.get("start_date"))
+        if "end_date" in data:
+            coupon.end_date = _parse_coupon_date(data.get("end_date"))
+    except ValueError:
+        return jsonify({"error": "Dates must be YYYY-MM-DD"}), 400
     coupon.description = data.get("description", coupon.description)
     coupon.discount_type = data.get("discount_type", coupon.discount_type)
     coupon.discount_value = float(
         data.get("discount_value", coupon.discount_value))
-    coupon.start_date = data.get("start_date", coupon.start_date)
-    coupon.end_date = data.get("end_date", coupon.end_date)
     active_val = data.get("active", coupon.active)
     if isinstance(active_val, bool):
         coupon.active = active_val
@@ -1216,6 +1320,7 @@ def update_coupon(code):
     else:
         coupon.active = bool(active_val)
     db.session.commit()
+    invalidate_quote_cache("coupons")
     return jsonify({"success": True})
 
 
@@ -1225,6 +1330,7 @@ def delete_coupon(code):
     if coupon:
         db.session.delete(coupon)
         db.session.commit()
+        invalidate_quote_cache("coupons")
         return jsonify({"success": True})
     return jsonify({"error": "Coupon not found"}), 404
 
@@ -1251,6 +1357,7 @@ def get_orders():
 
 
 @bp.route('/api/orders', methods=['POST'])
+@idempotent(ignore_fields=("date",))
 def add_order():
     data = request.json or {}
     customer_name = data.get("customer_name") or data.get("customer") or ""
@@ -1292,6 +1399,8 @@ def add_order():
         current_app.logger.exception("Failed to create order: %s", e)
         return jsonify({"error": "order_create_failed", "detail": str(e)}), 500
 
+    _sync_cod_ledger(order)
+
     email_body = f"""
 Hi {customer_name},
 
@@ -1354,6 +1463,7 @@ def update_order(order_id):
     order.payment_method = data.get("payment_method", order.payment_method)
     order.date = data.get("date", order.date)
     db.session.commit()
+    _sync_cod_ledger(order)
 
     if order.status != old_status:
         email_body = f"""
@@ -1394,6 +1504,7 @@ def delete_order(order_id):
     if order:
         db.session.delete(order)
         db.session.commit()
+        _remove_cod_ledger(order_id)
         return jsonify({"success": True})
     return jsonify({"error": "Order not found"}), 404
 
@@ -1405,6 +1516,7 @@ def offers():
 
 
 @bp.route('/')
+@cached_page(ttl=300)
 def index():
     return render_template('index.html')
 
@@ -1435,16 +1547,24 @@ def signup():
 
 
 @bp.route('/brand/<brand>')
+@cached_page(ttl=300)
 def brand_page(brand):
     return render_template('brand.html')
 
 
 @bp.route('/brand/<brand>/product/<product>')
+@cached_page(ttl=300)
 def brand_product_page(brand, product):
     return render_template('brand_detail.html')
 
 
+def _story_page_key(slug):
+    row = db.session.query(Story.updated_at).filter_by(slug=slug, published=True).first()
+    return None if row is None else (slug, row.updated_at)
+
+
 @bp.route('/story/<slug>')
+@cached_page(ttl=3600, key=_story_page_key)
 def story_detail_page(slug):
     s = Story.query.filter_by(slug=slug, published=True).first()
     if not s:
@@ -1457,6 +1577,7 @@ def story_detail_page(slug):
 
 
 @bp.route('/stories')
+@cached_page(ttl=120, groups=("content",), args=("section", "limit", "page"))
 def stories_index():
     section = request.args.get('section')
     try:
@@ -1477,6 +1598,7 @@ def stories_index():
 
 
 @bp.route('/history')
+@cached_page(ttl=300, groups=("content",))
 def history():
     stories = _get_published_stories_for_section('history', limit=None, page=1)
     latest = stories[0] if stories else None
@@ -1490,6 +1612,7 @@ def checkout_modal_partial():
 
 
 @bp.route('/about')
+@cached_page(ttl=300, groups=("content",))
 def about():
     stories = _get_published_stories_for_section('about', limit=None, page=1)
     latest = stories[0] if stories else None
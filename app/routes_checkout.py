@@ -0,0 +1,37 @@
+# app/routes_checkout.py
+"""
+Checkout pricing endpoint for WPerfumes.
+
+Provides:
+- POST /api/checkout/quote  body: { items: [{id, quantity}], coupon_code, currency }
+      -> line totals, discount (automatic + coupon), delivery, FX conversion and a signed
+         quote_token that /paypal/create-paypal-order accepts in place of raw items.
+
+Pricing and caching live in app/checkout_quote.py.
+"""
+from flask import Blueprint, request, jsonify, current_app
+from .checkout_quote import QuoteError, QUOTE_TTL, build_quote, sign_quote
+from .idempotency import ensure_idempotency_client
+
+checkout_bp = Blueprint("checkout_bp", __name__)
+
+
+@checkout_bp.route("/api/checkout/quote", methods=["POST"])
+def checkout_quote():
+    data = request.get_json(silent=True) or {}
+    try:
+        quote = build_quote(
+            data.get("items") or [],
+            coupon_code=data.get("coupon_code") or data.get("promo_code"),
+            currency=data.get("currency") or "USD",
+        )
+    except QuoteError as qe:
+        return jsonify({"error": qe.error, "detail": qe.detail}), 400
+    except Exception as e:
+        current_app.logger.exception("Failed to build checkout quote: %s", e)
+        return jsonify({"error": "quote_failed", "detail": str(e)}), 500
+    # checkout starts here: the id that scopes this visitor's Idempotency-Keys
+    ensure_idempotency_client()
+    quote["quote_token"] = sign_quote(quote)
+    quote["expires_in"] = QUOTE_TTL
+    return jsonify(quote)
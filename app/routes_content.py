@@ -2,9 +2,12 @@
 from flask import Blueprint, request, jsonify, current_app, render_template, session
 from . import db
 from .models import Story
-from werkzeug.utils import secure_filename
-import os
+from .http_cache import http_cached
+from .story_order import ReorderConflict, apply_order, move_story, parse_versions
+from .story_render import apply_rendering
+from .uploads import UploadError, receive_image, store_image_upload
 from datetime import datetime
+from sqlalchemy.orm import defer
 
 content_bp = Blueprint("content_bp", __name__)
 
@@ -15,21 +18,16 @@ def _is_admin_session():
     return session.get("user") in ("admin", "admin@example.com")
 
 
-def _ensure_upload_dir():
-    upload_dir = os.path.join(current_app.static_folder, "uploads", "content")
-    os.makedirs(upload_dir, exist_ok=True)
-    return upload_dir
-
-
-def _allowed_file(filename):
-    ext = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
-    return ext in ALLOWED_IMAGE_EXTENSIONS
+def _without_bodies(query):
+    # list views never show bodies; do not load them
+    return query.options(defer(Story.body_html), defer(Story.body_rendered))
 
 
 # --------------------
 # Public content API
 # --------------------
 @content_bp.route("/pages/<slug>", methods=["GET"])
+@http_cached(Story, max_age=300, swr=600)
 def get_page_by_slug(slug):
     s = Story.query.filter_by(slug=slug, published=True).first()
     if s:
@@ -43,6 +41,7 @@ def get_page_by_slug(slug):
 
 
 @content_bp.route("/stories", methods=["GET"])
+@http_cached(Story, max_age=120, swr=600)
 def list_stories():
     """
     Public list of published stories.
@@ -63,11 +62,11 @@ def list_stories():
     if section:
         q = q.filter_by(section=section)
     total = q.count()
-    q = q.order_by(Story.position.desc(), Story.published_at.desc(
+    q = _without_bodies(q).order_by(Story.position.desc(), Story.published_at.desc(
     ).nullslast(), Story.created_at.desc())
     items = q.limit(limit).offset((page - 1) * limit).all()
     return jsonify({
-        "items": [s.to_public_dict() for s in items],
+        "items": [s.to_public_dict(include_body=False) for s in items],
         "total": total,
         "page": page,
         "limit": limit
@@ -75,6 +74,7 @@ def list_stories():
 
 
 @content_bp.route("/stories/<slug>", methods=["GET"])
+@http_cached(Story, max_age=300, swr=600)
 def story_detail(slug):
     s = Story.query.filter_by(slug=slug, published=True).first()
     if not s:
@@ -109,7 +109,7 @@ def admin_list_stories():
         q = q.filter((Story.title.ilike(like)) | (
             Story.slug.ilike(like)) | (Story.excerpt.ilike(like)))
     total = q.count()
-    q = q.order_by(Story.position.desc(), Story.created_at.desc())
+    q = _without_bodies(q).order_by(Story.position.desc(), Story.created_at.desc())
     items = q.limit(limit).offset((page - 1) * limit).all()
     return jsonify({
         "items": [{
@@ -121,10 +121,10 @@ def admin_list_stories():
             "published": s.published,
             "published_at": s.published_at.isoformat() if s.published_at else None,
             "position": s.position,
-            # include editable fields so the admin UI can load body/author/featured_image
-            "body_html": s.body_html,
+            "reading_minutes": s.reading_minutes,
             "author": s.author,
-            "featured_image": s.featured_image
+            "featured_image": s.featured_image,
+            "updated_at": s.updated_at.isoformat() if s.updated_at else None
         } for s in items],
         "total": total,
         "page": page,
@@ -132,6 +132,31 @@ def admin_list_stories():
     })
 
 
+@content_bp.route("/admin/stories/<int:story_id>", methods=["GET"])
+def admin_get_story(story_id):
+    """Editable fields of one story, including the source body_html and drafts."""
+    if not _is_admin_session():
+        return jsonify({"error": "Unauthorized"}), 401
+    s = Story.query.filter_by(id=story_id).first()
+    if not s:
+        return jsonify({"error": "Not found"}), 404
+    return jsonify({
+        "id": s.id,
+        "title": s.title,
+        "slug": s.slug,
+        "section": s.section,
+        "excerpt": s.excerpt,
+        "body_html": s.body_html,
+        "author": s.author,
+        "featured_image": s.featured_image,
+        "published": s.published,
+        "published_at": s.published_at.isoformat() if s.published_at else None,
+        "position": s.position,
+        "reading_minutes": s.reading_minutes,
+        "updated_at": s.updated_at.isoformat() if s.updated_at else None,
+    })
+
+
 @content_bp.route("/admin/stories", methods=["POST"])
 def admin_create_story():
     if not _is_admin_session():
@@ -172,6 +197,7 @@ def admin_create_story():
         published_at=published_at,
         position=pos
     )
+    apply_rendering(s)
     db.session.add(s)
     db.session.commit()
     return jsonify({"success": True, "id": s.id}), 201
@@ -193,7 +219,9 @@ def admin_update_story(story_id):
         s.slug = new_slug
     s.section = (data.get("section") or s.section)
     s.excerpt = data.get("excerpt", s.excerpt)
-    s.body_html = data.get("body_html", s.body_html)
+    if "body_html" in data:
+        s.body_html = data.get("body_html")
+        apply_rendering(s)
     s.author = data.get("author", s.author)
     s.featured_image = data.get("featured_image", s.featured_image)
     new_published = bool(
@@ -246,8 +274,11 @@ def admin_publish_toggle(story_id):
 @content_bp.route("/admin/stories/reorder", methods=["POST"])
 def admin_reorder_stories():
     """
-    Accepts JSON: { "ids": [3, 7, 1, 2] } where the first id in the list should get highest position.
-    Sets position descending so queries ordered by position show the same order.
+    Accepts JSON: { "ids": [3, 7, 1, 2], "versions": {"3": "<updated_at>", ...} } where the
+    first id in the list should get highest position. All positions are written by one
+    UPDATE (see app/story_order.py); "versions" is optional and, when given, the update is
+    refused with 409 if any of those stories changed since the client loaded them, and with
+    404 (listing "missing_ids") if an id has no story.
     """
     if not _is_admin_session():
         return jsonify({"error": "Unauthorized"}), 401
@@ -255,41 +286,82 @@ def admin_reorder_stories():
     ids = data.get("ids") or []
     if not isinstance(ids, list):
         return jsonify({"error": "Invalid payload, expected ids list"}), 400
-    # assign positions starting from len(ids) down to 1
-    pos = len(ids)
-    for sid in ids:
-        try:
-            s = Story.query.filter_by(id=int(sid)).first()
-            if s:
-                s.position = pos
-                pos -= 1
-        except Exception:
-            continue
-    db.session.commit()
+    try:
+        ids = [int(sid) for sid in ids]
+        versions = parse_versions(data.get("versions"))
+        apply_order(ids, versions)
+        db.session.commit()
+    except (TypeError, ValueError) as e:
+        db.session.rollback()
+        return jsonify({"error": "Invalid payload", "detail": str(e)}), 400
+    except LookupError as e:
+        db.session.rollback()
+        return jsonify({"error": "Not found", "missing_ids": e.args[0]}), 404
+    except ReorderConflict as e:
+        return jsonify({"error": "Stories changed since they were loaded; reload and retry",
+                        "stale_ids": e.stale_ids}), 409
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.exception("reorder failed")
+        return jsonify({"error": "Reorder failed", "detail": str(e)}), 500
     return jsonify({"success": True})
 
 
+@content_bp.route("/admin/stories/<int:story_id>/move", methods=["POST"])
+def admin_move_story(story_id):
+    """
+    Drag-and-drop move of one story. Accepts JSON:
+    { "above_id": 3, "below_id": 12, "updated_at": "<updated_at>" } naming the stories that
+    should end up directly before/after it (either may be omitted at the ends of the list).
+    Only the moved row is updated unless its neighbours have run out of room.
+    """
+    if not _is_admin_session():
+        return jsonify({"error": "Unauthorized"}), 401
+    data = request.get_json(silent=True) or {}
+    try:
+        above_id = int(data["above_id"]) if data.get("above_id") is not None else None
+        below_id = int(data["below_id"]) if data.get("below_id") is not None else None
+        expected = data.get("updated_at")
+        expected = datetime.fromisoformat(expected) if expected else None
+        position = move_story(story_id, above_id, below_id, expected)
+        db.session.commit()
+    except (TypeError, ValueError) as e:
+        db.session.rollback()
+        return jsonify({"error": "Invalid payload", "detail": str(e)}), 400
+    except LookupError:
+        db.session.rollback()
+        return jsonify({"error": "Not found"}), 404
+    except ReorderConflict as e:
+        return jsonify({"error": "Story changed since it was loaded; reload and retry",
+                        "stale_ids": e.stale_ids}), 409
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.exception("move failed")
+        return jsonify({"error": "Move failed", "detail": str(e)}), 500
+    s = db.session.get(Story, story_id)
+    return jsonify({"success": True, "position": position,
+                    "updated_at": s.updated_at.isoformat() if s and s.updated_at else None})
+
+
 @content_bp.route("/admin/upload-image", methods=["POST"])
 def admin_upload_image():
+    """
+    Upload an image for a story. Send the file as the raw body (Content-Type: image/...,
+    X-Filename: <name>) or as the multipart field "image". The original is stored at once;
+    responsive derivatives are built in the background (see app/uploads.py).
+    """
     if not _is_admin_session():
         return jsonify({"error": "Unauthorized"}), 401
-    if "image" not in request.files:
-        return jsonify({"error": "No file provided"}), 400
-    file = request.files["image"]
-    if file.filename == "":
-        return jsonify({"error": "Empty filename"}), 400
-    if not _allowed_file(file.filename):
-        return jsonify({"error": "Invalid file type"}), 400
-
-    upload_dir = _ensure_upload_dir()
-    filename = secure_filename(file.filename)
-    timestamp = datetime.utcnow().strftime("%Y%m%d%H%M%S%f")
-    filename = f"{timestamp}_{filename}"
-    filepath = os.path.join(upload_dir, filename)
-    file.save(filepath)
-    rel_path = f"uploads/content/{filename}"
-    url = f"/static/{rel_path}"
-    return jsonify({"url": url, "path": rel_path}), 201
+    try:
+        upload = receive_image(request, field="image", allowed_extensions=ALLOWED_IMAGE_EXTENSIONS)
+    except UploadError as e:
+        return jsonify({"error": e.message}), e.status
+    try:
+        stored = store_image_upload(upload, folder="content")
+    except Exception as e:
+        current_app.logger.exception("Failed to store uploaded image")
+        return jsonify({"error": "Upload failed", "detail": str(e)}), 500
+    return jsonify(stored), 201
 
 
 @content_bp.route("/admin", methods=["GET"])
@@ -5,30 +5,38 @@ import os
 import json
 import logging
 from functools import wraps
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 
 from datetime import datetime, timedelta, date
-import requests
+from decimal import Decimal
 
 from flask import Blueprint, request, Response, render_template, jsonify, current_app, abort, session
 from werkzeug.security import check_password_hash, generate_password_hash
+from sqlalchemy.orm import defer, selectinload
 
 # Import SQLAlchemy models (ensure app/models_payments.py was added and migrations run)
 try:
-    from .models_payments import Payment, Order, PaymentsAdminUser  # type: ignore
+    from .models_payments import Payment, Order, OrderLedger, PaymentAdminAction, PaymentDailyRollup, PaymentsAdminUser, PayPalWebhookEvent, normalize_payment_status, record_refund, set_payment_status  # type: ignore
     from . import db  # type: ignore
 except Exception:
     Payment = None
     Order = None
+    OrderLedger = None
+    PaymentAdminAction = None
     PaymentsAdminUser = None
+    PaymentDailyRollup = None
+    PayPalWebhookEvent = None
+    normalize_payment_status = None
+    record_refund = None
+    set_payment_status = None
     db = None
 
 # Optionally reuse PayPal helper functions if you have payments_paypal implemented
 try:
-    from .payments_paypal import get_paypal_access_token, PAYPAL_BASE  # type: ignore
+    from .payments_paypal import get_paypal_access_token, paypal_client  # type: ignore
 except Exception:
     get_paypal_access_token = None
-    PAYPAL_BASE = None
+    paypal_client = None
 
 bp = Blueprint("payments_admin", __name__,
                template_folder="templates", url_prefix="/payments-admin")
@@ -187,28 +195,45 @@ def api_create_manage_user():
 
 # ---------- Utilities & helpers for refunds/actions ----------
 
-def _serialize_payment(p: Any) -> Dict[str, Any]:
-    """Return a JSON-serializable dict for a Payment row (used in responses)."""
-    if p is None:
-        return {}
+def _legacy_order_summary(o: Any) -> Dict[str, Any]:
+    return {
+        "id": o.id,
+        "order_number": getattr(o, "order_number", None) or None,
+        "customer_name": getattr(o, "customer_name", None) or None,
+        "customer_email": getattr(o, "customer_email", None) or None,
+        "status": getattr(o, "status", None) or None,
+        "total_amount": str(getattr(o, "total_amount", None)) if getattr(o, "total_amount", None) is not None else None,
+        "currency": getattr(o, "currency", None) or None,
+    }
+
+
+def _order_summary(p: Any) -> Optional[Dict[str, Any]]:
+    """
+    Order info for a payment, read through relationships (Payment.ledger, then the legacy
+    Payment.order backref) so callers can eager-load instead of issuing a query per row.
+    """
     try:
-        order = None
-        if getattr(p, "order_id", None) and Order is not None:
-            o = Order.query.get(p.order_id)
-            if o:
-                order = {
-                    "id": o.id,
-                    "order_number": getattr(o, "order_number", None) or None,
-                    "customer_name": getattr(o, "customer_name", None) or None,
-                    "customer_email": getattr(o, "customer_email", None) or None,
-                    "status": getattr(o, "status", None) or None,
-                    "total_amount": str(getattr(o, "total_amount", None)) if getattr(o, "total_amount", None) is not None else None,
-                    "currency": getattr(o, "currency", None) or None,
-                }
+        ledger = getattr(p, "ledger", None)
+        if ledger is not None:
+            return ledger.to_summary_dict()
+        o = getattr(p, "order", None)
+        if o is not None:
+            return _legacy_order_summary(o)
     except Exception:
-        order = None
+        logger.debug("Failed to resolve order for payment %s", getattr(p, "id", None), exc_info=True)
+    return None
+
+
+def _serialize_payment(p: Any, include_raw: bool = True) -> Dict[str, Any]:
+    """
+    Return a JSON-serializable dict for a Payment row (used in responses).
+    include_raw=False leaves out raw_response (listings defer that column).
+    """
+    if p is None:
+        return {}
+    order = _order_summary(p)
     try:
-        return {
+        data = {
             "id": p.id,
             "order_id": getattr(p, "order_id", None),
             "provider": getattr(p, "provider", None),
@@ -220,40 +245,34 @@ def _serialize_payment(p: Any) -> Dict[str, Any]:
             "payer_name": getattr(p, "payer_name", None),
             "payer_email": getattr(p, "payer_email", None),
             "payer_id": getattr(p, "payer_id", None),
-            "raw_response": getattr(p, "raw_response", None),
             "created_at": getattr(p, "created_at").isoformat() if getattr(p, "created_at", None) else None,
             "order": order
         }
+        if include_raw:
+            data["raw_response"] = getattr(p, "raw_response", None)
+        return data
     except Exception:
         return {"id": getattr(p, "id", None)}
 
 
-def _append_admin_action(p: Any, action_record: Dict[str, Any]) -> None:
+def _append_admin_action(p: Any, action_record: Dict[str, Any], commit: bool = True) -> None:
     """
-    Append an admin action record into p.raw_response['_admin_actions'] (creates it if necessary)
-    and persist p to DB. Best-effort; failures are non-fatal beyond logging.
+    Record an admin action as a single payment_admin_action INSERT (raw_response is not touched)
+    and commit, together with any pending changes to p. With commit=False the row is only added
+    to the session. Best-effort; failures are non-fatal beyond logging.
     """
     try:
         if p is None:
             return
-        rr = getattr(p, "raw_response", None) or {}
-        if not isinstance(rr, dict):
-            # if it's JSON string, try parse
+        db.session.add(PaymentAdminAction.from_record(p.id, action_record))
+        if commit:
+            db.session.commit()
+    except Exception:
+        if commit:
             try:
-                rr = json.loads(rr)
+                db.session.rollback()
             except Exception:
-                rr = {}
-        actions = rr.get("_admin_actions", [])
-        actions.append(action_record)
-        rr["_admin_actions"] = actions
-        p.raw_response = rr
-        db.session.add(p)
-        db.session.commit()
-    except Exception:
-        try:
-            db.session.rollback()
-        except Exception:
-            pass
+                pass
         logger.exception("Failed to persist admin action for payment %s", getattr(p, "id", "<unknown>"))
 
 
@@ -262,20 +281,10 @@ def _call_paypal_refund(capture_id: str, amount: Optional[float], currency: str,
     Call PayPal capture refund API. Returns PayPal response JSON or raises requests.HTTPError / Exception.
     If amount is None -> refund full amount (no 'amount' in payload).
     """
-    if not get_paypal_access_token or not PAYPAL_BASE:
+    if not get_paypal_access_token or paypal_client is None:
         raise RuntimeError("PayPal integration not configured on server")
-    token = get_paypal_access_token()
-    url = f"{PAYPAL_BASE}/v2/payments/captures/{capture_id}/refund"
-    headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
-    payload = {}
-    if amount is not None:
-        # Ensure amount as string with two decimals
-        payload["amount"] = {"value": f"{float(amount):.2f}", "currency_code": (currency or "USD")}
-    if note:
-        payload["note_to_payer"] = note
-    r = requests.post(url, headers=headers, json=payload or {}, timeout=20)
-    r.raise_for_status()
-    return r.json()
+    get_paypal_access_token()
+    return paypal_client.refund_capture(capture_id, amount=amount, currency=currency, note=note)
 
 
 def _perform_payment_action(payment: Any, action: str, refund_amount: Optional[float], refund_percent: Optional[float], note: str, actor: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
@@ -289,6 +298,8 @@ def _perform_payment_action(payment: Any, action: str, refund_amount: Optional[f
 
     Returns dict { success: bool, message: str, updated_payment?: {...}, refund_response?: {...} }
     """
+    import requests  # for requests.HTTPError; not imported at module load
+
     if payment is None:
         return {"success": False, "message": "payment_not_found"}
 
@@ -327,7 +338,7 @@ def _perform_payment_action(payment: Any, action: str, refund_amount: Optional[f
 
     # If action is hold -> mark status and persist
     if action in ("hold", "on_hold"):
-        payment.status = "on_hold"
+        set_payment_status(payment, "on_hold")
         _append_admin_action(payment, action_record)
         try:
             db.session.add(payment)
@@ -343,7 +354,7 @@ def _perform_payment_action(payment: Any, action: str, refund_amount: Optional[f
 
     # review/disputed
     if action in ("review", "dispute", "disputed"):
-        payment.status = "disputed"
+        set_payment_status(payment, "disputed")
         _append_admin_action(payment, action_record)
         try:
             db.session.add(payment)
@@ -361,15 +372,18 @@ def _perform_payment_action(payment: Any, action: str, refund_amount: Optional[f
     if action in ("rejected", "settled", "reject"):
         try:
             # set a clear settled status on payment
-            payment.status = "settled"
+            set_payment_status(payment, "settled")
             # if there's an associated Order model (payments.models_payments.Order), mark order as paid/settled
             try:
-                if getattr(payment, "order_id", None) and Order is not None:
-                    o = Order.query.get(payment.order_id)
-                    if o:
-                        # Mark as paid; chosen canonical value is 'paid'
-                        o.status = "paid"
-                        db.session.add(o)
+                o = getattr(payment, "order", None)
+                if o is not None:
+                    # Mark as paid; chosen canonical value is 'paid'
+                    o.status = "paid"
+                    db.session.add(o)
+                ledger = getattr(payment, "ledger", None)
+                if ledger is not None:
+                    ledger.status = "paid"
+                    db.session.add(ledger)
             except Exception:
                 # non-fatal if order update fails
                 logger.exception("Failed to update linked order status for payment %s", getattr(payment, "id", "<unknown>"))
@@ -400,7 +414,7 @@ def _perform_payment_action(payment: Any, action: str, refund_amount: Optional[f
             # record admin intent but do not call provider
             action_record["warning"] = f"provider_{provider}_unsupported_for_refund"
             _append_admin_action(payment, action_record)
-            payment.status = "refund_pending"
+            set_payment_status(payment, "refund_pending")
             try:
                 db.session.add(payment)
                 db.session.commit()
@@ -418,7 +432,7 @@ def _perform_payment_action(payment: Any, action: str, refund_amount: Optional[f
         # Attempt PayPal refund
         try:
             refund_resp = _call_paypal_refund(capture_id=capture_id, amount=resolved_refund_amount, currency=currency, note=note)
-            # Persist refund info to raw_response._refunds and update status
+            # Persist refund info to raw_response._refunds, record the action and update status
             try:
                 rr = getattr(payment, "raw_response", None) or {}
                 if not isinstance(rr, dict):
@@ -426,14 +440,20 @@ def _perform_payment_action(payment: Any, action: str, refund_amount: Optional[f
                         rr = json.loads(rr)
                     except Exception:
                         rr = {}
-                # ensure _refunds list
-                rf_list = rr.get("_refunds", [])
-                rf_list.append(refund_resp)
-                rr["_refunds"] = rf_list
-                # append admin action as well
-                rr.setdefault("_admin_actions", []).append(action_record)
+                # copy before mutating: in-place changes to a JSON column are not flushed
+                rr = dict(rr)
+                rr["_refunds"] = list(rr.get("_refunds") or []) + [refund_resp]
                 payment.raw_response = rr
-                payment.status = "refunded"
+                _append_admin_action(payment, action_record, commit=False)
+                if (refund_resp.get("status") or "").upper() == "COMPLETED":
+                    refunded = (refund_resp.get("amount") or {}).get("value")
+                    if refunded is None and resolved_refund_amount is not None:
+                        refunded = resolved_refund_amount
+                    record_refund(payment, Decimal(str(refunded)) if refunded is not None else None,
+                                  refund_resp.get("id"))
+                else:
+                    # no money has moved yet; PayPal's PAYMENT.CAPTURE.REFUNDED webhook counts it
+                    set_payment_status(payment, "refund_pending")
                 db.session.add(payment)
                 db.session.commit()
             except Exception:
@@ -471,18 +491,26 @@ def _parse_iso_date_str(d: str) -> date:
     return date.fromisoformat(d)
 
 
-@bp.route("/api/payments", methods=["GET"])
-@require_payments_admin
-def api_list_payments():
-    if Payment is None:
-        return jsonify({"error": "payments model not available"}), 500
-    try:
-        page = int(request.args.get("page", 1))
-        per_page = min(int(request.args.get("per_page", 25)), 200)
-    except Exception:
-        page = 1
-        per_page = 25
+# Filter keys accepted by ?status= / ?category= mapped onto normalized Payment.status values.
+_STATUS_FILTER_GROUPS = {
+    "refunded": ("refunded", "partially_refunded", "refund_pending"),
+    "disputed": ("disputed",),
+    "on_hold": ("on_hold",),
+    "settled": ("settled",),
+}
 
+
+def _statuses_for_filter(key: str) -> Optional[Tuple[str, ...]]:
+    if not key:
+        return None
+    return _STATUS_FILTER_GROUPS.get(normalize_payment_status(key) or "")
+
+
+def _duration_bounds_from_request() -> Tuple[Optional[datetime], Optional[datetime], Optional[Tuple[Response, int]]]:
+    """
+    Resolve ?duration= (plus ?from=/?to= for custom) into a [start, end) datetime range.
+    Returns (start_dt, end_dt, error_response); error_response is set for bad custom ranges.
+    """
     # Duration filtering support:
     # Accepts: duration=daily|yesterday|weekly|monthly|yearly|custom|all
     # - daily (default/no param) => today from 00:00 UTC to next day 00:00 UTC
@@ -525,12 +553,12 @@ def api_list_payments():
             from_str = (request.args.get("from") or request.args.get("from_date") or "").strip()
             to_str = (request.args.get("to") or request.args.get("to_date") or "").strip()
             if not from_str or not to_str:
-                return jsonify({"error": "custom_duration_requires_from_and_to"}), 400
+                return None, None, (jsonify({"error": "custom_duration_requires_from_and_to"}), 400)
             try:
                 d_from = _parse_iso_date_str(from_str)
                 d_to = _parse_iso_date_str(to_str)
             except Exception:
-                return jsonify({"error": "invalid_from_or_to_date", "message": "Expected YYYY-MM-DD"}), 400
+                return None, None, (jsonify({"error": "invalid_from_or_to_date", "message": "Expected YYYY-MM-DD"}), 400)
             start_dt = datetime(d_from.year, d_from.month, d_from.day)
             # make end exclusive (next day after 'to')
             end_dt = datetime(d_to.year, d_to.month, d_to.day) + timedelta(days=1)
@@ -547,8 +575,34 @@ def api_list_payments():
         start_dt = None
         end_dt = None
 
-    # Base query
-    q = Payment.query
+    return start_dt, end_dt, None
+
+
+@bp.route("/api/payments", methods=["GET"])
+@require_payments_admin
+def api_list_payments():
+    if Payment is None:
+        return jsonify({"error": "payments model not available"}), 500
+    try:
+        page = int(request.args.get("page", 1))
+        per_page = min(int(request.args.get("per_page", 25)), 200)
+    except Exception:
+        page = 1
+        per_page = 25
+
+    start_dt, end_dt, err = _duration_bounds_from_request()
+    if err is not None:
+        return err
+
+    # Base query: one SELECT for the page (raw_response deferred) plus one batched
+    # SELECT per eager-loaded relationship, independent of per_page.
+    q = Payment.query.options(
+        selectinload(Payment.ledger),
+        selectinload(Payment.order),
+    )
+    include_raw = (request.args.get("include") or "").strip().lower() == "raw_response"
+    if not include_raw:
+        q = q.options(defer(Payment.raw_response))
 
     # Apply date range filters if computed
     if start_dt is not None and end_dt is not None:
@@ -565,64 +619,20 @@ def api_list_payments():
 
     q = q.order_by(Payment.created_at.desc())
 
-    # Optional server-side filters (simple)
+    # Optional server-side filters (simple). Both params resolve to an IN over the
+    # indexed, normalized payments.status column.
     status_filter = (request.args.get("status") or "").strip().lower()
     category = (request.args.get("category") or "").strip().lower()  # alternate param
-    if status_filter:
-        if status_filter in ("refunded", "refund"):
-            q = q.filter(Payment.status.ilike("%refund%"))
-        elif status_filter in ("disputed", "disput"):
-            q = q.filter(Payment.status.ilike("%disput%"))
-        elif status_filter in ("on_hold", "hold", "held"):
-            q = q.filter(Payment.status.ilike("%hold%") | (Payment.status == "on_hold"))
-        elif status_filter in ("settled", "rejected", "rejected_settled"):
-            q = q.filter(Payment.status.ilike("%settle%") | (Payment.status == "settled"))
-        else:
-            q = q.filter(Payment.status.ilike(f"%{status_filter}%"))
-    elif category:
-        # support legacy category keys from frontend (cash-in, today, prev-day, filtered)
-        cat = category
-        if cat == "refunded":
-            q = q.filter(Payment.status.ilike("%refund%"))
-        elif cat == "disputed":
-            q = q.filter(Payment.status.ilike("%disput%"))
-        elif cat in ("settled", "rejected"):
-            q = q.filter(Payment.status.ilike("%settle%") | (Payment.status == "settled"))
-        # else do nothing (frontend can still handle client-side)
+    statuses = _statuses_for_filter(status_filter or category)
+    if statuses:
+        q = q.filter(Payment.status.in_(statuses))
+    elif status_filter:
+        q = q.filter(Payment.status == normalize_payment_status(status_filter))
+    # else: unknown legacy category keys (cash-in, today, prev-day, filtered) are handled client-side
 
     pagination = q.paginate(page=page, per_page=per_page, error_out=False)
 
-    items = []
-    for p in pagination.items:
-        order = None
-        if p.order_id and Order is not None:
-            o = Order.query.get(p.order_id)
-            if o:
-                order = {
-                    "id": o.id,
-                    "order_number": getattr(o, "order_number", None) or None,
-                    "customer_name": getattr(o, "customer_name", None) or None,
-                    "customer_email": getattr(o, "customer_email", None) or None,
-                    "status": getattr(o, "status", None) or None,
-                    "total_amount": str(getattr(o, "total_amount", None)) if getattr(o, "total_amount", None) is not None else None,
-                    "currency": getattr(o, "currency", None) or None,
-                }
-        items.append({
-            "id": p.id,
-            "order_id": p.order_id,
-            "provider": p.provider,
-            "provider_order_id": p.provider_order_id,
-            "provider_capture_id": p.provider_capture_id,
-            "amount": str(p.amount),
-            "currency": p.currency,
-            "status": p.status,
-            "payer_name": p.payer_name,
-            "payer_email": p.payer_email,
-            "payer_id": p.payer_id,
-            "raw_response": p.raw_response,
-            "created_at": p.created_at.isoformat() if p.created_at else None,
-            "order": order
-        })
+    items = [_serialize_payment(p, include_raw=include_raw) for p in pagination.items]
 
     return jsonify({
         "items": items,
@@ -641,36 +651,72 @@ def api_payment_detail(payment_id: int):
     p = Payment.query.get(payment_id)
     if not p:
         return jsonify({"error": "not_found"}), 404
-    order = None
-    if p.order_id and Order is not None:
-        o = Order.query.get(p.order_id)
-        if o:
-            order = {
-                "id": o.id,
-                "order_number": getattr(o, "order_number", None) or None,
-                "customer_name": getattr(o, "customer_name", None) or None,
-                "customer_email": getattr(o, "customer_email", None) or None,
-                "status": getattr(o, "status", None) or None,
-                "total_amount": str(getattr(o, "total_amount", None)) if getattr(o, "total_amount", None) is not None else None,
-                "currency": getattr(o, "currency", None) or None,
-            }
-    resp = {
-        "id": p.id,
-        "order_id": p.order_id,
-        "provider": p.provider,
-        "provider_order_id": p.provider_order_id,
-        "provider_capture_id": p.provider_capture_id,
-        "amount": str(p.amount),
-        "currency": p.currency,
-        "status": p.status,
-        "payer_name": p.payer_name,
-        "payer_email": p.payer_email,
-        "payer_id": p.payer_id,
-        "raw_response": p.raw_response,
-        "created_at": p.created_at.isoformat() if p.created_at else None,
-        "order": order
-    }
-    return jsonify(resp)
+    # Full record including raw_response (omitted from the listing) and the audit trail
+    data = _serialize_payment(p)
+    data["admin_actions"] = [a.to_dict() for a in p.admin_actions] if PaymentAdminAction is not None else []
+    return jsonify(data)
+
+
+@bp.route("/api/paypal-metrics", methods=["GET"])
+@require_payments_admin
+def api_paypal_metrics():
+    """Per-operation PayPal API latency for this worker process."""
+    if paypal_client is None:
+        return jsonify({"error": "paypal_client_unavailable"}), 500
+    return jsonify({"pid": os.getpid(), "operations": paypal_client.metrics()})
+
+
+@bp.route("/api/webhooks", methods=["GET"])
+@require_payments_admin
+def api_list_webhooks():
+    """Webhook inbox by status (default: dead-lettered events)."""
+    if PayPalWebhookEvent is None:
+        return jsonify({"error": "webhook model not available"}), 500
+    status = (request.args.get("status") or "dead").strip().lower()
+    try:
+        limit = min(max(int(request.args.get("limit", 50)), 1), 500)
+    except Exception:
+        limit = 50
+    rows = (PayPalWebhookEvent.query
+            .options(defer(PayPalWebhookEvent.raw_event), defer(PayPalWebhookEvent.headers))
+            .filter_by(status=status)
+            .order_by(PayPalWebhookEvent.id.desc())
+            .limit(limit)
+            .all())
+    return jsonify({"status": status, "items": [{
+        "id": ev.id,
+        "event_id": ev.event_id,
+        "event_type": ev.event_type,
+        "status": ev.status,
+        "attempts": ev.attempts,
+        "last_error": ev.last_error,
+        "received_at": ev.received_at.isoformat() if ev.received_at else None,
+        "next_attempt_at": ev.next_attempt_at.isoformat() if ev.next_attempt_at else None,
+        "processed_at": ev.processed_at.isoformat() if ev.processed_at else None,
+    } for ev in rows]})
+
+
+@bp.route("/api/webhooks/<int:webhook_id>/requeue", methods=["POST"])
+@require_payments_admin
+def api_requeue_webhook(webhook_id: int):
+    try:
+        from .paypal_webhooks import notify_webhook_worker, requeue_webhook
+    except Exception:
+        return jsonify({"error": "webhook processing not available"}), 500
+    ev = PayPalWebhookEvent.query.get(webhook_id)
+    if not ev:
+        return jsonify({"error": "not_found"}), 404
+    if ev.status != "dead":
+        return jsonify({"error": "not_dead_lettered", "status": ev.status}), 409
+    try:
+        requeue_webhook(ev)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.exception("Failed to requeue webhook %s", webhook_id)
+        return jsonify({"error": "requeue_failed", "detail": str(e)}), 500
+    notify_webhook_worker(current_app._get_current_object())
+    return jsonify({"success": True, "id": ev.id, "status": ev.status})
 
 
 # Backwards-compatible endpoint that accepts structured payload via URL path
@@ -744,4 +790,170 @@ def api_payment_refund_generic():
     if isinstance(result, tuple):
         body, status = result
         return jsonify(body), status
-    return jsonify(result)
\ No newline at end of file
+    return jsonify(result)
+
+# ---------- Combined revenue reporting (COD + PayPal via order_ledger) ----------
+# Ledger statuses that do not count as revenue.
+_NON_REVENUE_LEDGER_STATUSES = ("cancelled", "canceled", "refunded", "failed")
+
+
+@bp.route("/api/revenue", methods=["GET"])
+@require_payments_admin
+def api_revenue():
+    """
+    Combined revenue across every checkout path, read from order_ledger in a single
+    GROUP BY query. Accepts the same ?duration= / ?from= / ?to= params as /api/payments.
+    Returns { "rows": [{provider, currency, orders, revenue}], "totals": {currency: revenue} }
+    """
+    if OrderLedger is None or db is None:
+        return jsonify({"error": "order ledger model not available"}), 500
+
+    start_dt, end_dt, err = _duration_bounds_from_request()
+    if err is not None:
+        return err
+
+    q = db.session.query(
+        OrderLedger.provider,
+        OrderLedger.currency,
+        db.func.count(OrderLedger.id),
+        db.func.coalesce(db.func.sum(OrderLedger.total_amount), 0),
+    ).filter(~OrderLedger.status.in_(_NON_REVENUE_LEDGER_STATUSES))
+    if start_dt is not None:
+        q = q.filter(OrderLedger.created_at >= start_dt)
+    if end_dt is not None:
+        q = q.filter(OrderLedger.created_at < end_dt)
+    q = q.group_by(OrderLedger.provider, OrderLedger.currency)
+
+    rows = []
+    totals: Dict[str, Decimal] = {}
+    for provider, currency, count, revenue in q.all():
+        revenue = Decimal(str(revenue or 0))
+        rows.append({"provider": provider, "currency": currency,
+                     "orders": int(count or 0), "revenue": str(revenue)})
+        totals[currency] = totals.get(currency, Decimal("0")) + revenue
+
+    return jsonify({
+        "rows": rows,
+        "totals": {cur: str(val) for cur, val in totals.items()},
+        "from": start_dt.isoformat() if start_dt else None,
+        "to": end_dt.isoformat() if end_dt else None,
+    })
+
+
+# ---------- Pre-aggregated dashboard summary ----------
+# Durations long enough that reading payment_daily_rollup beats a range GROUP BY on payments.
+_ROLLUP_DURATIONS = ("yearly", "year", "all")
+# Statuses whose amount never reached the merchant.
+_NON_CASH_STATUSES = ("created", "pending", "failed", "declined")
+
+
+def _summary_rows_from_payments(start_dt: Optional[datetime], end_dt: Optional[datetime]) -> List[Tuple[str, str, int, Decimal, Decimal]]:
+    q = db.session.query(
+        Payment.status,
+        Payment.currency,
+        db.func.count(Payment.id),
+        db.func.coalesce(db.func.sum(Payment.amount), 0),
+        db.func.coalesce(db.func.sum(Payment.refunded_amount), 0),
+    )
+    if start_dt is not None:
+        q = q.filter(Payment.created_at >= start_dt)
+    if end_dt is not None:
+        q = q.filter(Payment.created_at < end_dt)
+    return q.group_by(Payment.status, Payment.currency).all()
+
+
+def _summary_rows_from_rollup(start_dt: Optional[datetime], end_dt: Optional[datetime]) -> List[Tuple[str, str, int, Decimal, Decimal]]:
+    q = db.session.query(
+        PaymentDailyRollup.status,
+        PaymentDailyRollup.currency,
+        db.func.coalesce(db.func.sum(PaymentDailyRollup.payment_count), 0),
+        db.func.coalesce(db.func.sum(PaymentDailyRollup.amount_total), 0),
+        db.func.coalesce(db.func.sum(PaymentDailyRollup.refunded_total), 0),
+    )
+    if start_dt is not None:
+        q = q.filter(PaymentDailyRollup.day >= start_dt.date())
+    if end_dt is not None:
+        # end is exclusive; the last covered day is the one containing end_dt - 1us
+        q = q.filter(PaymentDailyRollup.day <= (end_dt - timedelta(microseconds=1)).date())
+    q = q.group_by(PaymentDailyRollup.status, PaymentDailyRollup.currency)
+    # buckets emptied by status moves stay behind as zero rows; hide them
+    return q.having(db.func.sum(PaymentDailyRollup.payment_count) != 0).all()
+
+
+def _net_by_currency(rows: List[Tuple[str, str, int, Decimal, Decimal]]) -> Dict[str, Dict[str, Any]]:
+    """
+    Fold (status, currency, count, amount, refunded) rows into per-currency
+    gross/refunded/disputed/net. refunded is money actually returned (Payment.refunded_amount),
+    whatever the status: a partial refund only takes its own amount off net, and
+    refund_pending takes nothing off until the refund completes.
+    """
+    totals: Dict[str, Dict[str, Any]] = {}
+    for status, currency, count, amount, refunded in rows:
+        amount = Decimal(str(amount or 0))
+        refunded = Decimal(str(refunded or 0))
+        t = totals.setdefault(currency or "USD", {"count": 0, "gross": Decimal("0"), "refunded": Decimal("0"), "disputed": Decimal("0")})
+        t["count"] += int(count or 0)
+        if status in _NON_CASH_STATUSES:
+            continue
+        t["gross"] += amount
+        t["refunded"] += refunded
+        if status in _STATUS_FILTER_GROUPS["disputed"]:
+            t["disputed"] += amount - refunded
+    for t in totals.values():
+        t["net"] = t["gross"] - t["refunded"] - t["disputed"]
+    return totals
+
+
+@bp.route("/api/summary", methods=["GET"])
+@require_payments_admin
+def api_payments_summary():
+    """
+    Dashboard totals for ?duration= (same params as /api/payments), computed in SQL:
+      - daily..monthly/custom: GROUP BY status, currency over payments (ix_payments_created_at_status)
+      - yearly/all: summed from payment_daily_rollup rows
+    today/previous_day are always returned so the dashboard cards need no client-side math.
+    """
+    if Payment is None or db is None:
+        return jsonify({"error": "payments model not available"}), 500
+
+    start_dt, end_dt, err = _duration_bounds_from_request()
+    if err is not None:
+        return err
+    duration = (request.args.get("duration") or "daily").strip().lower()
+
+    source = "payments"
+    rows = None
+    if duration in _ROLLUP_DURATIONS and PaymentDailyRollup is not None:
+        try:
+            rows = _summary_rows_from_rollup(start_dt, end_dt)
+            source = "rollup"
+        except Exception:
+            db.session.rollback()
+            logger.exception("Rollup summary failed; falling back to payments GROUP BY")
+            rows = None
+    if rows is None:
+        rows = _summary_rows_from_payments(start_dt, end_dt)
+
+    now = datetime.utcnow()
+    today_start = datetime(now.year, now.month, now.day)
+    today = _net_by_currency(_summary_rows_from_payments(today_start, today_start + timedelta(days=1)))
+    previous_day = _net_by_currency(_summary_rows_from_payments(today_start - timedelta(days=1), today_start))
+
+    totals = _net_by_currency(rows)
+    primary_currency = max(totals, key=lambda c: totals[c]["gross"]) if totals else "USD"
+
+    def _money(d: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        return {cur: {k: (str(v) if isinstance(v, Decimal) else v) for k, v in t.items()} for cur, t in d.items()}
+
+    return jsonify({
+        "duration": duration,
+        "source": source,
+        "from": start_dt.isoformat() if start_dt else None,
+        "to": end_dt.isoformat() if end_dt else None,
+        "currency": primary_currency,
+        "by_status": [{"status": s, "currency": c, "count": int(n or 0), "amount": str(Decimal(str(a or 0))),
+                       "refunded": str(Decimal(str(r or 0)))} for s, c, n, a, r in rows],
+        "totals": _money(totals),
+        "today": {cur: str(t["net"]) for cur, t in today.items()},
+        "previous_day": {cur: str(t["net"]) for cur, t in previous_day.items()},
+    })
@@ -3,19 +3,13 @@
 from flask import Blueprint, request, jsonify, current_app
 from . import db
 from .models import Product
+from .assets import to_static_url
+from .image_pipeline import image_sources
 from sqlalchemy import or_
 
 search_bp = Blueprint("search_bp", __name__)
 
 
-def to_static_url(path):
-    if not path:
-        return "/static/images/placeholder.jpg"
-    if isinstance(path, str) and (path.startswith("http://") or path.startswith("https://") or path.startswith("/")):
-        return path
-    return "/static/" + path.lstrip("/")
-
-
 @search_bp.route("/api/search", methods=["GET"])
 def api_search():
     """
@@ -63,6 +57,7 @@ def api_search():
                 "description": p.description,
                 "keyNotes": p.keyNotes.split(";") if p.keyNotes else [],
                 "image_url": to_static_url(p.image_url or p.image_url_dynamic),
+                "image_srcset": image_sources(p.image_url or p.image_url_dynamic),
                 "thumbnails": p.thumbnails if p.thumbnails else "",
                 "status": p.status,
                 "quantity": p.quantity,
@@ -11,32 +11,60 @@ Provides:
 """
 from flask import Blueprint, request, jsonify, current_app, session
 from .models import Setting
+from .settings_cache import settings_cache
 from . import db
 import json
+import os
 
 settings_bp = Blueprint("settings_bp", __name__)
 
+# browsers may reuse a settings response this long before revalidating with If-None-Match
+SETTINGS_MAX_AGE = int(os.environ.get("SETTINGS_HTTP_MAX_AGE", "60"))
+
+
+def _set_cache_headers(resp, etag):
+    resp.set_etag(etag, weak=True)
+    if session.get("user") in ("admin", "admin@example.com"):
+        # admins must see their own edits straight away
+        resp.cache_control.private = True
+        resp.cache_control.no_cache = True
+    else:
+        resp.cache_control.public = True
+        resp.cache_control.max_age = SETTINGS_MAX_AGE
+    return resp
+
+
+def _not_modified_or_none(etag):
+    if request.if_none_match.contains_weak(etag):
+        return _set_cache_headers(current_app.response_class(status=304), etag)
+    return None
+
+
+def _settings_json(payload, etag):
+    return _set_cache_headers(jsonify(payload), etag)
+
 
 @settings_bp.route("/api/settings/checkout_discount", methods=["GET"])
 def get_checkout_discount():
     """
     Return JSON: { "percent": 2.5 }
-    Public endpoint (frontend reads it to show advert).
+    Public endpoint (frontend reads it to show advert). Served from settings_cache with a weak
+    ETag of the settings version, so repeat requests get 304 within the browser cache window.
     Defensive: DB errors return 503 and are logged.
     """
     try:
         try:
-            s = Setting.query.get("checkout_discount")
+            etag = f"settings-{settings_cache.version}"
         except Exception as db_exc:
             current_app.logger.exception(
                 "Database error reading checkout_discount: %s", db_exc)
             return jsonify({"error": "database_unavailable", "message": "Settings temporarily unavailable"}), 503
 
-        try:
-            percent = float(s.value) if s and s.value is not None else 0.0
-        except Exception:
-            percent = 0.0
-        return jsonify({"percent": percent})
+        not_modified = _not_modified_or_none(etag)
+        if not_modified is not None:
+            return not_modified
+        percent = settings_cache.get_float("checkout_discount", 0.0)
+        return _settings_json({"percent": percent}, etag)
     except Exception as e:
         current_app.logger.exception(
             "Unexpected error in get_checkout_discount: %s", e)
@@ -69,6 +97,7 @@ def update_checkout_discount():
         else:
             s.value = str(percent)
         db.session.commit()
+        settings_cache.invalidate()
         return jsonify({"success": True, "percent": percent})
     except Exception as e:
         try:
@@ -97,40 +126,27 @@ def get_price_comparison_settings():
       "competitors": [ {name, product_id, our_price?, competitor_price?, margin?}, ... ],
       "global_margin": <number>
     }
+    Served from settings_cache with the same ETag/Cache-Control as checkout_discount.
     Defensive: catches DB errors and returns 503.
     """
     try:
         try:
-            s = Setting.query.get("price_comparison_competitors")
-        except Exception as db_exc:
-            current_app.logger.exception(
-                "Database error reading price_comparison_competitors: %s", db_exc)
-            return jsonify({"error": "database_unavailable", "message": "Settings temporarily unavailable"}), 503
-
-        competitors = []
-        if s and s.value:
-            try:
-                competitors = json.loads(s.value)
-            except Exception:
-                current_app.logger.debug(
-                    "Invalid JSON in price_comparison_competitors setting; returning empty list")
-                competitors = []
-
-        try:
-            gm = Setting.query.get("price_comparison_global_margin")
+            etag = f"settings-{settings_cache.version}"
         except Exception as db_exc:
             current_app.logger.exception(
-                "Database error reading price_comparison_global_margin: %s", db_exc)
+                "Database error reading price comparison settings: %s", db_exc)
             return jsonify({"error": "database_unavailable", "message": "Settings temporarily unavailable"}), 503
 
-        global_margin = 0.0
-        try:
-            global_margin = float(
-                gm.value) if gm and gm.value is not None else 0.0
-        except Exception:
-            global_margin = 0.0
-
-        return jsonify({"competitors": competitors, "global_margin": global_margin})
+        not_modified = _not_modified_or_none(etag)
+        if not_modified is not None:
+            return not_modified
+        competitors = settings_cache.get_json("price_comparison_competitors", [])
+        if not isinstance(competitors, list):
+            current_app.logger.debug(
+                "Invalid JSON in price_comparison_competitors setting; returning empty list")
+            competitors = []
+        global_margin = settings_cache.get_float("price_comparison_global_margin", 0.0)
+        return _settings_json({"competitors": competitors, "global_margin": global_margin}, etag)
     except Exception as e:
         current_app.logger.exception(
             "Failed to get price comparison settings: %s", e)
@@ -220,6 +236,7 @@ def update_price_comparison_settings():
                 gm.value = str(gm_val)
 
         db.session.commit()
+        settings_cache.invalidate()
         return jsonify({"success": True})
     except Exception as e:
         try:
@@ -242,7 +259,7 @@ def push_price_comparison_settings():
     try:
         current_app.logger.info(
             "Price comparison push triggered by admin user %s", session.get("user"))
-        # Future: trigger cache refresh or other publish actions here.
+        settings_cache.invalidate()
         return jsonify({"success": True})
     except Exception as e:
         current_app.logger.exception(
@@ -1,5 +1,8 @@
 from flask import Blueprint, request, jsonify, current_app
+from sqlalchemy import func
+from . import db
 from .models import Product, Order
+from .http_cache import bump_version, http_cached, version_source
 from datetime import datetime
 
 """
@@ -141,10 +144,18 @@ def increment_sales_for_product(product_id, qty=1):
     for tp in TOP_PICKS:
         if str(tp.get("product_id")) == str(product_id):
             tp["sales_count"] = safe_int(tp.get("sales_count", 0)) + q
+    bump_version("top_picks")
+
+
+def _orders_watermark():
+    # Order has no updated_at; sales_count only moves when orders are added or removed
+    latest_id, count = db.session.query(func.max(Order.id), func.count(Order.id)).one()
+    return f"order:{latest_id}:{count}"
 
 
 # --- Routes ---
 @top_picks_bp.route("/api/top-picks", methods=["GET"])
+@http_cached(version_source("top_picks"), Product, _orders_watermark, max_age=30, swr=300)
 def list_top_picks():
     """
     Return enriched list: for each top-pick compute product_title/brand from Product and live sales_count.
@@ -179,6 +190,7 @@ def add_top_pick():
         "sales_count": compute_sales_count_for_product(product_id),
     }
     TOP_PICKS.append(tp)
+    bump_version("top_picks")
     return jsonify({"success": True, "id": new_id}), 201
 
 
@@ -216,6 +228,7 @@ def update_top_pick(tp_id):
         # re-compute sales_count after update
         "sales_count": compute_sales_count_for_product(product_id),
     })
+    bump_version("top_picks")
     return jsonify({"success": True})
 
 
@@ -225,6 +238,7 @@ def delete_top_pick(tp_id):
     if idx is None:
         return jsonify({"error": "Not found"}), 404
     TOP_PICKS.pop(idx)
+    bump_version("top_picks")
     return jsonify({"success": True})
 
 
@@ -237,4 +251,5 @@ def push_top_pick(tp_id):
     # When pushed, also refresh sales_count from DB (ensures freshest numbers)
     TOP_PICKS[idx]["sales_count"] = compute_sales_count_for_product(
         TOP_PICKS[idx].get("product_id"))
+    bump_version("top_picks")
     return jsonify({"success": True})
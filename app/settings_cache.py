@@ -0,0 +1,119 @@
+"""
+app/settings_cache.py
+
+Process-wide, read-mostly cache of the Setting table.
+
+    from .settings_cache import settings_cache
+    percent = settings_cache.get_float("checkout_discount", 0.0)
+    competitors = settings_cache.get_json("price_comparison_competitors", [])
+
+All rows are loaded once per worker and reads are served from memory. At most every
+SETTINGS_REVALIDATE_SECONDS (default 5) a read checks the table's version, i.e.
+(max(updated_at), count(*)), with one aggregate query and reloads only if it moved, so writes
+from other workers show up within a few seconds. The settings PUT handlers call
+invalidate() after committing, so this worker sees its own writes at once.
+
+`version` is a short digest of that watermark, used as the ETag for settings responses.
+"""
+from __future__ import annotations
+import hashlib
+import json
+import os
+import threading
+import time
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+from sqlalchemy import func
+
+from . import db
+from .models import Setting
+
+logger = logging.getLogger(__name__)
+
+REVALIDATE_SECONDS = float(os.environ.get("SETTINGS_REVALIDATE_SECONDS", "5"))
+
+_MISSING = object()
+
+
+class SettingsCache:
+    def __init__(self, revalidate_seconds: float = REVALIDATE_SECONDS):
+        self.revalidate_seconds = revalidate_seconds
+        # (raw values, parsed values) replaced together so a parse never lands in a newer snapshot
+        self._snapshot: Optional[Tuple[Dict[str, str], Dict[Tuple[str, str], Any]]] = None
+        self._watermark: Optional[Tuple[Any, int]] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _read_watermark() -> Tuple[Any, int]:
+        latest, count = db.session.query(func.max(Setting.updated_at), func.count(Setting.key)).one()
+        return latest, int(count or 0)
+
+    def _reload(self) -> None:
+        watermark = self._read_watermark()
+        rows = db.session.query(Setting.key, Setting.value).all()
+        self._snapshot = ({key: value for key, value in rows}, {})
+        self._watermark = watermark
+        self._checked_at = time.monotonic()
+
+    def _fresh(self) -> Tuple[Dict[str, str], Dict[Tuple[str, str], Any]]:
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._checked_at < self.revalidate_seconds:
+            return snapshot
+        with self._lock:
+            if self._snapshot is None:
+                # first load: errors propagate so callers can answer 503 as before
+                self._reload()
+            elif time.monotonic() - self._checked_at >= self.revalidate_seconds:
+                try:
+                    if self._read_watermark() != self._watermark:
+                        self._reload()
+                    else:
+                        self._checked_at = time.monotonic()
+                except Exception:
+                    db.session.rollback()
+                    logger.warning("settings revalidation failed; serving cached values", exc_info=True)
+                    self._checked_at = time.monotonic()
+            return self._snapshot
+
+    def invalidate(self) -> None:
+        """Force a reload on the next read (call after committing a Setting write)."""
+        with self._lock:
+            self._snapshot = None
+
+    @property
+    def version(self) -> str:
+        self._fresh()
+        latest, count = self._watermark or (None, 0)
+        raw = f"{latest.isoformat() if latest else ''}:{count}"
+        return hashlib.sha1(raw.encode()).hexdigest()[:16]
+
+    # ---------- typed reads ----------
+    def get(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        value = self._fresh()[0].get(key)
+        return default if value is None else value
+
+    def _get_parsed(self, key: str, kind: str, parse, default: Any) -> Any:
+        values, parsed_values = self._fresh()
+        hit = parsed_values.get((key, kind), _MISSING)
+        if hit is not _MISSING:
+            return default if hit is None else hit
+        raw = values.get(key)
+        try:
+            parsed = parse(raw) if raw is not None else None
+        except (TypeError, ValueError):
+            logger.debug("setting %s is not valid %s; using default", key, kind)
+            parsed = None
+        parsed_values[(key, kind)] = parsed
+        return default if parsed is None else parsed
+
+    def get_float(self, key: str, default: float = 0.0) -> float:
+        return self._get_parsed(key, "float", float, default)
+
+    def get_json(self, key: str, default: Any = None) -> Any:
+        """Parsed JSON value. Shared between callers: do not mutate the result."""
+        return self._get_parsed(key, "json", json.loads, default)
+
+
+settings_cache = SettingsCache()
@@ -15,7 +15,7 @@ function toStaticUrl(url) {
 async function apiFetch(url, opts = {}) {
     opts = Object.assign({}, opts);
     opts.credentials = opts.credentials || 'include';
-    if (opts.body && typeof opts.body !== 'string' && !(opts.body instanceof FormData)) {
+    if (opts.body && typeof opts.body !== 'string' && !(opts.body instanceof FormData) && !(opts.body instanceof Blob)) {
         opts.headers = Object.assign({ 'Content-Type': 'application/json' }, opts.headers || {});
         opts.body = JSON.stringify(opts.body);
     } else if (opts.body && typeof opts.body === 'string') {
@@ -1369,13 +1369,21 @@ function showOrderModal(order) {
         }
     }
 
+    // raw body upload: the server streams it to disk in chunks instead of parsing a form
+    function uploadContentImage(file) {
+        return apiFetch(`${CONTENT_API}/admin/upload-image`, {
+            method: 'POST',
+            body: file,
+            headers: { 'Content-Type': file.type || 'application/octet-stream', 'X-Filename': encodeURIComponent(file.name) }
+        });
+    }
+
     async function quillImageHandler() {
         const input = document.createElement('input'); input.type = 'file'; input.accept = 'image/*'; input.click();
         input.onchange = async () => {
             const file = input.files[0]; if (!file) return;
-            const fd = new FormData(); fd.append('image', file);
             try {
-                const res = await apiFetch(`${CONTENT_API}/admin/upload-image`, { method: 'POST', body: fd });
+                const res = await uploadContentImage(file);
                 if (!res.ok) { const txt = await extractErrorText(res); alert('Image upload failed: ' + txt); return; }
                 const js = await res.json(); const url = js.url || (js.path ? `/static/${js.path}` : null);
                 if (url) { const range = quill.getSelection(true); quill.insertEmbed(range.index, 'image', url); quill.setSelection(range.index + 1); }
@@ -1392,9 +1400,8 @@ function showOrderModal(order) {
     if (imageFileEl) {
         imageFileEl.addEventListener('change', async (e) => {
             const f = e.target.files[0]; if (!f) return;
-            const fd = new FormData(); fd.append('image', f);
             try {
-                const res = await apiFetch(`${CONTENT_API}/admin/upload-image`, { method: 'POST', body: fd });
+                const res = await uploadContentImage(f);
                 if (!res.ok) { const txt = await extractErrorText(res); showError('Image upload failed: ' + txt); return; }
                 const js = await res.json(); uploadedImagePath = js.url || (js.path ? `/static/${js.path}` : null);
                 if (uploadedPreviewEl) uploadedPreviewEl.innerHTML = uploadedImagePath ? `<img src="${uploadedImagePath}" style="max-width:220px;border-radius:6px;">` : '';
@@ -1468,6 +1475,7 @@ function showOrderModal(order) {
             row.className = 'story-row';
             row.draggable = true;
             row.dataset.id = item.id;
+            row.dataset.updatedAt = item.updated_at || '';
             row.innerHTML = `
                 <div style="display:flex;gap:10px;align-items:center;">
                     <span class="draggable-handle" title="Drag to reorder">☰</span>
@@ -1503,14 +1511,32 @@ function showOrderModal(order) {
     let dragSrcEl = null;
     function adminHandleDragStart(e) { dragSrcEl = e.currentTarget; e.dataTransfer.effectAllowed = 'move'; e.dataTransfer.setData('text/plain', e.currentTarget.dataset.id); e.currentTarget.style.opacity = '0.4'; }
     function adminHandleDragOver(e) { e.preventDefault(); e.dataTransfer.dropEffect = 'move'; e.currentTarget.classList.add('drag-over'); }
-    function adminHandleDrop(e) { e.stopPropagation(); const srcId = e.dataTransfer.getData('text/plain'); const dest = e.currentTarget; if (!srcId || !dest || dest.dataset.id === srcId) return; const srcEl = Array.from(storiesListEl.children).find(n => n.dataset.id === srcId); storiesListEl.insertBefore(srcEl, dest.nextSibling); }
+    function adminHandleDrop(e) { e.stopPropagation(); const srcId = e.dataTransfer.getData('text/plain'); const dest = e.currentTarget; if (!srcId || !dest || dest.dataset.id === srcId) return; const srcEl = Array.from(storiesListEl.children).find(n => n.dataset.id === srcId); storiesListEl.insertBefore(srcEl, dest.nextSibling); moveStoryAdmin(srcEl); }
     function adminHandleDragEnd(e) { e.currentTarget.style.opacity = ''; Array.from(storiesListEl.children).forEach(c => c.classList.remove('drag-over')); }
 
+    // a drop saves right away: only the moved story is sent, with its new neighbours
+    async function moveStoryAdmin(rowEl) {
+        if (!rowEl) return;
+        const above = rowEl.previousElementSibling, below = rowEl.nextElementSibling;
+        const body = { above_id: above ? above.dataset.id : null, below_id: below ? below.dataset.id : null, updated_at: rowEl.dataset.updatedAt || null };
+        try {
+            const res = await apiFetch(`${CONTENT_API}/admin/stories/${rowEl.dataset.id}/move`, { method: 'POST', body });
+            if (res.status === 409) { showError('This story was changed elsewhere; the list has been reloaded.'); fetchStoriesAdmin(); return; }
+            if (!res.ok) { const txt = await extractErrorText(res); showError('Move failed: ' + txt); fetchStoriesAdmin(); return; }
+            const js = await res.json(); rowEl.dataset.updatedAt = js.updated_at || '';
+            setStatus('Order saved');
+        } catch (err) { console.error(err); showError('Move failed (network).'); } finally { setTimeout(() => setStatus(''), 1500); }
+    }
+
     async function saveOrderAdmin() {
-        const ids = Array.from(storiesListEl.children).map(c => c.dataset.id).filter(Boolean);
+        const rows = Array.from(storiesListEl.children).filter(c => c.dataset.id);
+        const ids = rows.map(c => c.dataset.id);
         if (!ids.length) return;
+        const versions = {};
+        rows.forEach(c => { if (c.dataset.updatedAt) versions[c.dataset.id] = c.dataset.updatedAt; });
         try {
-            const res = await apiFetch(`${CONTENT_API}/admin/stories/reorder`, { method: 'POST', body: { ids } });
+            const res = await apiFetch(`${CONTENT_API}/admin/stories/reorder`, { method: 'POST', body: { ids, versions } });
+            if (res.status === 409) { showError('Stories were changed elsewhere; the list has been reloaded.'); fetchStoriesAdmin(); return; }
             if (!res.ok) { const txt = await extractErrorText(res); showError('Save order failed: ' + txt); return; }
             setStatus('Order saved'); fetchStoriesAdmin();
         } catch (err) { console.error(err); showError('Save order failed (network).'); } finally { setTimeout(() => setStatus(''), 1500); }
@@ -1526,7 +1552,7 @@ function showOrderModal(order) {
             editingId = item.id; if (editingIdInputEl) editingIdInputEl.value = item.id; if (editorTitleEl) editorTitleEl.textContent = 'Edit Story';
             if (titleEl) titleEl.value = item.title || ''; if (slugEl) slugEl.value = item.slug || ''; if (sectionEl) sectionEl.value = item.section || '';
             if (excerptEl) excerptEl.value = item.excerpt || ''; if (authorEl) authorEl.value = item.author || '';
-            const detailRes = await apiFetch(`${CONTENT_API}/stories/${item.slug}`);
+            const detailRes = await apiFetch(`${CONTENT_API}/admin/stories/${item.id}`);
             if (detailRes.ok) {
                 const djs = await detailRes.json(); quill.root.innerHTML = djs.body_html || ''; if (bodyHiddenInput) bodyHiddenInput.value = djs.body_html || '';
                 uploadedImagePath = djs.featured_image || null; if (uploadedPreviewEl) uploadedPreviewEl.innerHTML = uploadedImagePath ? `<img src="${uploadedImagePath}" style="max-width:220px;border-radius:6px;">` : '';
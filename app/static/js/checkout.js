@@ -53,10 +53,17 @@
                     return fxRateGBPtoUSD;
                 }
             }
-            const res = await fetch('https://api.exchangerate.host/latest?base=GBP&symbols=USD');
+            // the server quote carries its cached GBP->USD rate (no third-party call from the browser)
+            const cart = getCart();
+            if (!cart.length) throw new Error('No cart to quote');
+            const res = await fetch(`${API}/checkout/quote`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json', Accept: 'application/json' },
+                body: JSON.stringify({ items: cart.map(i => ({ id: i.id || i.product_id, quantity: i.quantity || i.qty || 1 })) })
+            });
             if (!res.ok) throw new Error('Failed to fetch FX');
             const js = await res.json();
-            const rate = Number(js?.rates?.USD || 0);
+            const rate = Number(js?.fx?.rate || 0);
             if (rate && rate > 0) {
                 fxRateGBPtoUSD = rate;
                 localStorage.setItem(FX_CACHE_KEY, JSON.stringify({ rate, ts: Date.now() }));
@@ -817,6 +824,8 @@
                 } else {
                     if (orderMsg) orderMsg.innerHTML = `<div style="color:#27ae60;font-weight:700;">Thank you! Your orders were placed successfully.</div>`;
                     localStorage.removeItem('cart');
+                    // next checkout is a new purchase, not a retry of this one
+                    try { sessionStorage.removeItem('order_idempotency_key'); } catch (e) { /* ignore */ }
                     renderCartSummary();
                     setTimeout(() => {
                         window.location.href = "/";
@@ -522,6 +522,21 @@ async function logOrderAttempt(item, status = "Carted") {
     } catch (error) { /* ignore */ }
 }
 
+// <picture> with AVIF/WebP/JPEG srcsets when the API sent image_srcset (built derivatives),
+// otherwise the plain original image
+const PRODUCT_CARD_SIZES = '(max-width: 600px) 50vw, 400px';
+function productPictureHtml(p) {
+    const src = p.image_url || window.PLACEHOLDER_IMG;
+    const img = (srcset) => `<img src="${src}"${srcset ? ` srcset="${srcset}" sizes="${PRODUCT_CARD_SIZES}"` : ''} alt="${p.title}" class="product-image" loading="lazy" decoding="async" width="400" height="400">`;
+    const sets = p.image_srcset;
+    if (!sets) return img('');
+    const sources = ['avif', 'webp']
+        .filter(fmt => sets[fmt])
+        .map(fmt => `<source type="image/${fmt}" srcset="${sets[fmt]}" sizes="${PRODUCT_CARD_SIZES}">`)
+        .join('');
+    return `<picture>${sources}${img(sets.jpeg || '')}</picture>`;
+}
+
 // Homepage/rendering: include lazy loading and decoding hints
 function createSignatureSection(products) {
     let html = `<section id="signature">
@@ -539,7 +554,7 @@ function createSignatureSection(products) {
             html += `
             <div class="product-card" role="button" tabindex="0">
                 <div class="card-image-wrapper">
-                    <img src="${p.image_url || window.PLACEHOLDER_IMG}" alt="${p.title}" class="product-image" loading="lazy" decoding="async" width="400" height="400">
+                    ${productPictureHtml(p)}
                 </div>
                 <div class="card-details">
                     <div class="card-name">${p.title}</div>
@@ -573,7 +588,7 @@ function createSection(sectionKey, products) {
             html += `
             <div class="product-card" role="button" tabindex="0">
                 <div class="card-image-wrapper">
-                    <img src="${p.image_url || window.PLACEHOLDER_IMG}" alt="${p.title}" class="product-image" loading="lazy" decoding="async" width="400" height="400">
+                    ${productPictureHtml(p)}
                 </div>
                 <div class="card-details">
                     <div class="card-name">${p.title}</div>
@@ -772,16 +787,10 @@ document.addEventListener('DOMContentLoaded', function () {
             }
             if (msgDiv) msgDiv.textContent = 'Checking...';
             try {
-                const res = await fetch(`${API}/coupons`);
-                if (!res.ok) throw new Error('Failed to fetch coupons');
-                const promos = await res.json();
-                const today = new Date().toISOString().slice(0, 10);
-                const found = promos.find(p =>
-                    p.code.toLowerCase() === code.toLowerCase() &&
-                    p.active &&
-                    (!p.start_date || p.start_date <= today) &&
-                    (!p.end_date || p.end_date >= today)
-                );
+                const res = await fetch(`${API}/coupons/validate?code=${encodeURIComponent(code)}`);
+                if (!res.ok) throw new Error('Failed to validate coupon');
+                const js = await res.json();
+                const found = js && js.valid ? js : null;
                 if (!found) {
                     appliedPromo = null;
                     promoDiscountValue = 0;
@@ -493,6 +493,26 @@
       showModal();
     }
 
+    // The listing omits raw_response; load the full record from the detail endpoint on demand.
+    async function showPaymentDetail(payment) {
+      if (!payment || payment.raw_response !== undefined || !payment.id) { showPayment(payment); return; }
+      try {
+        const resp = await fetch(`/payments-admin/api/payments/${encodeURIComponent(payment.id)}`, { credentials: 'same-origin' });
+        if (resp.ok) {
+          const full = await resp.json();
+          if (full.raw_response && typeof full.raw_response === 'string') {
+            try { full.raw_response = JSON.parse(full.raw_response); } catch (e) { /* leave string */ }
+          }
+          showPayment(Object.assign(payment, full));
+          return;
+        }
+        console.warn('Failed to fetch payment detail:', resp.status);
+      } catch (err) {
+        console.error('Error loading payment detail', err);
+      }
+      showPayment(payment);
+    }
+
     // modal close wiring
     closeIcon && closeIcon.addEventListener('click', hideModal);
     closeBtn && closeBtn.addEventListener('click', hideModal);
@@ -811,7 +831,7 @@
 
       const tdActions = document.createElement('td');
       const btnView = document.createElement('button'); btnView.className = 'action-btn'; btnView.textContent = 'View';
-      btnView.addEventListener('click', () => { showPayment(payment); });
+      btnView.addEventListener('click', () => { showPaymentDetail(payment); });
       tdActions.appendChild(btnView);
       tr.appendChild(tdActions);
 
@@ -834,21 +854,52 @@
     }
 
     // --- Fetcher: passes duration params to server ---
+    function applyDurationParams(url) {
+      if (window.__paymentsAdmin && window.__paymentsAdmin.duration) {
+        const d = window.__paymentsAdmin.duration;
+        // Always send duration explicitly to server so server can apply date filters deterministically
+        url.searchParams.set('duration', d.type || 'daily');
+        if ((d.type === 'custom' || d.type === 'custom-range' || d.type === 'custom_range') && d.from) url.searchParams.set('from', d.from);
+        if ((d.type === 'custom' || d.type === 'custom-range' || d.type === 'custom_range') && d.to) url.searchParams.set('to', d.to);
+        // backward-compatible keys
+        if (d.from && d.type !== 'custom') url.searchParams.set('from', d.from);
+        if (d.to && d.type !== 'custom') url.searchParams.set('to', d.to);
+      }
+      return url;
+    }
+
+    // Server-side totals for the whole duration (not just the fetched page).
+    // Resolves to null on failure so callers can fall back to client-side totals.
+    async function fetchSummary() {
+      try {
+        const url = applyDurationParams(new URL('/payments-admin/api/summary', window.location.origin));
+        const resp = await fetch(url.toString(), { credentials: 'same-origin' });
+        if (!resp.ok) { console.warn('Failed to fetch payments summary:', resp.status); return null; }
+        const js = await resp.json();
+        const c = js.currency || 'USD';
+        const t = (js.totals && js.totals[c]) || {};
+        const net = parseAmountCandidate(t.net) || 0;
+        return {
+          filteredTotal: net,
+          cashIn: net,
+          prevDay: parseAmountCandidate(js.previous_day && js.previous_day[c]) || 0,
+          today: parseAmountCandidate(js.today && js.today[c]) || 0,
+          refundedTotal: parseAmountCandidate(t.refunded) || 0,
+          disputedTotal: parseAmountCandidate(t.disputed) || 0,
+          currency: c
+        };
+      } catch (err) {
+        console.error('Error loading payments summary', err);
+        return null;
+      }
+    }
+
     async function fetchPayments(page = 1, per_page = 25) {
       try {
         const url = new URL('/payments-admin/api/payments', window.location.origin);
         url.searchParams.set('page', String(page));
         url.searchParams.set('per_page', String(per_page));
-        if (window.__paymentsAdmin && window.__paymentsAdmin.duration) {
-          const d = window.__paymentsAdmin.duration;
-          // Always send duration explicitly to server so server can apply date filters deterministically
-          url.searchParams.set('duration', d.type || 'daily');
-          if ((d.type === 'custom' || d.type === 'custom-range' || d.type === 'custom_range') && d.from) url.searchParams.set('from', d.from);
-          if ((d.type === 'custom' || d.type === 'custom-range' || d.type === 'custom_range') && d.to) url.searchParams.set('to', d.to);
-          // backward-compatible keys
-          if (d.from && d.type !== 'custom') url.searchParams.set('from', d.from);
-          if (d.to && d.type !== 'custom') url.searchParams.set('to', d.to);
-        }
+        applyDurationParams(url);
         logd('fetchPayments url', url.toString());
         const resp = await fetch(url.toString(), { credentials: 'same-origin' });
         if (!resp.ok) { console.warn('Failed to fetch payments:', resp.status); renderPaymentsTable([]); updateSummaries([]); return; }
@@ -906,10 +957,10 @@
       if (elDisputed) elDisputed.textContent = formatMoney(totals.disputedTotal || 0, c);
     }
 
-    function updateSummaries(payments) {
+    async function updateSummaries(payments) {
       window.__paymentsAdmin = window.__paymentsAdmin || {};
       window.__paymentsAdmin.latestPayments = Array.isArray(payments) ? payments : window.__paymentsAdmin.latestPayments || null;
-      const totals = Array.isArray(payments) ? computeTotalsFromPayments(payments) : computeTotalsFromPayments(window.__paymentsAdmin.latestPayments || []);
+      const totals = (await fetchSummary()) || (Array.isArray(payments) ? computeTotalsFromPayments(payments) : computeTotalsFromPayments(window.__paymentsAdmin.latestPayments || []));
       updateSummaryUI(totals);
       document.dispatchEvent(new CustomEvent('payments:data', { detail: { payments: window.__paymentsAdmin.latestPayments || [] } }));
     }
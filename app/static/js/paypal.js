@@ -36,6 +36,38 @@ async function fetchJsonWithTimeout(url, options = {}, timeout = 15000) {
     };
 }
 
+// Idempotency-Key for create-paypal-order: reused until a capture succeeds so double-clicks
+// and retries get the same PayPal order back instead of creating another one.
+function getPayPalCreateKey() {
+    try {
+        let key = sessionStorage.getItem('paypal_create_key');
+        if (!key) {
+            key = (typeof crypto !== 'undefined' && crypto.randomUUID) ? crypto.randomUUID()
+                : 'pp-' + Date.now() + '-' + Math.random().toString(36).slice(2, 10);
+            sessionStorage.setItem('paypal_create_key', key);
+        }
+        return key;
+    } catch (e) {
+        return 'pp-' + Date.now() + '-' + Math.random().toString(36).slice(2, 10);
+    }
+}
+
+// Price the cart server-side; the signed quote_token is what create-paypal-order charges.
+// Returns null when the quote cannot be built (the caller falls back to raw items).
+async function fetchCheckoutQuote(items, currency) {
+    const promo = document.getElementById('promo_code_summary')?.value || document.getElementById('promo_code_hidden')?.value || '';
+    const res = await fetchJsonWithTimeout(window.location.origin + '/api/checkout/quote', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json', Accept: 'application/json' },
+        body: JSON.stringify({ items: items.map(i => ({ id: i.id, quantity: i.quantity })), coupon_code: promo, currency: currency || 'USD' })
+    }, 10000);
+    if (!res.ok || !res.json || !res.json.quote_token) {
+        console.warn('checkout quote failed', { status: res.status, json: res.json, error: res.error });
+        return null;
+    }
+    return res.json;
+}
+
 async function fetchCartItems() {
     const cart = JSON.parse(localStorage.getItem('cart') || '[]');
     return cart.map(i => ({
@@ -64,14 +96,15 @@ function renderPayPalButtons(containerSelector, opts = {}) {
         style: defaultStyle,
         createOrder: async function (data, actions) {
             const items = await fetchCartItems();
-            const payload = { items, currency: opts.currency || 'USD' };
+            const quote = await fetchCheckoutQuote(items, opts.currency || 'USD');
+            const payload = quote ? { quote_token: quote.quote_token } : { items, currency: opts.currency || 'USD' };
 
             // Use absolute API path to avoid base-tag/path issues
             const endpoint = window.location.origin + '/paypal/create-paypal-order';
 
             const res = await fetchJsonWithTimeout(endpoint, {
                 method: 'POST',
-                headers: { 'Content-Type': 'application/json', Accept: 'application/json' },
+                headers: { 'Content-Type': 'application/json', Accept: 'application/json', 'Idempotency-Key': getPayPalCreateKey() },
                 body: JSON.stringify(payload)
             }, 15000);
 
@@ -107,13 +140,13 @@ function renderPayPalButtons(containerSelector, opts = {}) {
             if (phoneEl) customer.phone = phoneEl.value || '';
             if (addressEl) customer.address = addressEl.value || '';
 
-            const items = await fetchCartItems();
-            const payload = { orderID: data.orderID, customer, items };
+            // no items: the server checks the amount against the signed quote
+            const payload = { orderID: data.orderID, customer };
 
             const endpoint = window.location.origin + '/paypal/capture-paypal-order';
             const res = await fetchJsonWithTimeout(endpoint, {
                 method: 'POST',
-                headers: { 'Content-Type': 'application/json', Accept: 'application/json' },
+                headers: { 'Content-Type': 'application/json', Accept: 'application/json', 'Idempotency-Key': 'capture-' + data.orderID },
                 body: JSON.stringify(payload)
             }, 15000);
 
@@ -125,6 +158,7 @@ function renderPayPalButtons(containerSelector, opts = {}) {
 
             // Clear local cart and redirect to success
             try { localStorage.removeItem('cart'); } catch (e) { /* ignore */ }
+            try { sessionStorage.removeItem('paypal_create_key'); } catch (e) { /* ignore */ }
             if (opts.successUrl) {
                 window.location.href = opts.successUrl;
             } else {
@@ -170,13 +204,18 @@ async function initiateCardCheckout(items, opts = {}) {
             cancel_url: opts.cancelUrl || (window.location.origin + '/paypal/cancel'),
             brand_name: opts.brand_name || document.title || 'Store'
         };
+        const quote = await fetchCheckoutQuote(payload.items, payload.currency);
+        if (quote) payload.quote_token = quote.quote_token;
         // Persist items (and possibly customer) so the /paypal/return page can capture and create orders.
         try { localStorage.setItem('paypal_items', JSON.stringify(payload.items)); } catch (e) { /* ignore */ }
 
+        // the redirect flow captures on /paypal/return, so use a one-off key (covers retries only)
+        const createKey = (typeof crypto !== 'undefined' && crypto.randomUUID) ? crypto.randomUUID()
+            : 'pp-' + Date.now() + '-' + Math.random().toString(36).slice(2, 10);
         const endpoint = window.location.origin + '/paypal/create-paypal-order';
         const res = await fetchJsonWithTimeout(endpoint, {
             method: 'POST',
-            headers: { 'Content-Type': 'application/json', Accept: 'application/json' },
+            headers: { 'Content-Type': 'application/json', Accept: 'application/json', 'Idempotency-Key': createKey },
             body: JSON.stringify(payload)
         }, 15000);
 
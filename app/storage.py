@@ -0,0 +1,171 @@
+"""
+app/storage.py
+
+Where uploaded files live. Keys are '/'-separated paths such as
+'uploads/content/20260131_hero.jpg'; every backend maps a key to a public URL.
+
+    storage = get_storage()
+    storage.put_file("uploads/content/x.jpg", "/tmp/upload-abc", "image/jpeg")
+    storage.url("uploads/content/x.jpg")   # '/static/uploads/content/x.jpg' or the bucket URL
+
+Backends (STORAGE_BACKEND):
+  local (default)  files under app/static, served by the static route. Each replica has
+                   its own disk, so use this for single-instance/dev setups.
+  s3               any S3-compatible API (AWS S3, MinIO, R2, ...). Needs boto3 and
+                   S3_BUCKET; S3_ENDPOINT_URL points at MinIO/R2, S3_PUBLIC_BASE_URL is the
+                   public prefix for object URLs (default <endpoint>/<bucket>),
+                   S3_ACCESS_KEY_ID / S3_SECRET_ACCESS_KEY / S3_REGION are optional
+                   (boto3 falls back to its usual credential chain).
+"""
+from __future__ import annotations
+import os
+import shutil
+import threading
+import logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+STATIC_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+UPLOAD_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class StorageError(RuntimeError):
+    pass
+
+
+def _check_key(key: str) -> str:
+    key = key.lstrip("/")
+    if not key or ".." in key.split("/"):
+        raise StorageError(f"invalid storage key: {key!r}")
+    return key
+
+
+class LocalStorage:
+    """Files under a local directory (app/static by default), served at base_url."""
+
+    name = "local"
+
+    def __init__(self, root: str = STATIC_ROOT, base_url: str = "/static"):
+        self.root = root
+        self.base_url = base_url.rstrip("/")
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, *_check_key(key).split("/"))
+
+    def put_file(self, key: str, src_path: str, content_type: Optional[str] = None) -> str:
+        dest = self._path(key)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        tmp = f"{dest}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.copyfile(src_path, tmp)
+        os.replace(tmp, dest)
+        return self.url(key)
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def exists(self, key: str) -> bool:
+        return os.path.isfile(self._path(key))
+
+    def url(self, key: str) -> str:
+        return f"{self.base_url}/{_check_key(key)}"
+
+    def key_for_url(self, url: str) -> Optional[str]:
+        prefix = self.base_url + "/"
+        return url[len(prefix):] if url.startswith(prefix) else None
+
+
+class S3Storage:
+    """Objects in an S3-compatible bucket; uploads are public-read by bucket policy, not ACL."""
+
+    name = "s3"
+
+    def __init__(self, bucket: str, endpoint_url: Optional[str] = None, region: Optional[str] = None,
+                 access_key_id: Optional[str] = None, secret_access_key: Optional[str] = None,
+                 public_base_url: Optional[str] = None, client=None):
+        if client is None:
+            try:
+                import boto3  # type: ignore  # optional and slow to import; only for this backend
+            except Exception:
+                raise StorageError("STORAGE_BACKEND=s3 requires the boto3 package")
+            client = boto3.client("s3", endpoint_url=endpoint_url, region_name=region,
+                                  aws_access_key_id=access_key_id,
+                                  aws_secret_access_key=secret_access_key)
+        self.client = client
+        self.bucket = bucket
+        if public_base_url:
+            self.public_base_url = public_base_url.rstrip("/")
+        elif endpoint_url:
+            # path-style URL, which is what MinIO serves out of the box
+            self.public_base_url = f"{endpoint_url.rstrip('/')}/{bucket}"
+        else:
+            self.public_base_url = f"https://{bucket}.s3.{region or 'us-east-1'}.amazonaws.com"
+
+    def put_file(self, key: str, src_path: str, content_type: Optional[str] = None) -> str:
+        key = _check_key(key)
+        extra = {"CacheControl": UPLOAD_CACHE_CONTROL}
+        if content_type:
+            extra["ContentType"] = content_type
+        # upload_file streams from disk and switches to multipart for large files
+        self.client.upload_file(src_path, self.bucket, key, ExtraArgs=extra)
+        return self.url(key)
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=_check_key(key))
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=_check_key(key))
+            return True
+        except Exception:
+            return False
+
+    def url(self, key: str) -> str:
+        return f"{self.public_base_url}/{_check_key(key)}"
+
+    def key_for_url(self, url: str) -> Optional[str]:
+        prefix = self.public_base_url + "/"
+        return url[len(prefix):] if url.startswith(prefix) else None
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def _from_env():
+    backend = (os.environ.get("STORAGE_BACKEND") or "local").lower()
+    if backend == "local":
+        return LocalStorage(root=os.environ.get("STORAGE_LOCAL_ROOT") or STATIC_ROOT,
+                            base_url=os.environ.get("STORAGE_LOCAL_BASE_URL") or "/static")
+    if backend == "s3":
+        bucket = os.environ.get("S3_BUCKET")
+        if not bucket:
+            raise StorageError("STORAGE_BACKEND=s3 requires S3_BUCKET")
+        return S3Storage(bucket=bucket,
+                         endpoint_url=os.environ.get("S3_ENDPOINT_URL") or None,
+                         region=os.environ.get("S3_REGION") or None,
+                         access_key_id=os.environ.get("S3_ACCESS_KEY_ID") or None,
+                         secret_access_key=os.environ.get("S3_SECRET_ACCESS_KEY") or None,
+                         public_base_url=os.environ.get("S3_PUBLIC_BASE_URL") or None)
+    raise StorageError(f"unknown STORAGE_BACKEND {backend!r}")
+
+
+def get_storage():
+    """The configured storage backend (built from the environment on first use)."""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                _storage = _from_env()
+                logger.info("upload storage backend: %s", _storage.name)
+    return _storage
+
+
+def set_storage(storage) -> None:
+    """Replace the backend (e.g. from an app factory or a maintenance script)."""
+    global _storage
+    with _storage_lock:
+        _storage = storage
@@ -0,0 +1,163 @@
+"""
+app/story_order.py
+
+Manual ordering of stories (Story.position, higher first).
+
+Positions are spaced POSITION_GAP apart (STORY_POSITION_GAP, default 1024), so a single
+drag-and-drop move only rewrites the moved row:
+
+    move_story(7, above_id=3, below_id=12)   # position = midpoint of 3 and 12
+
+When two neighbours have no integer left between them the whole list is respaced in the
+same transaction (one UPDATE) and the midpoint is taken again.
+
+apply_order([3, 7, 1, 2]) writes a full order in a single
+`UPDATE story SET position = CASE id WHEN ... END WHERE id IN (...)`.
+
+Both take the updated_at values the client last saw (optimistic concurrency): the check is
+part of the UPDATE's WHERE clause, and if any row changed in the meantime nothing is written
+and ReorderConflict lists the stale ids. Every write bumps updated_at, so a second admin
+working from the old list gets the conflict instead of silently undoing the first one.
+"""
+from __future__ import annotations
+import os
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import case, or_, update
+
+from . import db
+from .models import Story
+
+POSITION_GAP = max(2, int(os.environ.get("STORY_POSITION_GAP", "1024")))
+
+
+class ReorderError(ValueError):
+    pass
+
+
+class ReorderConflict(Exception):
+    def __init__(self, stale_ids: Iterable[int]):
+        self.stale_ids = sorted(stale_ids)
+        super().__init__(f"stories changed since they were loaded: {self.stale_ids}")
+
+
+def parse_versions(raw) -> Dict[int, datetime]:
+    """{"3": "2026-01-31T10:00:00.123456", ...} -> {3: datetime}; ReorderError if malformed."""
+    if raw is None:
+        return {}
+    if not isinstance(raw, dict):
+        raise ReorderError("versions must be an object of id -> updated_at")
+    try:
+        return {int(k): datetime.fromisoformat(v) for k, v in raw.items()}
+    except (TypeError, ValueError):
+        raise ReorderError("versions must map story ids to ISO timestamps")
+
+
+def _stale_ids(versions: Dict[int, datetime]) -> List[int]:
+    rows = db.session.query(Story.id, Story.updated_at).filter(Story.id.in_(list(versions))).all()
+    current = dict(rows)
+    return [sid for sid, seen in versions.items() if current.get(sid) != seen]
+
+
+def _write_positions(positions: Dict[int, int], versions: Optional[Dict[int, datetime]] = None,
+                     now: Optional[datetime] = None) -> int:
+    """One UPDATE for all rows; returns the number of rows written (fewer when a version is stale)."""
+    if not positions:
+        return 0
+    stmt = update(Story).where(Story.id.in_(list(positions)))
+    checked = {sid: ts for sid, ts in (versions or {}).items() if sid in positions}
+    if len(positions) == 1:
+        position = next(iter(positions.values()))
+        if checked:
+            stmt = stmt.where(Story.updated_at == next(iter(checked.values())))
+    else:
+        position = case(positions, value=Story.id)
+        if checked:
+            # only versioned rows are guarded: updated_at may be NULL on the others
+            stmt = stmt.where(or_(Story.id.notin_(list(checked)),
+                                  Story.updated_at == case(checked, value=Story.id)))
+    stmt = stmt.values(position=position, updated_at=now or datetime.utcnow()) \
+        .execution_options(synchronize_session=False)
+    return db.session.execute(stmt).rowcount
+
+
+def _conflict(versions: Dict[int, datetime]) -> ReorderConflict:
+    db.session.rollback()
+    return ReorderConflict(_stale_ids(versions))
+
+
+def apply_order(ids: List[int], versions: Optional[Dict[int, datetime]] = None) -> Dict[int, int]:
+    """
+    Give `ids` descending, gap-spaced positions (first id highest) in one statement.
+    Every id must be written: LookupError(missing ids) for ids with no story, else
+    ReorderConflict when a versioned row was stale. Nothing is kept in either case.
+    """
+    if len(set(ids)) != len(ids):
+        raise ReorderError("ids must not repeat")
+    positions = {sid: (len(ids) - i) * POSITION_GAP for i, sid in enumerate(ids)}
+    versions = {sid: ts for sid, ts in (versions or {}).items() if sid in positions}
+    if _write_positions(positions, versions) != len(positions):
+        db.session.rollback()
+        existing = {sid for (sid,) in db.session.query(Story.id).filter(Story.id.in_(ids)).all()}
+        missing = [sid for sid in ids if sid not in existing]
+        if missing:
+            raise LookupError(missing)
+        raise ReorderConflict(_stale_ids(versions))
+    return positions
+
+
+def respace_all(versions: Optional[Dict[int, datetime]] = None,
+                now: Optional[datetime] = None) -> Optional[Dict[int, int]]:
+    """
+    Rewrite every position as a multiple of POSITION_GAP, keeping the current order.
+    Returns None if a row in `versions` is stale; the caller rolls back.
+    """
+    ids = [sid for (sid,) in db.session.query(Story.id)
+           .order_by(Story.position.desc(), Story.created_at.desc(), Story.id.desc()).all()]
+    positions = {sid: (len(ids) - i) * POSITION_GAP for i, sid in enumerate(ids)}
+    if _write_positions(positions, versions, now=now) != len(positions):
+        return None
+    return positions
+
+
+def move_story(story_id: int, above_id: Optional[int] = None, below_id: Optional[int] = None,
+               expected_updated_at: Optional[datetime] = None) -> int:
+    """
+    Place one story between its new neighbours (above = shown before it, i.e. higher
+    position). Usually a single-row UPDATE; returns the new position.
+    """
+    if above_id is None and below_id is None:
+        raise ReorderError("above_id or below_id required")
+    if story_id in (above_id, below_id):
+        raise ReorderError("a story cannot be its own neighbour")
+    wanted = [sid for sid in (story_id, above_id, below_id) if sid is not None]
+    versions = {story_id: expected_updated_at} if expected_updated_at else {}
+    now = datetime.utcnow()
+
+    for attempt in range(2):
+        rows = dict(db.session.query(Story.id, Story.position).filter(Story.id.in_(wanted)).all())
+        missing = [sid for sid in wanted if sid not in rows]
+        if missing:
+            raise LookupError(missing)
+        above = rows[above_id] if above_id is not None else None
+        below = rows[below_id] if below_id is not None else None
+        if above is None:
+            new_pos = below + POSITION_GAP
+        elif below is None:
+            new_pos = above - POSITION_GAP
+        elif above - below >= 2:
+            new_pos = below + (above - below) // 2
+        elif attempt == 0:
+            # no room between the neighbours (or they are out of order): respace, retry once
+            if respace_all(versions, now=now) is None:
+                raise _conflict(versions)
+            if versions:
+                versions = {story_id: now}
+            continue
+        else:
+            raise ReorderError("above_id must be ordered before below_id")
+        if _write_positions({story_id: new_pos}, versions, now=now) != 1:
+            raise _conflict(versions) if versions else LookupError([story_id])
+        return new_pos
+    raise ReorderError("could not place story")  # pragma: no cover
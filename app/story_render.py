@@ -0,0 +1,227 @@
+"""
+app/story_render.py
+
+Save-time rendering of story bodies.
+
+The admin editor (Quill) posts arbitrary HTML in body_html. render_story_body() turns it
+into the HTML the site serves, once, when the story is saved:
+
+- sanitize: allow-listed tags and attributes only; script/style/iframe and the like are
+  dropped with their content; href/src must be http(s), mailto, tel or site-relative;
+  target=_blank links get rel="noopener noreferrer";
+- images: the src goes through to_static_url() (content-hashed / storage URL) and, when
+  responsive derivatives exist (app/image_pipeline.py), the <img> is wrapped in a <picture>
+  with AVIF/WebP sources and a JPEG srcset; every image after the first gets
+  loading="lazy", and all get decoding="async";
+- reading time: words / READING_WPM, at least one minute.
+
+apply_rendering(story) stores the result in Story.body_rendered / reading_minutes; the
+public API and /story/<slug> serve that column. Rows saved before this existed are rendered
+on read until `flask render-stories` backfills them. Upload derivatives are built in the
+background, so app/uploads.py calls rerender_stories_referencing() once they are recorded.
+"""
+from __future__ import annotations
+import math
+import os
+import re
+import logging
+from html import escape
+from html.parser import HTMLParser
+from typing import List, Optional, Tuple
+
+import click
+
+from . import db
+from .assets import to_static_url
+from .image_pipeline import image_sources
+from .models import Story
+
+logger = logging.getLogger(__name__)
+
+READING_WPM = int(os.environ.get("STORY_READING_WPM", "200"))
+IMAGE_SIZES = "(max-width: 800px) 100vw, 800px"
+IMAGE_WIDTH = 800
+
+ALLOWED_TAGS = {
+    "p", "br", "hr", "div", "span", "strong", "b", "em", "i", "u", "s", "sub", "sup",
+    "a", "ul", "ol", "li", "h1", "h2", "h3", "h4", "h5", "h6", "blockquote", "pre", "code",
+    "img", "figure", "figcaption", "table", "thead", "tbody", "tr", "th", "td",
+}
+VOID_TAGS = {"br", "hr", "img"}
+DROP_CONTENT_TAGS = {"script", "style", "iframe", "object", "embed", "template", "noscript",
+                     "textarea", "select", "svg", "math"}
+GLOBAL_ATTRS = {"class", "title"}
+TAG_ATTRS = {
+    "a": {"href", "target", "rel"},
+    "img": {"src", "alt", "width", "height"},
+    "ol": {"start"},
+    "td": {"colspan", "rowspan"},
+    "th": {"colspan", "rowspan"},
+}
+URL_ATTRS = {"href", "src"}
+_SAFE_URL = re.compile(r"^(https?:|mailto:|tel:|/|#|[^:/?#]+(?:[/?#]|$))", re.IGNORECASE)
+_CLASS_TOKEN = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+def _safe_url(value: str) -> Optional[str]:
+    value = (value or "").strip()
+    # browsers ignore embedded whitespace/control chars in schemes ("java\tscript:")
+    compact = re.sub(r"[\x00-\x20]+", "", value)
+    if not compact or not _SAFE_URL.match(compact):
+        return None
+    return value
+
+
+class _Renderer(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.out: List[str] = []
+        self.words = 0
+        self.images = 0
+        self._stack: List[str] = []
+        self._drop_depth = 0
+
+    # ----- helpers -----
+    def _attrs(self, tag: str, attrs) -> List[Tuple[str, str]]:
+        allowed = GLOBAL_ATTRS | TAG_ATTRS.get(tag, set())
+        clean = []
+        for name, value in attrs:
+            name = name.lower()
+            if name not in allowed or value is None:
+                continue
+            if name in URL_ATTRS:
+                value = _safe_url(value)
+                if value is None:
+                    continue
+            elif name == "class":
+                value = " ".join(t for t in value.split() if _CLASS_TOKEN.match(t))
+                if not value:
+                    continue
+            elif name == "target" and value not in ("_blank", "_self"):
+                continue
+            clean.append((name, value))
+        return clean
+
+    @staticmethod
+    def _tag(tag: str, attrs: List[Tuple[str, str]]) -> str:
+        rendered = "".join(f' {k}="{escape(v, quote=True)}"' for k, v in attrs)
+        return f"<{tag}{rendered}>"
+
+    def _image(self, attrs: List[Tuple[str, str]]) -> str:
+        attrs = dict(attrs)
+        src = attrs.pop("src", None)
+        if not src:
+            return ""
+        sources = image_sources(src)
+        attrs["src"] = to_static_url(src, width=IMAGE_WIDTH) if sources else to_static_url(src)
+        attrs.setdefault("alt", "")
+        if self.images:
+            attrs["loading"] = "lazy"
+        attrs["decoding"] = "async"
+        self.images += 1
+        if not sources:
+            return self._tag("img", list(attrs.items()))
+        if sources.get("jpeg"):
+            attrs["srcset"] = sources["jpeg"]
+            attrs["sizes"] = IMAGE_SIZES
+        picture = ["<picture>"]
+        for fmt in ("avif", "webp"):
+            if sources.get(fmt):
+                picture.append(self._tag("source", [("type", f"image/{fmt}"), ("srcset", sources[fmt]),
+                                                    ("sizes", IMAGE_SIZES)]))
+        picture.append(self._tag("img", list(attrs.items())))
+        picture.append("</picture>")
+        return "".join(picture)
+
+    # ----- parser callbacks -----
+    def handle_starttag(self, tag, attrs):
+        if self._drop_depth or tag in DROP_CONTENT_TAGS:
+            if tag not in VOID_TAGS:
+                self._drop_depth += 1
+            return
+        if tag not in ALLOWED_TAGS:
+            return
+        clean = self._attrs(tag, attrs)
+        if tag == "img":
+            self.out.append(self._image(clean))
+            return
+        if tag == "a" and ("target", "_blank") in clean:
+            clean = [(k, v) for k, v in clean if k != "rel"] + [("rel", "noopener noreferrer")]
+        self.out.append(self._tag(tag, clean))
+        if tag not in VOID_TAGS:
+            self._stack.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS and tag in ALLOWED_TAGS and not self._drop_depth \
+                and self._stack and self._stack[-1] == tag:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if self._drop_depth:
+            if tag not in VOID_TAGS:
+                self._drop_depth -= 1
+            return
+        if tag not in ALLOWED_TAGS or tag in VOID_TAGS or tag not in self._stack:
+            return
+        # close anything left open inside this element
+        while self._stack:
+            open_tag = self._stack.pop()
+            self.out.append(f"</{open_tag}>")
+            if open_tag == tag:
+                break
+
+    def handle_data(self, data):
+        if self._drop_depth:
+            return
+        self.words += len(data.split())
+        self.out.append(escape(data, quote=False))
+
+    def close(self):
+        super().close()
+        while self._stack:
+            self.out.append(f"</{self._stack.pop()}>")
+
+
+def render_story_body(html: Optional[str]) -> Tuple[str, int, int]:
+    """Sanitized, post-processed HTML plus (word count, reading minutes)."""
+    renderer = _Renderer()
+    renderer.feed(html or "")
+    renderer.close()
+    words = renderer.words
+    minutes = max(1, math.ceil(words / READING_WPM)) if words else 0
+    return "".join(renderer.out), words, minutes
+
+
+def apply_rendering(story: Story) -> None:
+    story.body_rendered, _words, story.reading_minutes = render_story_body(story.body_html)
+
+
+def rerender_stories_referencing(path: str) -> int:
+    """Re-render stories whose body mentions `path` (e.g. once an upload's derivatives exist)."""
+    try:
+        stories = Story.query.filter(Story.body_html.contains(path)).all()
+        for s in stories:
+            apply_rendering(s)
+        if stories:
+            db.session.commit()
+        return len(stories)
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def register_story_cli(app) -> None:
+    @app.cli.command("render-stories")
+    @click.option("--all", "render_all", is_flag=True, help="Re-render every story, not only unrendered ones.")
+    def render_stories_command(render_all):
+        """Render story bodies (sanitize, responsive images, reading time) into body_rendered."""
+        q = Story.query
+        if not render_all:
+            q = q.filter(Story.body_rendered.is_(None))
+        count = 0
+        for s in q.all():
+            apply_rendering(s)
+            count += 1
+        db.session.commit()
+        click.echo(f"rendered {count} story body(ies)")
@@ -0,0 +1,235 @@
+"""
+app/uploads.py
+
+Image uploads for the admin screens.
+
+    upload = receive_image(request, allowed_extensions={"jpg", "png"})   # UploadError on bad input
+    info = store_image_upload(upload, folder="content")
+    # {"url": ..., "path": "uploads/content/<ts>_<name>.jpg", "derivatives": "pending"}
+
+receive_image() accepts either a raw body (Content-Type: image/*, file name in X-Filename)
+or a multipart form field. Either way the bytes are copied to a temp file in CHUNK_SIZE
+pieces and the copy stops with a 413 as soon as UPLOAD_MAX_BYTES (default 10 MiB) is
+passed; a Content-Length over the limit is refused before anything is read. The first
+bytes must carry a JPEG/PNG/GIF/WebP signature, and the stored extension comes from that
+signature, not from the client's file name.
+
+store_image_upload() puts the original into the configured storage backend
+(app/storage.py) on the request thread, so the returned URL works immediately, and hands
+the resizing to a small thread pool (UPLOAD_WORKERS, default 2). The worker builds the
+image_pipeline derivatives in a scratch directory, uploads them to the same backend and
+records them, then re-renders stories that already embed the image; the srcset shows up
+in the API once that is done. Jobs are in-process: a worker that dies mid-job loses it,
+and `flask build-image-derivatives` can rebuild.
+"""
+from __future__ import annotations
+import os
+import shutil
+import tempfile
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Iterable, Optional
+from urllib.parse import unquote
+
+from flask import current_app
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.utils import secure_filename
+
+from .image_pipeline import SOURCE_EXTENSIONS, available_formats, record_derivatives, render_source
+from .storage import get_storage
+from .story_render import rerender_stories_referencing
+
+logger = logging.getLogger(__name__)
+
+MAX_BYTES = int(os.environ.get("UPLOAD_MAX_BYTES", str(10 * 1024 * 1024)))
+CHUNK_SIZE = 64 * 1024
+WORKERS = int(os.environ.get("UPLOAD_WORKERS", "2"))
+TMP_DIR = os.environ.get("UPLOAD_TMP_DIR") or None
+# multipart boundaries and headers on top of the file itself
+MULTIPART_OVERHEAD = 64 * 1024
+
+# kind -> (stored extension, content type)
+IMAGE_KINDS = {
+    "jpeg": ("jpg", "image/jpeg"),
+    "png": ("png", "image/png"),
+    "gif": ("gif", "image/gif"),
+    "webp": ("webp", "image/webp"),
+}
+DERIVATIVE_CONTENT_TYPES = {"avif": "image/avif", "webp": "image/webp", "jpeg": "image/jpeg"}
+
+
+class UploadError(ValueError):
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+class ReceivedUpload:
+    """A validated upload sitting in a temp file; the caller owns tmp_path until it is stored."""
+
+    __slots__ = ("tmp_path", "filename", "kind", "size")
+
+    def __init__(self, tmp_path: str, filename: str, kind: str, size: int):
+        self.tmp_path = tmp_path
+        self.filename = filename
+        self.kind = kind
+        self.size = size
+
+    def discard(self) -> None:
+        try:
+            os.remove(self.tmp_path)
+        except FileNotFoundError:
+            pass
+
+
+def sniff_image(head: bytes) -> Optional[str]:
+    """Image kind from the file signature, or None."""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    return None
+
+
+def _extension(filename: str) -> str:
+    return filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+
+
+def _copy_limited(src, dst, limit: int) -> int:
+    total = 0
+    while True:
+        chunk = src.read(CHUNK_SIZE)
+        if not chunk:
+            return total
+        total += len(chunk)
+        if total > limit:
+            raise UploadError("File too large", 413)
+        dst.write(chunk)
+
+
+def receive_image(req, field: str = "image", allowed_extensions: Optional[Iterable[str]] = None,
+                  max_bytes: Optional[int] = None) -> ReceivedUpload:
+    """Stream the uploaded image to a temp file, enforcing the size cap and the signature check."""
+    max_bytes = max_bytes or MAX_BYTES
+    if req.content_length is not None and req.content_length > max_bytes + MULTIPART_OVERHEAD:
+        raise UploadError("File too large", 413)
+    # werkzeug stops reading the body past this, for both the form parser and req.stream
+    req.max_content_length = max_bytes + MULTIPART_OVERHEAD
+
+    if req.mimetype == "multipart/form-data":
+        try:
+            files = req.files
+        except RequestEntityTooLarge:
+            raise UploadError("File too large", 413)
+        if field not in files:
+            raise UploadError("No file provided")
+        file = files[field]
+        filename = file.filename or ""
+        stream = file.stream
+    else:
+        filename = unquote(req.headers.get("X-Filename") or req.args.get("filename") or "")
+        if not req.content_length and not req.headers.get("Transfer-Encoding"):
+            raise UploadError("No file provided")
+        stream = req.stream
+    if filename == "":
+        raise UploadError("Empty filename")
+    if allowed_extensions is not None and _extension(filename) not in allowed_extensions:
+        raise UploadError("Invalid file type")
+
+    fd, tmp_path = tempfile.mkstemp(prefix="upload-", dir=TMP_DIR)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            size = _copy_limited(stream, out, max_bytes)
+        with open(tmp_path, "rb") as fh:
+            kind = sniff_image(fh.read(16))
+        if size == 0:
+            raise UploadError("No file provided")
+        if kind is None:
+            raise UploadError("File content is not a supported image")
+        return ReceivedUpload(tmp_path, filename, kind, size)
+    except RequestEntityTooLarge:
+        os.remove(tmp_path)
+        raise UploadError("File too large", 413)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def store_image_upload(upload: ReceivedUpload, folder: str = "content") -> dict:
+    """Store the original now, queue the derivatives; takes ownership of upload.tmp_path."""
+    ext, content_type = IMAGE_KINDS[upload.kind]
+    stem = secure_filename(upload.filename.rsplit(".", 1)[0]) or "image"
+    timestamp = datetime.utcnow().strftime("%Y%m%d%H%M%S%f")
+    key = f"uploads/{folder}/{timestamp}_{stem}.{ext}"
+    try:
+        url = get_storage().put_file(key, upload.tmp_path, content_type)
+    except Exception:
+        upload.discard()
+        raise
+
+    if f".{ext}" in SOURCE_EXTENSIONS and available_formats():
+        app = current_app._get_current_object()
+        _get_executor().submit(_derivative_job, app, key, upload.tmp_path)
+        derivatives = "pending"
+    else:
+        upload.discard()
+        derivatives = None
+    return {"url": url, "path": key, "derivatives": derivatives}
+
+
+# ---------- background derivative jobs ----------
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=max(1, WORKERS),
+                                               thread_name_prefix="upload-worker")
+    return _executor
+
+
+def shutdown_upload_workers(wait: bool = True) -> None:
+    """Stop the pool (finishing queued jobs when wait=True); the next upload starts a new one."""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait)
+
+
+def _derivative_job(app, key: str, tmp_path: str) -> None:
+    work = tempfile.mkdtemp(prefix="derive-", dir=TMP_DIR)
+    try:
+        src = os.path.join(work, *key.split("/"))
+        os.makedirs(os.path.dirname(src), exist_ok=True)
+        shutil.move(tmp_path, src)
+        result = render_source(key, static_root=work)
+        if result["error"]:
+            logger.warning("upload derivatives failed for %s: %s", key, result["error"])
+            return
+        storage = get_storage()
+        for d in result["derivatives"]:
+            storage.put_file(d["path"], os.path.join(work, *d["path"].split("/")),
+                             DERIVATIVE_CONTENT_TYPES[d["format"]])
+        with app.app_context():
+            record_derivatives([result])
+            # stories saved while this job ran were rendered without the srcset
+            rerender_stories_referencing(key)
+        logger.info("built %d derivative(s) for %s", len(result["derivatives"]), key)
+    except Exception:
+        logger.exception("upload derivative job failed for %s", key)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -0,0 +1,9 @@
+"""
+ASGI entry point (see app/asgi.py):
+
+    uvicorn asgi:app --host 0.0.0.0 --port 8000 --workers 4
+"""
+from app.asgi import AsgiApp
+from run import app as flask_app
+
+app = AsgiApp(flask_app)
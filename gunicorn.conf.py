@@ -0,0 +1,35 @@
+"""
+Gunicorn settings (loaded automatically from the working directory).
+
+    gunicorn run:app
+
+Defaults match the previous command line (-w 4 --threads 2 --timeout 120) and every value
+can be overridden from the environment or on the command line. With GUNICORN_PRELOAD=1
+(the default) the master imports the app and warms its caches once, then forks the
+workers; see app/prefork.py. GUNICORN_PRELOAD=0 goes back to each worker importing the
+app itself (needed for `--reload` in development).
+"""
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", "4"))
+threads = int(os.environ.get("GUNICORN_THREADS", "2"))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "120"))
+preload_app = os.environ.get("GUNICORN_PRELOAD", "1").lower() not in ("0", "false", "no")
+
+
+def _flask_app(server):
+    # the WSGI callable from run:app, already imported in the master when preloading
+    return server.app.wsgi()
+
+
+def when_ready(server):
+    if server.cfg.preload_app:
+        from app.prefork import warm_caches
+        warm_caches(_flask_app(server))
+
+
+def post_fork(server, worker):
+    if server.cfg.preload_app:
+        from app.prefork import after_fork
+        after_fork(_flask_app(server))
@@ -0,0 +1,108 @@
+"""Track refunded amounts on payments and the daily rollup
+
+Revision ID: a8e3c6d2f915
+Revises: f1d6c3b8a927
+Create Date: 2026-02-05 10:12:47.531906
+
+"""
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a8e3c6d2f915'
+down_revision = 'f1d6c3b8a927'
+branch_labels = None
+depends_on = None
+
+
+payments = sa.table('payments',
+    sa.column('id', sa.Integer),
+    sa.column('created_at', sa.DateTime),
+    sa.column('status', sa.String),
+    sa.column('currency', sa.String),
+    sa.column('amount', sa.Numeric(12, 2)),
+    sa.column('refunded_amount', sa.Numeric(12, 2)),
+    sa.column('raw_response', sa.JSON),
+)
+payment_daily_rollup = sa.table('payment_daily_rollup',
+    sa.column('day', sa.Date),
+    sa.column('status', sa.String),
+    sa.column('currency', sa.String),
+    sa.column('payment_count', sa.Integer),
+    sa.column('amount_total', sa.Numeric(14, 2)),
+    sa.column('refunded_total', sa.Numeric(14, 2)),
+    sa.column('updated_at', sa.DateTime),
+)
+REFUND_STATUSES = ('refunded', 'partially_refunded')
+
+
+def _completed_refunds(raw):
+    """(refund id, amount) of the completed refunds the admin refund call stored in raw_response."""
+    out = []
+    refunds = raw.get('_refunds') if isinstance(raw, dict) else None
+    for refund in refunds or []:
+        if not isinstance(refund, dict) or (refund.get('status') or '').upper() != 'COMPLETED':
+            continue
+        try:
+            value = Decimal(str((refund.get('amount') or {}).get('value')))
+        except (InvalidOperation, ValueError):
+            continue
+        out.append((refund.get('id'), value))
+    return out
+
+
+def upgrade():
+    with op.batch_alter_table('payments', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('refunded_amount', sa.Numeric(precision=12, scale=2), server_default='0', nullable=False))
+    with op.batch_alter_table('payment_daily_rollup', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('refunded_total', sa.Numeric(precision=14, scale=2), server_default='0', nullable=False))
+
+    # backfill from the refunds recorded so far: the stored refund responses where there are
+    # any, else the whole amount for 'refunded'. A partial refund known only from a webhook
+    # left no amount behind and stays at 0. The admin refund path used to mark partial
+    # refunds 'refunded'; those become 'partially_refunded' (not reverted by downgrade).
+    bind = op.get_bind()
+    rows = bind.execute(sa.select(payments.c.id, payments.c.status, payments.c.amount, payments.c.raw_response)
+                        .where(payments.c.status.in_(REFUND_STATUSES))).all()
+    for payment_id, status, amount, raw in rows:
+        gross = Decimal(str(amount or 0))
+        refunds = _completed_refunds(raw)
+        refunded = sum((value for _, value in refunds), Decimal('0'))
+        if not refunds and status == 'refunded':
+            refunded = gross
+        values = {'refunded_amount': min(refunded, gross)}
+        if status == 'refunded' and refunded < gross:
+            values['status'] = 'partially_refunded'
+        counted = [str(refund_id) for refund_id, _ in refunds if refund_id]
+        if counted:
+            # a late webhook for one of these refunds must not count it twice
+            values['raw_response'] = {**raw, '_refunds_counted': counted}
+        bind.execute(payments.update().where(payments.c.id == payment_id).values(**values))
+
+    # then rebuild the refund buckets of the rollup from their payments (statuses may have moved)
+    op.execute(payment_daily_rollup.delete().where(payment_daily_rollup.c.status.in_(REFUND_STATUSES)))
+    day = sa.func.date(payments.c.created_at)
+    op.execute(payment_daily_rollup.insert().from_select(
+        ['day', 'status', 'currency', 'payment_count', 'amount_total', 'refunded_total', 'updated_at'],
+        sa.select(
+            day,
+            payments.c.status,
+            payments.c.currency,
+            sa.func.count(),
+            sa.func.coalesce(sa.func.sum(payments.c.amount), 0),
+            sa.func.coalesce(sa.func.sum(payments.c.refunded_amount), 0),
+            sa.literal(datetime.utcnow(), sa.DateTime),
+        ).where(payments.c.status.in_(REFUND_STATUSES))
+        .group_by(day, payments.c.status, payments.c.currency)
+    ))
+
+
+def downgrade():
+    with op.batch_alter_table('payment_daily_rollup', schema=None) as batch_op:
+        batch_op.drop_column('refunded_total')
+    with op.batch_alter_table('payments', schema=None) as batch_op:
+        batch_op.drop_column('refunded_amount')
@@ -0,0 +1,174 @@
+"""Add order_ledger table and payments.ledger_id; backfill from "order" and "orders"
+
+Revision ID: b7c41e9d2a50
+Revises: 57ada1c17ff5
+Create Date: 2026-01-12 10:04:51.218374
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7c41e9d2a50'
+down_revision = '57ada1c17ff5'
+branch_labels = None
+depends_on = None
+
+
+# lightweight table handles for the backfill (do not import app models here)
+cod_order = sa.table('order',
+    sa.column('id', sa.Integer),
+    sa.column('customer_name', sa.String),
+    sa.column('customer_email', sa.String),
+    sa.column('product_id', sa.String),
+    sa.column('quantity', sa.Integer),
+    sa.column('status', sa.String),
+    sa.column('payment_method', sa.String),
+    sa.column('date', sa.String),
+)
+product = sa.table('product',
+    sa.column('id', sa.String),
+    sa.column('price', sa.Float),
+)
+paypal_order = sa.table('orders',
+    sa.column('id', sa.Integer),
+    sa.column('order_number', sa.String),
+    sa.column('customer_name', sa.String),
+    sa.column('customer_email', sa.String),
+    sa.column('total_amount', sa.Numeric(12, 2)),
+    sa.column('currency', sa.String),
+    sa.column('status', sa.String),
+    sa.column('created_at', sa.DateTime),
+    sa.column('updated_at', sa.DateTime),
+)
+order_ledger = sa.table('order_ledger',
+    sa.column('id', sa.Integer),
+    sa.column('source', sa.String),
+    sa.column('source_order_id', sa.Integer),
+    sa.column('order_number', sa.String),
+    sa.column('provider', sa.String),
+    sa.column('customer_name', sa.String),
+    sa.column('customer_email', sa.String),
+    sa.column('total_amount', sa.Numeric(12, 2)),
+    sa.column('currency', sa.String),
+    sa.column('status', sa.String),
+    sa.column('created_at', sa.DateTime),
+    sa.column('updated_at', sa.DateTime),
+)
+
+BATCH_SIZE = 500
+
+
+def _parse_cod_date(value):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d %H:%M:%S")
+    except Exception:
+        return datetime.utcnow()
+
+
+def _cod_provider(payment_method):
+    method = (payment_method or "").strip().lower()
+    if not method or method.startswith("cash"):
+        return "cod"
+    return method[:50]
+
+
+def _insert_batched(bind, rows):
+    for i in range(0, len(rows), BATCH_SIZE):
+        bind.execute(order_ledger.insert(), rows[i:i + BATCH_SIZE])
+
+
+def upgrade():
+    op.create_table('order_ledger',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('source', sa.String(length=16), nullable=False),
+    sa.Column('source_order_id', sa.Integer(), nullable=False),
+    sa.Column('order_number', sa.String(length=64), nullable=True),
+    sa.Column('provider', sa.String(length=50), nullable=False),
+    sa.Column('customer_name', sa.String(length=255), nullable=True),
+    sa.Column('customer_email', sa.String(length=255), nullable=True),
+    sa.Column('total_amount', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.Column('currency', sa.String(length=8), nullable=False),
+    sa.Column('status', sa.String(length=40), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('source', 'source_order_id', name='uq_order_ledger_source_order')
+    )
+    with op.batch_alter_table('order_ledger', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_order_ledger_created_at'), ['created_at'], unique=False)
+        batch_op.create_index(batch_op.f('ix_order_ledger_status'), ['status'], unique=False)
+        batch_op.create_index(batch_op.f('ix_order_ledger_provider'), ['provider'], unique=False)
+        batch_op.create_index(batch_op.f('ix_order_ledger_order_number'), ['order_number'], unique=False)
+        batch_op.create_index('ix_order_ledger_provider_created_at', ['provider', 'created_at'], unique=False)
+
+    with op.batch_alter_table('payments', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('ledger_id', sa.Integer(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_payments_ledger_id'), ['ledger_id'], unique=False)
+        batch_op.create_foreign_key('fk_payments_ledger_id_order_ledger', 'order_ledger', ['ledger_id'], ['id'])
+
+    # ---- backfill ----
+    bind = op.get_bind()
+    now = datetime.utcnow()
+
+    # COD orders: amount is product price * quantity (the legacy table stores no total)
+    cod_rows = bind.execute(
+        sa.select(cod_order, product.c.price)
+        .select_from(cod_order.outerjoin(product, product.c.id == cod_order.c.product_id))
+    ).mappings().all()
+    _insert_batched(bind, [{
+        "source": "cod",
+        "source_order_id": r["id"],
+        "order_number": f"COD-{r['id']}",
+        "provider": _cod_provider(r["payment_method"]),
+        "customer_name": r["customer_name"],
+        "customer_email": r["customer_email"],
+        "total_amount": round(float(r["price"] or 0) * int(r["quantity"] or 0), 2),
+        "currency": "USD",
+        "status": (r["status"] or "pending").strip().lower(),
+        "created_at": _parse_cod_date(r["date"]),
+        "updated_at": now,
+    } for r in cod_rows])
+
+    # PayPal orders
+    pp_rows = bind.execute(sa.select(paypal_order)).mappings().all()
+    _insert_batched(bind, [{
+        "source": "paypal",
+        "source_order_id": r["id"],
+        "order_number": r["order_number"],
+        "provider": "paypal",
+        "customer_name": r["customer_name"],
+        "customer_email": r["customer_email"],
+        "total_amount": r["total_amount"] or 0,
+        "currency": r["currency"] or "USD",
+        "status": (r["status"] or "pending").strip().lower(),
+        "created_at": r["created_at"] or now,
+        "updated_at": r["updated_at"] or now,
+    } for r in pp_rows])
+
+    # Link payments to their ledger row (single correlated UPDATE, portable across SQLite/Postgres)
+    op.execute(
+        "UPDATE payments SET ledger_id = ("
+        " SELECT order_ledger.id FROM order_ledger"
+        " WHERE order_ledger.source = 'paypal' AND order_ledger.source_order_id = payments.order_id"
+        ") WHERE payments.order_id IS NOT NULL"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('payments', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_payments_ledger_id_order_ledger', type_='foreignkey')
+        batch_op.drop_index(batch_op.f('ix_payments_ledger_id'))
+        batch_op.drop_column('ledger_id')
+
+    with op.batch_alter_table('order_ledger', schema=None) as batch_op:
+        batch_op.drop_index('ix_order_ledger_provider_created_at')
+        batch_op.drop_index(batch_op.f('ix_order_ledger_order_number'))
+        batch_op.drop_index(batch_op.f('ix_order_ledger_provider'))
+        batch_op.drop_index(batch_op.f('ix_order_ledger_status'))
+        batch_op.drop_index(batch_op.f('ix_order_ledger_created_at'))
+
+    op.drop_table('order_ledger')
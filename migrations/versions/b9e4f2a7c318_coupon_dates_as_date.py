@@ -0,0 +1,85 @@
+"""Store coupon start_date/end_date as DATE and index (active, start_date, end_date)
+
+Revision ID: b9e4f2a7c318
+Revises: a6d2c8f4e913
+Create Date: 2026-01-26 11:40:17.529804
+
+"""
+import logging
+from datetime import date
+
+from alembic import op
+import sqlalchemy as sa
+
+logger = logging.getLogger('alembic.runtime.migration')
+
+
+# revision identifiers, used by Alembic.
+revision = 'b9e4f2a7c318'
+down_revision = 'a6d2c8f4e913'
+branch_labels = None
+depends_on = None
+
+
+def _parse(value):
+    if value is None or value == '':
+        return None
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value).strip()[:10])  # ValueError for unparseable legacy values
+
+
+def _copy(src_type, dst_type, convert):
+    """
+    Copy start_date/end_date into the *_new columns row by row (coupon is a small table).
+    A coupon with a date convert() cannot read is deactivated with that date left NULL:
+    NULL means open-ended, and the coupon must not become valid forever by accident.
+    """
+    coupon = sa.table('coupon',
+                      sa.column('code', sa.String()),
+                      sa.column('active', sa.Boolean()),
+                      sa.column('start_date', src_type),
+                      sa.column('end_date', src_type),
+                      sa.column('start_date_new', dst_type),
+                      sa.column('end_date_new', dst_type))
+    bind = op.get_bind()
+    rows = bind.execute(sa.select(coupon.c.code, coupon.c.start_date, coupon.c.end_date)).fetchall()
+    for code, start, end in rows:
+        values = {}
+        for column, value in (('start_date_new', start), ('end_date_new', end)):
+            try:
+                values[column] = convert(value)
+            except ValueError:
+                values[column] = None
+                values['active'] = False
+        if values.get('active') is False:
+            logger.warning("coupon %s: unreadable start/end date (%r, %r); deactivated it", code, start, end)
+        bind.execute(coupon.update().where(coupon.c.code == code).values(**values))
+
+
+def _swap(new_type):
+    with op.batch_alter_table('coupon', schema=None) as batch_op:
+        batch_op.drop_column('start_date')
+        batch_op.drop_column('end_date')
+    with op.batch_alter_table('coupon', schema=None) as batch_op:
+        batch_op.alter_column('start_date_new', new_column_name='start_date', existing_type=new_type)
+        batch_op.alter_column('end_date_new', new_column_name='end_date', existing_type=new_type)
+
+
+def upgrade():
+    with op.batch_alter_table('coupon', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('start_date_new', sa.Date(), nullable=True))
+        batch_op.add_column(sa.Column('end_date_new', sa.Date(), nullable=True))
+    _copy(sa.String(), sa.Date(), _parse)
+    _swap(sa.Date())
+    with op.batch_alter_table('coupon', schema=None) as batch_op:
+        batch_op.create_index('ix_coupon_active_dates', ['active', 'start_date', 'end_date'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('coupon', schema=None) as batch_op:
+        batch_op.drop_index('ix_coupon_active_dates')
+        batch_op.add_column(sa.Column('start_date_new', sa.String(), nullable=True))
+        batch_op.add_column(sa.Column('end_date_new', sa.String(), nullable=True))
+    _copy(sa.Date(), sa.String(), lambda d: d.isoformat() if d else '')
+    _swap(sa.String())
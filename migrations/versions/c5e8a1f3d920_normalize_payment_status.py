@@ -0,0 +1,65 @@
+"""Normalize payments.status values and index the column
+
+Revision ID: c5e8a1f3d920
+Revises: b7c41e9d2a50
+Create Date: 2026-01-14 09:31:07.552190
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5e8a1f3d920'
+down_revision = 'b7c41e9d2a50'
+branch_labels = None
+depends_on = None
+
+
+payments = sa.table('payments',
+    sa.column('status', sa.String),
+)
+
+# Frozen copy of models_payments._PAYMENT_STATUS_ALIASES at the time of this migration.
+_ALIASES = {
+    "hold": "on_hold",
+    "held": "on_hold",
+    "onhold": "on_hold",
+    "dispute": "disputed",
+    "disput": "disputed",
+    "review": "disputed",
+    "rejected": "settled",
+    "reject": "settled",
+    "rejected_settled": "settled",
+    "refund": "refunded",
+    "partial_refund": "partially_refunded",
+    "captured": "completed",
+    "paid": "completed",
+}
+
+
+def _normalize(value):
+    key = (value or "").strip().lower().replace("-", "_").replace(" ", "_")
+    if not key:
+        return "created"
+    return _ALIASES.get(key, key)
+
+
+def upgrade():
+    bind = op.get_bind()
+    # one UPDATE per distinct legacy value (a handful), not per row
+    for (status,) in bind.execute(sa.select(payments.c.status).distinct()).fetchall():
+        normalized = _normalize(status)
+        if normalized != status:
+            bind.execute(payments.update()
+                         .where(payments.c.status == status)
+                         .values(status=normalized))
+
+    with op.batch_alter_table('payments', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_payments_status'), ['status'], unique=False)
+
+
+def downgrade():
+    # value normalization is not reversed (the original spellings are not recoverable)
+    with op.batch_alter_table('payments', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_payments_status'))
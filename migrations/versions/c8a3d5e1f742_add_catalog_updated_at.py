@@ -0,0 +1,40 @@
+"""Add updated_at to product, brand and homepage_product for HTTP cache validators
+
+Revision ID: c8a3d5e1f742
+Revises: b9e4f2a7c318
+Create Date: 2026-01-28 14:22:05.613970
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c8a3d5e1f742'
+down_revision = 'b9e4f2a7c318'
+branch_labels = None
+depends_on = None
+
+
+_TABLES = ('product', 'brand', 'homepage_product')
+
+
+def upgrade():
+    now = datetime.utcnow()
+    for name in _TABLES:
+        with op.batch_alter_table(name, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+        # existing rows start at the migration time
+        table = sa.table(name, sa.column('updated_at', sa.DateTime()))
+        op.execute(table.update().values(updated_at=now))
+        with op.batch_alter_table(name, schema=None) as batch_op:
+            batch_op.create_index(batch_op.f(f'ix_{name}_updated_at'), ['updated_at'], unique=False)
+
+
+def downgrade():
+    for name in reversed(_TABLES):
+        with op.batch_alter_table(name, schema=None) as batch_op:
+            batch_op.drop_index(batch_op.f(f'ix_{name}_updated_at'))
+            batch_op.drop_column('updated_at')
@@ -0,0 +1,70 @@
+"""Add payment_daily_rollup and a (created_at, status) index on payments
+
+Revision ID: d2f96b0c7e14
+Revises: c5e8a1f3d920
+Create Date: 2026-01-16 14:22:40.906113
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2f96b0c7e14'
+down_revision = 'c5e8a1f3d920'
+branch_labels = None
+depends_on = None
+
+
+payments = sa.table('payments',
+    sa.column('created_at', sa.DateTime),
+    sa.column('status', sa.String),
+    sa.column('currency', sa.String),
+    sa.column('amount', sa.Numeric(12, 2)),
+)
+payment_daily_rollup = sa.table('payment_daily_rollup',
+    sa.column('day', sa.Date),
+    sa.column('status', sa.String),
+    sa.column('currency', sa.String),
+    sa.column('payment_count', sa.Integer),
+    sa.column('amount_total', sa.Numeric(14, 2)),
+    sa.column('updated_at', sa.DateTime),
+)
+
+
+def upgrade():
+    op.create_table('payment_daily_rollup',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('status', sa.String(length=40), nullable=False),
+    sa.Column('currency', sa.String(length=8), nullable=False),
+    sa.Column('payment_count', sa.Integer(), nullable=False),
+    sa.Column('amount_total', sa.Numeric(precision=14, scale=2), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('day', 'status', 'currency')
+    )
+
+    with op.batch_alter_table('payments', schema=None) as batch_op:
+        batch_op.create_index('ix_payments_created_at_status', ['created_at', 'status'], unique=False)
+
+    # backfill: one INSERT ... SELECT ... GROUP BY over the existing payments
+    day = sa.func.date(payments.c.created_at)
+    op.execute(payment_daily_rollup.insert().from_select(
+        ['day', 'status', 'currency', 'payment_count', 'amount_total', 'updated_at'],
+        sa.select(
+            day,
+            payments.c.status,
+            payments.c.currency,
+            sa.func.count(),
+            sa.func.coalesce(sa.func.sum(payments.c.amount), 0),
+            sa.literal(datetime.utcnow(), sa.DateTime),
+        ).group_by(day, payments.c.status, payments.c.currency)
+    ))
+
+
+def downgrade():
+    with op.batch_alter_table('payments', schema=None) as batch_op:
+        batch_op.drop_index('ix_payments_created_at_status')
+
+    op.drop_table('payment_daily_rollup')
@@ -0,0 +1,42 @@
+"""Add image_derivative table for responsive image sizes
+
+Revision ID: d4f7b2e9a051
+Revises: c8a3d5e1f742
+Create Date: 2026-01-30 10:41:17.208334
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4f7b2e9a051'
+down_revision = 'c8a3d5e1f742'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('image_derivative',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('source_path', sa.String(length=512), nullable=False),
+    sa.Column('format', sa.String(length=8), nullable=False),
+    sa.Column('width', sa.Integer(), nullable=False),
+    sa.Column('height', sa.Integer(), nullable=False),
+    sa.Column('path', sa.String(length=512), nullable=False),
+    sa.Column('bytes', sa.Integer(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('source_path', 'width', 'format', name='uq_image_derivative_source_width_format')
+    )
+    with op.batch_alter_table('image_derivative', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_image_derivative_source_path'), ['source_path'], unique=False)
+        batch_op.create_index(batch_op.f('ix_image_derivative_updated_at'), ['updated_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('image_derivative', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_image_derivative_updated_at'))
+        batch_op.drop_index(batch_op.f('ix_image_derivative_source_path'))
+
+    op.drop_table('image_derivative')
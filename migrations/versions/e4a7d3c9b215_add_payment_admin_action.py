@@ -0,0 +1,161 @@
+"""Add payment_admin_action; move raw_response['_admin_actions'] entries into it
+
+Revision ID: e4a7d3c9b215
+Revises: d2f96b0c7e14
+Create Date: 2026-01-19 11:48:12.604731
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e4a7d3c9b215'
+down_revision = 'd2f96b0c7e14'
+branch_labels = None
+depends_on = None
+
+
+payments = sa.table('payments',
+    sa.column('id', sa.Integer),
+    sa.column('raw_response', sa.JSON),
+)
+payment_admin_action = sa.table('payment_admin_action',
+    sa.column('id', sa.Integer),
+    sa.column('payment_id', sa.Integer),
+    sa.column('action', sa.String),
+    sa.column('actor_username', sa.String),
+    sa.column('actor_role', sa.String),
+    sa.column('refund_amount', sa.Numeric(12, 2)),
+    sa.column('refund_percent', sa.Numeric(5, 2)),
+    sa.column('note', sa.Text),
+    sa.column('error', sa.String),
+    sa.column('warning', sa.String),
+    sa.column('detail', sa.JSON(none_as_null=True)),
+    sa.column('created_at', sa.DateTime),
+)
+
+BATCH_SIZE = 500
+
+
+def _parse_ts(value):
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")).replace(tzinfo=None)
+    except Exception:
+        return None
+
+
+def _action_row(payment_id, record, fallback_ts):
+    actor = record.get("actor") or {}
+    if not isinstance(actor, dict):
+        actor = {"username": str(actor)}
+    return {
+        "payment_id": payment_id,
+        "action": str(record.get("action") or "unknown")[:40],
+        "actor_username": actor.get("username"),
+        "actor_role": actor.get("role"),
+        "refund_amount": record.get("refund_amount"),
+        "refund_percent": record.get("refund_percent"),
+        "note": record.get("note") or None,
+        "error": record.get("error"),
+        "warning": record.get("warning"),
+        "detail": record.get("detail"),
+        "created_at": _parse_ts(record.get("timestamp")) or fallback_ts,
+    }
+
+
+def _iter_payment_batches(bind):
+    """Keyset-paginate payments that carry a raw_response."""
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(payments.c.id, payments.c.raw_response)
+            .where(payments.c.id > last_id)
+            .where(payments.c.raw_response.isnot(None))
+            .order_by(payments.c.id)
+            .limit(BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+def upgrade():
+    op.create_table('payment_admin_action',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('payment_id', sa.Integer(), nullable=False),
+    sa.Column('action', sa.String(length=40), nullable=False),
+    sa.Column('actor_username', sa.String(length=80), nullable=True),
+    sa.Column('actor_role', sa.String(length=64), nullable=True),
+    sa.Column('refund_amount', sa.Numeric(precision=12, scale=2), nullable=True),
+    sa.Column('refund_percent', sa.Numeric(precision=5, scale=2), nullable=True),
+    sa.Column('note', sa.Text(), nullable=True),
+    sa.Column('error', sa.String(length=64), nullable=True),
+    sa.Column('warning', sa.String(length=128), nullable=True),
+    sa.Column('detail', sa.JSON(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['payment_id'], ['payments.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('payment_admin_action', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_payment_admin_action_action'), ['action'], unique=False)
+        batch_op.create_index(batch_op.f('ix_payment_admin_action_created_at'), ['created_at'], unique=False)
+        batch_op.create_index('ix_payment_admin_action_payment_created_at', ['payment_id', 'created_at'], unique=False)
+
+    # ---- extract raw_response['_admin_actions'] ----
+    bind = op.get_bind()
+    now = datetime.utcnow()
+    for rows in _iter_payment_batches(bind):
+        action_rows = []
+        for payment_id, rr in rows:
+            if not isinstance(rr, dict) or "_admin_actions" not in rr:
+                continue
+            actions = rr.pop("_admin_actions") or []
+            action_rows.extend(_action_row(payment_id, a, now) for a in actions if isinstance(a, dict))
+            bind.execute(payments.update()
+                         .where(payments.c.id == payment_id)
+                         .values(raw_response=rr))
+        if action_rows:
+            bind.execute(payment_admin_action.insert(), action_rows)
+
+
+def downgrade():
+    # fold the rows back into raw_response['_admin_actions'] before dropping the table
+    bind = op.get_bind()
+    rows = bind.execute(
+        sa.select(payment_admin_action)
+        .order_by(payment_admin_action.c.payment_id, payment_admin_action.c.created_at, payment_admin_action.c.id)
+    ).mappings().all()
+    by_payment = {}
+    for r in rows:
+        record = {
+            "timestamp": r["created_at"].isoformat() if r["created_at"] else None,
+            "actor": {"username": r["actor_username"], "role": r["actor_role"]},
+            "action": r["action"],
+            "refund_amount": float(r["refund_amount"]) if r["refund_amount"] is not None else None,
+            "refund_percent": float(r["refund_percent"]) if r["refund_percent"] is not None else None,
+            "note": r["note"],
+        }
+        for key in ("error", "warning", "detail"):
+            if r[key] is not None:
+                record[key] = r[key]
+        by_payment.setdefault(r["payment_id"], []).append(record)
+    for payment_id, actions in by_payment.items():
+        rr = bind.execute(sa.select(payments.c.raw_response)
+                          .where(payments.c.id == payment_id)).scalar()
+        if not isinstance(rr, dict):
+            rr = {}
+        rr["_admin_actions"] = actions
+        bind.execute(payments.update()
+                     .where(payments.c.id == payment_id)
+                     .values(raw_response=rr))
+
+    with op.batch_alter_table('payment_admin_action', schema=None) as batch_op:
+        batch_op.drop_index('ix_payment_admin_action_payment_created_at')
+        batch_op.drop_index(batch_op.f('ix_payment_admin_action_created_at'))
+        batch_op.drop_index(batch_op.f('ix_payment_admin_action_action'))
+
+    op.drop_table('payment_admin_action')
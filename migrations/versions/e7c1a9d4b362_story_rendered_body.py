@@ -0,0 +1,29 @@
+"""Add story.body_rendered and story.reading_minutes for save-time rendering
+
+Revision ID: e7c1a9d4b362
+Revises: d4f7b2e9a051
+Create Date: 2026-02-02 09:17:48.530216
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7c1a9d4b362'
+down_revision = 'd4f7b2e9a051'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # existing rows stay NULL and are rendered on read until `flask render-stories` runs
+    with op.batch_alter_table('story', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('body_rendered', sa.Text(), nullable=True))
+        batch_op.add_column(sa.Column('reading_minutes', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('story', schema=None) as batch_op:
+        batch_op.drop_column('reading_minutes')
+        batch_op.drop_column('body_rendered')
@@ -0,0 +1,39 @@
+"""Add composite indexes for the published story listings
+
+Revision ID: f1d6c3b8a927
+Revises: e7c1a9d4b362
+Create Date: 2026-02-03 16:41:09.274118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1d6c3b8a927'
+down_revision = 'e7c1a9d4b362'
+branch_labels = None
+depends_on = None
+
+
+_INDEXES = (
+    ('ix_story_published_section_position', ['published', 'section']),
+    ('ix_story_published_position', ['published']),
+)
+
+
+def upgrade():
+    # listing order is position desc, published_at desc nulls last, created_at desc;
+    # Postgres sorts NULLs first in a DESC index, SQLite/MySQL refuse NULLS LAST in one
+    if op.get_bind().dialect.name == 'postgresql':
+        published_at = sa.text('published_at DESC NULLS LAST')
+    else:
+        published_at = sa.text('published_at DESC')
+    for name, leading in _INDEXES:
+        op.create_index(name, 'story', leading + [sa.text('position DESC'), published_at,
+                                                  sa.text('created_at DESC')], unique=False)
+
+
+def downgrade():
+    for name, _leading in reversed(_INDEXES):
+        op.drop_index(name, table_name='story')
@@ -0,0 +1,89 @@
+"""Turn paypal_webhook_events into a processing inbox (unique event_id, status, retries)
+
+Revision ID: f3b8e1a6c407
+Revises: e4a7d3c9b215
+Create Date: 2026-01-21 16:05:33.180452
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b8e1a6c407'
+down_revision = 'e4a7d3c9b215'
+branch_labels = None
+depends_on = None
+
+
+_NEW_COLUMNS = ('status', 'attempts', 'next_attempt_at', 'locked_at', 'locked_by', 'processed_at', 'last_error')
+
+
+def _create_table():
+    # 57ada1c17ff5 dropped this table although the model kept it; recreate it in full
+    op.create_table('paypal_webhook_events',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('event_id', sa.String(length=128), nullable=False),
+    sa.Column('event_type', sa.String(length=128), nullable=True),
+    sa.Column('raw_event', sa.JSON(), nullable=True),
+    sa.Column('headers', sa.JSON(), nullable=True),
+    sa.Column('received_at', sa.DateTime(), nullable=False),
+    sa.Column('status', sa.String(length=16), server_default='pending', nullable=False),
+    sa.Column('attempts', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('next_attempt_at', sa.DateTime(), nullable=True),
+    sa.Column('locked_at', sa.DateTime(), nullable=True),
+    sa.Column('locked_by', sa.String(length=64), nullable=True),
+    sa.Column('processed_at', sa.DateTime(), nullable=True),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('paypal_webhook_events', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_paypal_webhook_events_event_id'), ['event_id'], unique=True)
+        batch_op.create_index(batch_op.f('ix_paypal_webhook_events_event_type'), ['event_type'], unique=False)
+        batch_op.create_index('ix_paypal_webhook_events_status_next_attempt', ['status', 'next_attempt_at'], unique=False)
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    if 'paypal_webhook_events' not in inspector.get_table_names():
+        _create_table()
+        return
+
+    # keep the first copy of any event PayPal delivered more than once
+    op.execute(
+        "DELETE FROM paypal_webhook_events WHERE id NOT IN ("
+        " SELECT min_id FROM (SELECT MIN(id) AS min_id FROM paypal_webhook_events GROUP BY event_id) AS keep"
+        ")"
+    )
+
+    existing_indexes = {ix['name'] for ix in inspector.get_indexes('paypal_webhook_events')}
+    with op.batch_alter_table('paypal_webhook_events', schema=None) as batch_op:
+        # events received before this revision were handled synchronously: mark them done
+        batch_op.add_column(sa.Column('status', sa.String(length=16), server_default='done', nullable=False))
+        batch_op.add_column(sa.Column('attempts', sa.Integer(), server_default='0', nullable=False))
+        batch_op.add_column(sa.Column('next_attempt_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('locked_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('locked_by', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('processed_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('last_error', sa.Text(), nullable=True))
+        if 'ix_paypal_webhook_events_event_id' in existing_indexes:
+            batch_op.drop_index('ix_paypal_webhook_events_event_id')
+        batch_op.create_index(batch_op.f('ix_paypal_webhook_events_event_id'), ['event_id'], unique=True)
+        if 'ix_paypal_webhook_events_event_type' not in existing_indexes:
+            batch_op.create_index(batch_op.f('ix_paypal_webhook_events_event_type'), ['event_type'], unique=False)
+        batch_op.create_index('ix_paypal_webhook_events_status_next_attempt', ['status', 'next_attempt_at'], unique=False)
+
+    # new rows default to pending
+    with op.batch_alter_table('paypal_webhook_events', schema=None) as batch_op:
+        batch_op.alter_column('status', server_default='pending',
+                              existing_type=sa.String(length=16), existing_nullable=False)
+
+
+def downgrade():
+    with op.batch_alter_table('paypal_webhook_events', schema=None) as batch_op:
+        batch_op.drop_index('ix_paypal_webhook_events_status_next_attempt')
+        batch_op.drop_index(batch_op.f('ix_paypal_webhook_events_event_id'))
+        batch_op.create_index(batch_op.f('ix_paypal_webhook_events_event_id'), ['event_id'], unique=False)
+        for name in reversed(_NEW_COLUMNS):
+            batch_op.drop_column(name)
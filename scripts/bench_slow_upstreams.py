@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Throughput under slow upstreams: Gunicorn (WSGI, sync threads) vs uvicorn (ASGI, asgi.py).
+
+The script starts a stub "competitor site" that answers every request after --delay
+seconds, seeds a throwaway SQLite database with one product whose price-comparison
+competitors all point at the stub, then for each mode starts the server with the same
+number of workers and runs --clients concurrent clients for --seconds. Every client loops
+over a mix of /api/price-compare (slow: one upstream fetch per competitor) and
+/api/brands (fast, local). Reported per endpoint: completed requests, requests/s and
+latency percentiles. The interesting number is the fast endpoint's latency while the
+slow one is in flight: under WSGI it queues behind the threads stuck on upstreams.
+
+Usage:
+  python scripts/bench_slow_upstreams.py                        # both modes
+  python scripts/bench_slow_upstreams.py --clients 100 --delay 2 --seconds 20
+  python scripts/bench_slow_upstreams.py --modes asgi --workers 4
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+SLOW = "/api/price-compare?product_id=BENCH1"
+FAST = "/api/brands"
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_upstream(delay):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            time.sleep(delay)
+            body = b"<html><p>Bench Perfume</p><span>$99.00</span></html>"
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    ThreadingHTTPServer.request_queue_size = 1024
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def seed_database(url, upstream, competitors):
+    os.environ["DATABASE_URL"] = url
+    sys.path.insert(0, ROOT)
+    from app import create_app, db
+    from app.models import Brand, Product, Setting
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        db.session.add(Brand(name="Bench"))
+        db.session.add(Product(id="BENCH1", brand="Bench", title="Bench Perfume", price=100.0))
+        db.session.add(Setting(key="price_comparison_competitors", value=json.dumps(
+            [{"name": f"Site{i}", "search_url": f"{upstream}/search?q={{q}}&site={i}"} for i in range(competitors)])))
+        db.session.commit()
+        for engine in db.engines.values():
+            engine.dispose()
+
+
+def _command(mode, port, workers):
+    if mode == "wsgi":
+        return [sys.executable, "-m", "gunicorn", "run:app", "-b", f"127.0.0.1:{port}", "-w", str(workers),
+                "--log-level", "warning"]
+    return [sys.executable, "-m", "uvicorn", "asgi:app", "--host", "127.0.0.1", "--port", str(port),
+            "--workers", str(workers), "--log-level", "warning", "--no-access-log"]
+
+
+async def _client(http, base, deadline, results):
+    i = 0
+    while time.perf_counter() < deadline:
+        path = SLOW if i % 2 == 0 else FAST
+        i += 1
+        started = time.perf_counter()
+        try:
+            resp = await http.get(base + path)
+            ok = resp.status_code == 200
+        except Exception:
+            ok = False
+        results.append((path, ok, time.perf_counter() - started))
+
+
+async def _load(base, clients, seconds):
+    import httpx
+
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    async with httpx.AsyncClient(limits=limits, timeout=120) as http:
+        # wait until the server answers
+        for _ in range(600):
+            try:
+                if (await http.get(base + FAST)).status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.1)
+        else:
+            raise SystemExit("server did not come up")
+        results = []
+        started = time.perf_counter()
+        await asyncio.gather(*(_client(http, base, started + seconds, results) for _ in range(clients)))
+        return results, time.perf_counter() - started
+
+
+def run_mode(mode, workers, clients, seconds):
+    port = _free_port()
+    proc = subprocess.Popen(_command(mode, port, workers), cwd=ROOT, env=dict(os.environ))
+    try:
+        results, elapsed = asyncio.run(_load(f"http://127.0.0.1:{port}", clients, seconds))
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+    return {"mode": mode, "elapsed": elapsed, "results": results}
+
+
+def _pct(values, p):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))]
+
+
+def print_result(r):
+    print(f"\n== {r['mode']}  ({r['elapsed']:.1f} s)")
+    print("endpoint                                  ok  errors   req/s    p50 ms    p95 ms    max ms")
+    for path in (SLOW, FAST):
+        rows = [x for x in r["results"] if x[0] == path]
+        lat = [x[2] * 1000 for x in rows if x[1]]
+        errors = sum(1 for x in rows if not x[1])
+        print(f"{path:40s} {len(lat):4d}  {errors:6d}  {len(lat) / r['elapsed']:6.1f}  {_pct(lat, 50):8.0f}  "
+              f"{_pct(lat, 95):8.0f}  {max(lat) if lat else float('nan'):8.0f}")
+        r[path] = {"ok": len(lat), "p95": _pct(lat, 95), "rps": len(lat) / r["elapsed"],
+                   "mean": statistics.mean(lat) if lat else float("nan")}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", choices=("both", "wsgi", "asgi"), default="both")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--clients", type=int, default=50, help="concurrent clients")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--delay", type=float, default=1.0, help="upstream response time in seconds")
+    parser.add_argument("--competitors", type=int, default=6)
+    args = parser.parse_args()
+
+    upstream = start_upstream(args.delay)
+    db_path = os.path.join(tempfile.mkdtemp(prefix="bench_upstreams_"), "bench.sqlite")
+    seed_database("sqlite:///" + db_path, upstream, args.competitors)
+    os.environ.update(DATABASE_URL="sqlite:///" + db_path, WEB_CONCURRENCY=str(args.workers))
+
+    modes = {"both": ("wsgi", "asgi"), "wsgi": ("wsgi",), "asgi": ("asgi",)}[args.modes]
+    results = [run_mode(m, args.workers, args.clients, args.seconds) for m in modes]
+    for r in results:
+        print_result(r)
+    if len(results) == 2:
+        wsgi, asgi = results
+        print(f"\nprice-compare throughput {wsgi[SLOW]['rps']:.1f} -> {asgi[SLOW]['rps']:.1f} req/s; "
+              f"{FAST} p95 {wsgi[FAST]['p95']:.0f} -> {asgi[FAST]['p95']:.0f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Worker cold-start benchmark: time `import app` + create_app() in fresh interpreters and
+show where the import time goes (python -X importtime).
+
+Usage:
+  python scripts/bench_startup.py                 # 5 runs, top 15 modules
+  python scripts/bench_startup.py --runs 10 --top 25
+  python scripts/bench_startup.py --json out.json # save results
+  python scripts/bench_startup.py --compare out.json   # diff against a saved run
+
+Every run is a new process, so nothing is cached in sys.modules; the OS page cache is
+warm after the first run, which is also the case for Gunicorn workers booting from the
+same image. Numbers are medians. The module table lists cumulative import time (module
+plus everything it imported first) from the median run, and the third-party packages
+that cost the most in total.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+SNIPPET = r"""
+import json, sys, time
+t0 = time.perf_counter()
+from app import create_app
+t1 = time.perf_counter()
+app = create_app()
+t2 = time.perf_counter()
+sys.stdout.write("BENCH " + json.dumps({"import_ms": (t1 - t0) * 1000, "create_app_ms": (t2 - t1) * 1000,
+                                         "modules": len(sys.modules)}) + "\n")
+"""
+
+
+def _parse_importtime(stderr):
+    """[(module, self_us, cumulative_us)] from -X importtime output."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us, cumulative, name = line[len("import time:"):].split("|", 2)
+            rows.append((name.strip(), int(self_us), int(cumulative)))
+        except ValueError:
+            continue
+    return rows
+
+
+def run_once(python):
+    env = dict(os.environ)
+    # create_app() builds the engine but does not connect; any file path will do
+    env.setdefault("DATABASE_URL", "sqlite:///" + os.path.join(tempfile.gettempdir(), "bench_startup.sqlite"))
+    env.pop("FLASK_RUN_FROM_CLI", None)
+    proc = subprocess.run([python, "-X", "importtime", "-c", SNIPPET], cwd=ROOT, env=env,
+                          capture_output=True, text=True)
+    line = next((ln for ln in proc.stdout.splitlines() if ln.startswith("BENCH ")), None)
+    if proc.returncode != 0 or line is None:
+        raise SystemExit(f"benchmark run failed:\n{proc.stderr[-2000:]}")
+    result = json.loads(line[len("BENCH "):])
+    result["imports"] = _parse_importtime(proc.stderr)
+    return result
+
+
+def summarize(runs, top):
+    median = lambda key: statistics.median(r[key] for r in runs)  # noqa: E731
+    summary = {
+        "runs": len(runs),
+        "import_ms": round(median("import_ms"), 1),
+        "create_app_ms": round(median("create_app_ms"), 1),
+        "total_ms": round(median("import_ms") + median("create_app_ms"), 1),
+        "modules": int(median("modules")),
+    }
+    # module table from the run closest to the median total
+    target = summary["total_ms"]
+    run = min(runs, key=lambda r: abs(r["import_ms"] + r["create_app_ms"] - target))
+    imports = run["imports"]
+    summary["top_modules"] = [
+        {"module": name, "cumulative_ms": round(cum / 1000, 1)}
+        for name, _self, cum in sorted(imports, key=lambda r: -r[2])
+        if name.split(".")[0] != "app" or name == "app"
+    ][:top]
+    summary["app_modules"] = [
+        {"module": name, "cumulative_ms": round(cum / 1000, 1)}
+        for name, _self, cum in sorted(imports, key=lambda r: -r[2])
+        if name.startswith("app.")
+    ][:top]
+    packages = {}
+    for name, self_us, _cum in imports:
+        pkg = name.split(".")[0]
+        packages[pkg] = packages.get(pkg, 0) + self_us
+    summary["packages"] = [{"package": p, "self_ms": round(us / 1000, 1)}
+                           for p, us in sorted(packages.items(), key=lambda kv: -kv[1])[:top]]
+    return summary
+
+
+def print_summary(s, baseline=None):
+    def delta(key):
+        if not baseline or key not in baseline:
+            return ""
+        d = s[key] - baseline[key]
+        return f"   ({d:+.1f} vs baseline {baseline[key]})"
+
+    print(f"runs: {s['runs']}   modules loaded: {s['modules']}")
+    print(f"import app:    {s['import_ms']:8.1f} ms{delta('import_ms')}")
+    print(f"create_app():  {s['create_app_ms']:8.1f} ms{delta('create_app_ms')}")
+    print(f"total:         {s['total_ms']:8.1f} ms{delta('total_ms')}")
+    print("\nslowest imports (cumulative):")
+    for row in s["top_modules"]:
+        print(f"  {row['cumulative_ms']:8.1f} ms  {row['module']}")
+    print("\napp modules (cumulative):")
+    for row in s["app_modules"]:
+        print(f"  {row['cumulative_ms']:8.1f} ms  {row['module']}")
+    print("\npackages by total self time:")
+    for row in s["packages"]:
+        print(f"  {row['self_ms']:8.1f} ms  {row['package']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--python", default=sys.executable)
+    parser.add_argument("--json", help="write the summary to this file")
+    parser.add_argument("--compare", help="summary JSON from an earlier run to diff against")
+    args = parser.parse_args()
+
+    runs = [run_once(args.python) for _ in range(max(1, args.runs))]
+    summary = summarize(runs, args.top)
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as fh:
+            baseline = json.load(fh)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump(summary, fh, indent=2)
+    print_summary(summary, baseline)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Per-worker memory and boot time of the Gunicorn deployment, with and without preload.
+
+For each mode the script starts `gunicorn run:app` (settings from gunicorn.conf.py) on a
+local port, waits until every worker answers, sends a few rounds of requests so the
+workers touch their caches, then reads /proc/<pid>/smaps_rollup for the master and each
+worker. Linux only.
+
+  RSS  resident pages, counting shared ones in full (what `ps` shows)
+  PSS  shared pages split between the processes sharing them: the real cost per worker
+  USS  private pages only (Private_Clean + Private_Dirty)
+
+Usage:
+  python scripts/bench_worker_memory.py                       # both modes, 4 workers
+  python scripts/bench_worker_memory.py --workers 8 --rounds 50
+  python scripts/bench_worker_memory.py --modes preload       # one mode
+
+DATABASE_URL is passed through; without it the app uses its local SQLite fallback.
+"""
+import argparse
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+PATHS = ["/", "/brands", "/api/products", "/api/brands", "/content-api/stories",
+         "/api/settings/checkout_discount"]
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _children(pid):
+    out = []
+    for task in os.listdir(f"/proc/{pid}/task"):
+        try:
+            with open(f"/proc/{pid}/task/{task}/children") as fh:
+                out.extend(int(c) for c in fh.read().split())
+        except OSError:
+            pass
+    return out
+
+
+def _memory(pid):
+    """smaps_rollup fields in KiB."""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as fh:
+        for line in fh:
+            parts = line.split()
+            if len(parts) >= 3 and parts[-1] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1])
+    return {
+        "rss": fields.get("Rss", 0),
+        "pss": fields.get("Pss", 0),
+        "uss": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+    }
+
+
+def _get(url, timeout=5.0):
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as resp:
+            resp.read()
+            return resp.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except OSError:
+        return None
+
+
+def run_mode(preload, workers, rounds, boot_timeout):
+    port = _free_port()
+    env = dict(os.environ, GUNICORN_PRELOAD="1" if preload else "0", WEB_CONCURRENCY=str(workers),
+               PORT=str(port))
+    started = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-m", "gunicorn", "run:app", "-b", f"127.0.0.1:{port}",
+                             "--log-level", "warning"], cwd=ROOT, env=env)
+    base = f"http://127.0.0.1:{port}"
+    try:
+        # first answer, then wait until every worker has been forked and can serve
+        while _get(base + "/api/brands", timeout=1) is None:
+            if proc.poll() is not None or time.perf_counter() - started > boot_timeout:
+                raise SystemExit("gunicorn did not come up")
+            time.sleep(0.05)
+        first_response = time.perf_counter() - started
+        while len(_children(proc.pid)) < workers:
+            if time.perf_counter() - started > boot_timeout:
+                raise SystemExit("workers did not all start")
+            time.sleep(0.05)
+        # several requests per worker so each one has served most paths
+        for _ in range(rounds):
+            for path in PATHS:
+                _get(base + path)
+        all_up = time.perf_counter() - started
+        master = _memory(proc.pid)
+        per_worker = [_memory(pid) for pid in _children(proc.pid)]
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+    return {
+        "mode": "preload" if preload else "no-preload",
+        "first_response_s": first_response,
+        "warm_s": all_up,
+        "master": master,
+        "workers": per_worker,
+    }
+
+
+def _mib(kib):
+    return f"{kib / 1024:7.1f}"
+
+
+def print_result(r):
+    ws = r["workers"]
+    print(f"\n== {r['mode']}  ({len(ws)} workers)")
+    print(f"first response after {r['first_response_s']:.2f} s; all workers warm after {r['warm_s']:.2f} s")
+    print("              RSS MiB   PSS MiB   USS MiB")
+    print(f"master       {_mib(r['master']['rss'])}   {_mib(r['master']['pss'])}   {_mib(r['master']['uss'])}")
+    for key in ("rss", "pss", "uss"):
+        r[f"worker_{key}"] = statistics.mean(w[key] for w in ws)
+    print(f"per worker   {_mib(r['worker_rss'])}   {_mib(r['worker_pss'])}   {_mib(r['worker_uss'])}   (mean)")
+    total_pss = r["master"]["pss"] + sum(w["pss"] for w in ws)
+    r["total_pss"] = total_pss
+    print(f"total PSS (master + workers): {_mib(total_pss)} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=20, help="request rounds over the sample paths")
+    parser.add_argument("--modes", choices=("both", "preload", "no-preload"), default="both")
+    parser.add_argument("--boot-timeout", type=float, default=60)
+    args = parser.parse_args()
+
+    modes = {"both": (False, True), "preload": (True,), "no-preload": (False,)}[args.modes]
+    results = [run_mode(p, args.workers, args.rounds, args.boot_timeout) for p in modes]
+    for r in results:
+        print_result(r)
+    if len(results) == 2:
+        before, after = results
+        print(f"\npreload saves {_mib(before['total_pss'] - after['total_pss'])} MiB total PSS "
+              f"({_mib(before['worker_pss'] - after['worker_pss'])} MiB per worker); "
+              f"first response {before['first_response_s']:.2f} s -> {after['first_response_s']:.2f} s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
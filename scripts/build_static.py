@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Build step for app/static: precompressed siblings and a content-hash manifest.
+
+For every compressible text asset (css, js, json, svg, html, ...) writes `<file>.gz` and,
+when the optional `brotli` package is installed, `<file>.br` next to it. The static view in
+app/compression.py serves these by Accept-Encoding. Siblings that would not save at least
+5% are not written.
+
+Also writes app/static/asset-manifest.json mapping each asset to a content-hashed name
+(`js/main.js` -> `js/main.3f9a1c0b2e.js`), which app/assets.py loads at startup. Hashed
+names are resolved back to the original file at request time and served with a one-year
+immutable Cache-Control, so nothing is copied. HTML pages keep their stable URLs and are
+left out of the manifest.
+
+Uploaded files (static/uploads) are left alone.
+
+Usage:
+  python scripts/build_static.py            # build
+  python scripts/build_static.py --clean    # remove generated .gz/.br and the manifest
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import sys
+from pathlib import Path
+
+try:
+    import brotli  # type: ignore
+except Exception:  # optional dependency
+    brotli = None
+
+STATIC_ROOT = Path(__file__).resolve().parents[1] / "app" / "static"
+MANIFEST_NAME = "asset-manifest.json"
+COMPRESSIBLE = {".css", ".js", ".mjs", ".json", ".svg", ".html", ".txt", ".xml", ".map", ".ico"}
+GENERATED = {".gz", ".br"}
+SKIP_DIRS = {"uploads"}
+# linked by stable, bookmarkable URLs
+UNHASHED = {".html"}
+MIN_BYTES = 256
+HASH_LEN = 10
+
+
+def iter_assets(root: Path):
+    for dirpath, dirnames, filenames in os.walk(root):
+        rel_dir = Path(dirpath).relative_to(root)
+        if rel_dir.parts and rel_dir.parts[0] in SKIP_DIRS:
+            dirnames[:] = []
+            continue
+        for name in sorted(filenames):
+            path = Path(dirpath) / name
+            if path.suffix in GENERATED or (not rel_dir.parts and name == MANIFEST_NAME):
+                continue
+            yield path
+
+
+def write_if_smaller(target: Path, data: bytes, original_size: int) -> bool:
+    if len(data) > original_size * 0.95:
+        if target.exists():
+            target.unlink()
+        return False
+    target.write_bytes(data)
+    return True
+
+
+def hashed_name(rel: Path, digest: str) -> str:
+    return rel.with_name(f"{rel.stem}.{digest[:HASH_LEN]}{rel.suffix}").as_posix()
+
+
+def build(root: Path) -> None:
+    manifest = {}
+    written = 0
+    for path in iter_assets(root):
+        rel = path.relative_to(root)
+        data = path.read_bytes()
+        if path.suffix.lower() not in UNHASHED:
+            manifest[rel.as_posix()] = hashed_name(rel, hashlib.sha256(data).hexdigest())
+
+        if path.suffix.lower() not in COMPRESSIBLE or len(data) < MIN_BYTES:
+            continue
+        # mtime=0 keeps the .gz bytes reproducible across builds
+        if write_if_smaller(path.with_name(path.name + ".gz"),
+                            gzip.compress(data, compresslevel=9, mtime=0), len(data)):
+            written += 1
+        if brotli is not None and write_if_smaller(path.with_name(path.name + ".br"),
+                                                   brotli.compress(data, quality=11), len(data)):
+            written += 1
+
+    (root / MANIFEST_NAME).write_text(json.dumps(manifest, indent=2, sort_keys=True), encoding="utf-8")
+    print(f"Hashed {len(manifest)} assets, wrote {written} compressed siblings"
+          f"{'' if brotli is not None else ' (brotli not installed: gzip only)'}")
+
+
+def clean(root: Path) -> None:
+    removed = 0
+    for dirpath, dirnames, filenames in os.walk(root):
+        if Path(dirpath) == root:
+            dirnames[:] = [d for d in dirnames if d not in SKIP_DIRS]
+        for name in filenames:
+            if Path(name).suffix in GENERATED:
+                os.remove(os.path.join(dirpath, name))
+                removed += 1
+    manifest = root / MANIFEST_NAME
+    if manifest.exists():
+        manifest.unlink()
+        removed += 1
+    print(f"Removed {removed} generated files")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--root", default=str(STATIC_ROOT), help="static directory (default: app/static)")
+    parser.add_argument("--clean", action="store_true", help="remove generated files and exit")
+    args = parser.parse_args(argv)
+    root = Path(args.root)
+    if not root.is_dir():
+        print(f"Static directory not found: {root}", file=sys.stderr)
+        return 1
+    if args.clean:
+        clean(root)
+    else:
+        build(root)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
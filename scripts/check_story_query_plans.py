@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Query-plan check for the public story listings.
+
+Runs the story list/section/slug lookups the site serves, captures the SQL they send, and
+EXPLAINs each statement against the database in DATABASE_URL (SQLite or Postgres). Fails
+if a listing has to sort the story table, scan it without an index, or filter the
+section row by row, i.e. if the ix_story_published_* indexes are missing or the listing
+ORDER BY drifts away from them.
+
+Usage:
+  DATABASE_URL=postgresql://... python scripts/check_story_query_plans.py
+  python scripts/check_story_query_plans.py          # local SQLite dev database
+
+Exit status is 1 when a plan regressed. Migrations must be applied (flask db upgrade).
+On Postgres the check runs with enable_seqscan/enable_sort off so a small table does not
+hide a missing index behind a cheap sequential scan.
+"""
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from sqlalchemy import event  # noqa: E402
+
+from app import create_app, db  # noqa: E402
+
+SECTION = "history"
+
+# SQLite: "SCAN story" without an index, or a temp b-tree for the ORDER BY
+_SQLITE_BAD = re.compile(r"SCAN story(?! USING)|USE TEMP B-TREE FOR (?:RIGHT PART OF )?ORDER BY")
+# Postgres: a Sort node or a sequential scan of story
+_PG_BAD = re.compile(r"(?:^|->\s*)(?:Incremental )?Sort\b|Seq Scan on story\b")
+
+
+def _capture(app):
+    """The SELECTs on story issued by the listing helpers and endpoints."""
+    from app.routes import _get_published_stories_for_section, _get_published_story_for_section_or_slug
+
+    captured = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and "FROM story" in statement \
+                and "WHERE" in statement:
+            captured.append((statement, parameters))
+
+    event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        with app.test_request_context():
+            _get_published_stories_for_section(SECTION, limit=10)
+            _get_published_stories_for_section(None, limit=10)
+            _get_published_story_for_section_or_slug(f"{SECTION}-no-such-slug")
+        client = app.test_client()
+        for url in ("/content-api/stories", f"/content-api/stories?section={SECTION}",
+                    f"/content-api/pages/{SECTION}-no-such-slug", f"/content-api/stories/{SECTION}-no-such-slug"):
+            client.get(url)
+    finally:
+        event.remove(db.engine, "before_cursor_execute", before_cursor_execute)
+    # the helpers and the content API send the same listing SQL; check each statement once
+    seen, unique = set(), []
+    for statement, parameters in captured:
+        if statement not in seen:
+            seen.add(statement)
+            unique.append((statement, parameters))
+    return unique
+
+
+def _section_in_index(dialect, plan):
+    if dialect == "sqlite":
+        return "section=?" in plan
+    return not any(line.strip().startswith("Filter:") and "section" in line for line in plan.splitlines())
+
+
+def _explain(conn, dialect, statement, parameters):
+    if dialect == "sqlite":
+        rows = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).fetchall()
+        return "\n".join(row[-1] for row in rows), _SQLITE_BAD
+    if dialect == "postgresql":
+        rows = conn.exec_driver_sql("EXPLAIN " + statement, parameters).fetchall()
+        return "\n".join(row[0] for row in rows), _PG_BAD
+    raise SystemExit(f"unsupported database dialect: {dialect}")
+
+
+def main():
+    app = create_app()
+    failures = 0
+    with app.app_context():
+        statements = _capture(app)
+        if not statements:
+            print("no story queries captured")
+            return 1
+        dialect = db.engine.dialect.name
+        with db.engine.connect() as conn:
+            if dialect == "postgresql":
+                conn.exec_driver_sql("SET enable_seqscan = off")
+                conn.exec_driver_sql("SET enable_sort = off")
+            for statement, parameters in statements:
+                plan, bad = _explain(conn, dialect, statement, parameters)
+                ok = not any(bad.search(line.strip()) for line in plan.splitlines())
+                if "story.section =" in statement:
+                    # the section must be part of the index lookup, not filtered row by row
+                    ok = ok and _section_in_index(dialect, plan)
+                failures += not ok
+                print(("ok    " if ok else "FAIL  ") + " ".join(statement.split())[:160])
+                print("      " + plan.replace("\n", "\n      "))
+            conn.rollback()
+    print(f"{len(statements)} statement(s), {failures} regression(s) [{dialect}]")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -20,10 +20,14 @@ Usage:
 
   # apply and set brand.logo from static/images/brands/*
   python scripts/import_images_to_db.py --apply --set-brand-logos
+
+With --apply, responsive AVIF/WebP/JPEG derivatives are built for every imported image
+(see app/image_pipeline.py); pass --no-derivatives to skip, --workers N to size the pool.
 """
 # Ensure project root is on sys.path so "from app import ..." works when running as a script
 from app.models import Brand, Product
 from app import create_app, db
+from app.image_pipeline import build_derivatives
 import re
 import argparse
 import sys
@@ -86,7 +90,7 @@ def find_logo_for_brand(static_images_dir: Path, folder_name: str) -> str | None
     return None
 
 
-def run(dry_run=True, apply=False, force=False, set_brand_logos=False):
+def run(dry_run=True, apply=False, force=False, set_brand_logos=False, derivatives=True, workers=None):
     app = create_app()
     with app.app_context():
         static_images_dir = Path(app.static_folder) / "images"
@@ -98,6 +102,7 @@ def run(dry_run=True, apply=False, force=False, set_brand_logos=False):
         created_products = 0
         updated_products = 0
         skipped = 0
+        image_paths = []
 
         for brand_folder in sorted([p for p in static_images_dir.iterdir() if p.is_dir()]):
             folder = brand_folder.name
@@ -152,6 +157,7 @@ def run(dry_run=True, apply=False, force=False, set_brand_logos=False):
                 prod_id = slugify_id(raw_id)
                 title = title_from_filename(name_noext)
                 image_rel = f"images/{folder}/{img.name}"
+                image_paths.append(image_rel)
 
                 existing_by_id = Product.query.filter_by(id=prod_id).first()
                 existing_by_title = Product.query.filter_by(
@@ -203,11 +209,25 @@ def run(dry_run=True, apply=False, force=False, set_brand_logos=False):
                         db.session.rollback()
                         print(f"  Failed to create product {prod_id}: {e}")
 
+        derivative_results = []
+        if apply and derivatives and image_paths:
+            print(f"\nBuilding image derivatives for {len(image_paths)} image(s)...")
+            try:
+                derivative_results = build_derivatives(image_paths, workers=workers, force=force)
+            except Exception as e:
+                db.session.rollback()
+                print(f"  Failed to build image derivatives: {e}")
+            for r in derivative_results:
+                if r["error"]:
+                    print(f"  Failed: {r['source']}: {r['error']}")
+
         print("\nSummary:")
         print(f"  Brands created: {created_brands}")
         print(f"  Products created: {created_products}")
         print(f"  Products updated: {updated_products}")
         print(f"  Products skipped (existing): {skipped}")
+        if derivative_results:
+            print(f"  Images with derivatives: {sum(1 for r in derivative_results if not r['error'])}")
 
 
 if __name__ == "__main__":
@@ -219,6 +239,11 @@ if __name__ == "__main__":
                         help="Force update image fields on existing products/brands")
     parser.add_argument("--set-brand-logos", action="store_true",
                         help="Attempt to set brand.logo from images/brands/*logo*")
+    parser.add_argument("--no-derivatives", action="store_true",
+                        help="Do not build responsive image derivatives after importing")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Processes used to build derivatives (default: CPU count)")
     args = parser.parse_args()
     run(dry_run=not args.apply, apply=args.apply,
-        force=args.force, set_brand_logos=args.set_brand_logos)
+        force=args.force, set_brand_logos=args.set_brand_logos,
+        derivatives=not args.no_derivatives, workers=args.workers)
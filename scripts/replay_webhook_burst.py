@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Replay a burst of PayPal webhook events against /paypal/webhook and report ingest latency.
+
+The events file is a JSON array or JSON-lines file of webhook bodies as PayPal sent them
+(e.g. exported from paypal_webhook_events.raw_event). Without --events a synthetic burst
+of PAYMENT.CAPTURE.* events is generated. --duplicates re-sends that fraction of events
+to exercise event_id deduplication, as PayPal does when it retries a delivery.
+
+Usage:
+  # 500 synthetic events, 32 concurrent senders, 10% redeliveries
+  python scripts/replay_webhook_burst.py --url http://localhost:5000/paypal/webhook -n 500 -c 32 --duplicates 0.1
+
+  # replay a recorded burst
+  python scripts/replay_webhook_burst.py --url http://localhost:5000/paypal/webhook --events burst.jsonl
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+_EVENT_TYPES = ("PAYMENT.CAPTURE.COMPLETED", "PAYMENT.CAPTURE.PENDING", "PAYMENT.CAPTURE.REFUNDED")
+
+
+def load_events(path):
+    with open(path, "r", encoding="utf-8") as fh:
+        text = fh.read().strip()
+    if text.startswith("["):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def synthetic_events(n):
+    events = []
+    for _ in range(n):
+        capture_id = uuid.uuid4().hex[:17].upper()
+        event_type = random.choice(_EVENT_TYPES)
+        resource = {"id": capture_id, "status": "COMPLETED",
+                    "amount": {"currency_code": "USD", "value": f"{random.uniform(10, 300):.2f}"}}
+        if event_type == "PAYMENT.CAPTURE.REFUNDED":
+            # refund resources point back at their capture
+            resource["id"] = uuid.uuid4().hex[:17].upper()
+            resource["links"] = [{"rel": "up", "href": f"https://api-m.paypal.com/v2/payments/captures/{capture_id}"}]
+        events.append({
+            "id": f"WH-{uuid.uuid4()}",
+            "event_type": event_type,
+            "resource_type": "refund" if event_type == "PAYMENT.CAPTURE.REFUNDED" else "capture",
+            "resource": resource,
+        })
+    return events
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--url", default="http://localhost:5000/paypal/webhook")
+    ap.add_argument("--events", help="JSON array / JSON-lines file of recorded webhook bodies")
+    ap.add_argument("-n", type=int, default=200, help="synthetic events when --events is not given")
+    ap.add_argument("-c", "--concurrency", type=int, default=16)
+    ap.add_argument("--duplicates", type=float, default=0.0, help="fraction of events to send twice")
+    args = ap.parse_args()
+
+    events = load_events(args.events) if args.events else synthetic_events(args.n)
+    sends = list(events) + random.sample(events, int(len(events) * args.duplicates))
+    random.shuffle(sends)
+
+    session = requests.Session()
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=args.concurrency))
+    session.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=args.concurrency))
+
+    def send(body):
+        started = time.perf_counter()
+        try:
+            r = session.post(args.url, json=body, timeout=30)
+            outcome = f"{r.status_code} {(r.json() or {}).get('status', '')}".strip()
+        except Exception as e:
+            outcome = type(e).__name__
+        return (time.perf_counter() - started) * 1000.0, outcome
+
+    wall = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(send, sends))
+    wall = time.perf_counter() - wall
+
+    latencies = sorted(ms for ms, _ in results)
+    outcomes = Counter(outcome for _, outcome in results)
+
+    def pct(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+
+    print(f"sent {len(sends)} deliveries ({len(events)} unique) in {wall:.2f}s "
+          f"-> {len(sends) / wall:.1f} req/s, concurrency {args.concurrency}")
+    print(f"latency ms: p50={pct(0.50):.1f} p95={pct(0.95):.1f} p99={pct(0.99):.1f} "
+          f"max={latencies[-1]:.1f} mean={statistics.mean(latencies):.1f}")
+    for outcome, count in outcomes.most_common():
+        print(f"  {outcome:24} {count}")
+
+
+if __name__ == "__main__":
+    main()
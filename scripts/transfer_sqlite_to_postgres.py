@@ -19,6 +19,7 @@ import os
 import sys
 import re
 import difflib
+from datetime import date
 from pathlib import Path
 from typing import Dict, Any
 
@@ -62,6 +63,15 @@ def normalize_for_match(s: str) -> str:
     return s2
 
 
+def _as_date(value):
+    """Coupon dates are Date columns; accept date objects or 'YYYY-MM-DD' strings ('' -> None)."""
+    if not value:
+        return None
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
 def collect_from_sqlite(sqlite_path: str) -> Dict[str, Any]:
     print(">>> collecting from sqlite:", sqlite_path)
     os.environ["DATABASE_URL"] = "sqlite:///" + sqlite_path.replace("\\", "/")
@@ -343,9 +353,9 @@ def upsert_to_postgres(data: Dict[str, Any], postgres_dsn: str):
                         "discount_type") or existing.discount_type
                     existing.discount_value = float(
                         c.get("discount_value") or existing.discount_value or 0)
-                    existing.start_date = c.get(
-                        "start_date") or existing.start_date
-                    existing.end_date = c.get("end_date") or existing.end_date
+                    existing.start_date = _as_date(
+                        c.get("start_date")) or existing.start_date
+                    existing.end_date = _as_date(c.get("end_date")) or existing.end_date
                     existing.active = bool(c.get("active"))
                     upd += 1
                 else:
@@ -354,8 +364,8 @@ def upsert_to_postgres(data: Dict[str, Any], postgres_dsn: str):
                         description=c.get("description"),
                         discount_type=c.get("discount_type"),
                         discount_value=float(c.get("discount_value") or 0),
-                        start_date=c.get("start_date") or "",
-                        end_date=c.get("end_date") or "",
+                        start_date=_as_date(c.get("start_date")),
+                        end_date=_as_date(c.get("end_date")),
                         active=bool(c.get("active"))
                     )
                     db.session.add(new)